@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark graph checkpoint bytes written per run, full snapshots against deltas.
+
+Replays every recorded session in the checkpoint store through a graph with
+the workflow's state and stages, each stage writing its recorded output and
+one log entry. Reports the bytes a full snapshot per checkpoint would write,
+the bytes written when only changed channels are stored, and the bytes
+written with list and dict deltas.
+
+Usage: python benchmark_checkpoints.py [checkpoint_dir]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from langgraph.checkpoint.base import get_checkpoint_metadata
+from langgraph.graph import StateGraph, END
+
+from src.workflow.checkpointer import SQLiteCheckpointSaver
+from src.workflow.state import AgentState
+from src.workflow.tracing import CheckpointStorage
+
+
+STAGES = [
+    ("reasoning", "problem_analysis"),
+    ("delegation", "task_delegation"),
+    ("xml_validation", "xml_validation"),
+    ("qa", "final_qa_report")
+]
+
+
+class MeteredSaver(SQLiteCheckpointSaver):
+    """Saver that also counts what storing every checkpoint in full would write."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.full_snapshot_bytes = 0
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self.full_snapshot_bytes += len(self.serde.dumps_typed(checkpoint)[1])
+        self.full_snapshot_bytes += len(self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))[1])
+        return super().put(config, checkpoint, metadata, new_versions)
+
+
+def build_graph(state):
+    """Graph whose stages write the recorded outputs of a session."""
+    logs = state.get("verbose_logs") or []
+    graph = StateGraph(AgentState)
+    previous = None
+    for index, (node, output_key) in enumerate(STAGES):
+        log = logs[index] if index < len(logs) else {"agent": node, "message": f"Completed {node}"}
+        update = {output_key: state.get(output_key) or "", "verbose_logs": [log]}
+        graph.add_node(node, lambda _, update=update: update)
+        if previous:
+            graph.add_edge(previous, node)
+        previous = node
+    graph.add_edge(previous, END)
+    graph.set_entry_point(STAGES[0][0])
+    return graph
+
+
+def initial_state(state):
+    """Initial state of a recorded session, with the request as the only message."""
+    messages = state.get("messages") or [""]
+    request = messages[0] if isinstance(messages[0], str) else getattr(messages[0], "content", "")
+    return {
+        "messages": [{"role": "user", "content": request}],
+        "summaries": {},
+        "task_results": {},
+        "human_review_required": False,
+        "human_feedback": "",
+        "verbose_logs": []
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("checkpoint_dir", nargs="?", default="./checkpoints")
+    args = parser.parse_args()
+
+    sessions = [
+        (session_id, data["state"])
+        for session_id, data in CheckpointStorage(args.checkpoint_dir).iter_checkpoints()
+        if data.get("state") and any(data["state"].get(key) for _, key in STAGES)
+    ]
+    if not sessions:
+        print(f"No recorded sessions found in {args.checkpoint_dir}")
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        changed = MeteredSaver(os.path.join(tmp_dir, "changed.sqlite"), keep_per_thread=0, max_delta_chain=0)
+        deltas = MeteredSaver(os.path.join(tmp_dir, "deltas.sqlite"), keep_per_thread=0)
+        elapsed = {}
+        for name, saver in (("changed", changed), ("deltas", deltas)):
+            started = time.perf_counter()
+            for session_id, state in sessions:
+                app = build_graph(state).compile(checkpointer=saver)
+                before = saver.get_stats()["bytes_written"]
+                app.invoke(initial_state(state), {"configurable": {"thread_id": session_id}})
+                if name == "deltas":
+                    print(f"  {session_id}  {saver.get_stats()['bytes_written'] - before:>8} bytes")
+            elapsed[name] = time.perf_counter() - started
+
+        writes = deltas.get_stats()["write_bytes"]
+        full = deltas.full_snapshot_bytes + writes
+        totals = {"changed": changed.get_stats()["bytes_written"], "deltas": deltas.get_stats()["bytes_written"]}
+        stats = deltas.get_stats()
+
+    runs = len(sessions)
+    print(f"\nRecorded sessions:       {runs}")
+    print(f"Full snapshots:          {full / runs:>10.0f} bytes per run")
+    print(f"Changed channels only:   {totals['changed'] / runs:>10.0f} bytes per run")
+    print(f"Changed channels+deltas: {totals['deltas'] / runs:>10.0f} bytes per run "
+          f"({totals['deltas'] / full:.0%} of full snapshots)")
+    print(f"Values stored:           {stats['full_values']} full, {stats['delta_values']} deltas")
+    print(f"Replay time:             {elapsed['changed'] / runs * 1000:.1f} ms per run changed-only, "
+          f"{elapsed['deltas'] / runs * 1000:.1f} ms per run with deltas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
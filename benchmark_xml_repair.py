@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark the deterministic XML repair engine over recorded agent outputs.
+
+Loads every agent output stored in the checkpoint store, reports how
+many are well-formed and schema-valid before and after repair, and measures
+repair throughput.
+
+Usage: python benchmark_xml_repair.py [checkpoint_dir] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.utils.xml_repair import repair_xml
+from src.utils.xml_schemas import OUTPUT_SCHEMAS, checkpoint_outputs, schema_registry
+from src.workflow.tracing import CheckpointStorage
+
+
+def load_corpus(checkpoint_dir):
+    """Collect (schema name, output) pairs from the checkpoint store, including legacy JSON files."""
+    corpus = []
+    for _, checkpoint_data in CheckpointStorage(checkpoint_dir).iter_checkpoints():
+        for output_key, text in checkpoint_outputs(checkpoint_data).items():
+            corpus.append((OUTPUT_SCHEMAS[output_key], text))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("checkpoint_dir", nargs="?", default="./checkpoints")
+    parser.add_argument("--repeat", type=int, default=200, help="repair passes over the corpus for timing")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.checkpoint_dir)
+    if not corpus:
+        print(f"No recorded outputs found in {args.checkpoint_dir}")
+        return 1
+
+    before = {"well_formed": 0, "valid": 0}
+    after = {"found": 0, "well_formed": 0, "valid": 0}
+    for name, text in corpus:
+        result = schema_registry.validate(name, text)
+        before["well_formed"] += result["well_formed"]
+        before["valid"] += result["valid"]
+
+        repaired = repair_xml(text, schema_registry.roots(name))
+        if repaired["xml"] is None:
+            continue
+        after["found"] += 1
+        result = schema_registry.validate(name, repaired["xml"])
+        after["well_formed"] += result["well_formed"]
+        after["valid"] += result["valid"]
+        print(f"  {name:<12} {len(text):>7} chars  repairs: {', '.join(repaired['repairs']) or '-'}")
+
+    total_chars = sum(len(text) for _, text in corpus)
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for name, text in corpus:
+            repair_xml(text, schema_registry.roots(name))
+    elapsed = time.perf_counter() - started
+
+    print(f"\nOutputs:            {len(corpus)} ({total_chars} chars)")
+    print(f"Well-formed:        {before['well_formed']} before, {after['well_formed']} after repair")
+    print(f"Schema-valid:       {before['valid']} before, {after['valid']} after repair")
+    print(f"Root element found: {after['found']}")
+    print(f"Repair time:        {elapsed / (args.repeat * len(corpus)) * 1000:.3f} ms per output, "
+          f"{total_chars * args.repeat / elapsed / 1_000_000:.1f} MB/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
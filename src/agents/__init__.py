@@ -3,5 +3,6 @@ from .reasoning_agent import SeniorReasoningAgent
 from .delegation_agent import TaskDelegationAgent
 from .xml_agent import XMLFormatterAgent
 from .qa_agent import QualityAssuranceAgent
+from .task_worker import TaskWorkerAgent
 
-__all__ = ["BaseAgent", "SeniorReasoningAgent", "TaskDelegationAgent", "XMLFormatterAgent", "QualityAssuranceAgent"]
\ No newline at end of file
+__all__ = ["BaseAgent", "SeniorReasoningAgent", "TaskDelegationAgent", "XMLFormatterAgent", "QualityAssuranceAgent", "TaskWorkerAgent"]
\ No newline at end of file
@@ -1,30 +1,100 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from contextlib import nullcontext
+from typing import Dict, Any, Optional, List, Callable, Tuple
 from langchain_core.messages import BaseMessage
+from lxml import etree
 import ollama
+import time
+
+from src.utils import create_verbose_log
+from src.utils.llm_cache import LLMCache, llm_cache
+from src.utils.ollama_router import OllamaHost, OllamaRouter, ollama_router
+from src.utils.model_scheduler import model_scheduler
+from src.utils.warmup import warmup_manager
+from src.utils.singleflight import llm_singleflight
+from src.utils.monitoring import performance_monitor, ollama_call_stats
+from src.utils.xml_summaries import output_summaries
+from src.utils.xml_stream import IncrementalXMLValidator, MalformedStreamError, stream_validation_stats
+from src.utils.xml_repair import repair_xml
+from src.utils.xml_schemas import OUTPUT_SCHEMAS, schema_registry
+from src.utils.debug_logger import debug_logger
+from src.config import settings
+
+
+# Markers of the thinking block that models like qwen3 write before their answer
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
 
 
 class BaseAgent(ABC):
     """Base class for all agents in the multi-agent system."""
     
-    def __init__(self, name: str, model: str, base_url: str = "http://localhost:11434"):
+    # State key that receives this agent's output
+    output_key: str = ""
+    # Short description of the agent's task used in verbose logs
+    task_label: str = ""
+    # Element whose closing tag ends the agent's output
+    closing_tag: str = ""
+    # Top-level elements of the agent's output, checked while streaming (defaults to the closing tag)
+    output_elements: Tuple[str, ...] = ()
+    # Schema the output is validated against before caching (defaults to the one for output_key)
+    output_schema: str = ""
+    # Generation options passed to Ollama, overridable per agent with AGENT_GENERATION_PROFILES
+    generation_options: Dict[str, Any] = {}
+    
+    def __init__(self, name: str, model: str, base_url: Optional[str] = None):
         self.name = name
         self.model = model
         self.base_url = base_url
-        self.client = ollama.Client(host=base_url)
+        # Agents pinned to a base URL talk to that host only, others share the configured hosts
+        self.router = OllamaRouter.from_urls([base_url]) if base_url else ollama_router
+        self.cache = llm_cache
+        self.in_flight = llm_singleflight if settings.COALESCE_IDENTICAL_REQUESTS else None
+        self.scheduler = model_scheduler if settings.MODEL_SCHEDULER_ENABLED else None
+        self.warmup = warmup_manager if settings.WARMUP_ENABLED else None
     
     @abstractmethod
     def get_system_prompt(self) -> str:
         """Return the system prompt for this agent."""
         pass
     
-    @abstractmethod
-    def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Process the current state and return updated state."""
-        pass
+    def build_prompt(self, state: Dict[str, Any]) -> str:
+        """Build the user prompt for this agent from the current state."""
+        raise NotImplementedError
+    
+    def process(self, state: Dict[str, Any], **llm_options) -> Dict[str, Any]:
+        """Process the current state and return updated state.
+        
+        Extra keyword arguments (e.g. ``stream`` and ``on_token``) are passed to ``call_llm``.
+        """
+        response = self.call_llm(self.build_prompt(state), self.get_system_prompt(), **llm_options)
+        return self.build_update(state, response)
+    
+    async def aprocess(self, state: Dict[str, Any], **llm_options) -> Dict[str, Any]:
+        """Asynchronously process the current state and return updated state."""
+        response = await self.acall_llm(self.build_prompt(state), self.get_system_prompt(), **llm_options)
+        return self.build_update(state, response)
+    
+    def build_update(self, state: Dict[str, Any], response: str) -> Dict[str, Any]:
+        """Build the state update for an LLM response."""
+        # Format the output
+        formatted_output = self.format_output(response)
+        
+        # Create verbose log
+        verbose_log = create_verbose_log(
+            self.name, 
+            f"Completed {self.task_label} with {len(formatted_output)} characters of output"
+        )
+        
+        # Return updated state, with the output parsed once for downstream consumers
+        return {
+            self.output_key: formatted_output,
+            "summaries": {self.output_key: output_summaries.summarize(self.output_key, formatted_output)},
+            "verbose_logs": [verbose_log]
+        }
     
-    def call_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        """Call the LLM with the given prompt."""
+    def _build_messages(self, prompt: str, system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        """Build the chat messages for a prompt."""
         messages = []
         
         if system_prompt:
@@ -38,15 +108,396 @@ class BaseAgent(ABC):
             'content': prompt
         })
         
-        response = self.client.chat(
+        return messages
+    
+    def call_llm(self, prompt: str, system_prompt: Optional[str] = None, stream: bool = False,
+                 on_token: Optional[Callable[[str], None]] = None, use_cache: bool = True,
+                 session_id: Optional[str] = None,
+                 on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """Call the LLM with the given prompt.
+        
+        With ``stream=True`` the response is generated incrementally and each
+        chunk of text is passed to ``on_token`` as soon as it arrives.
+        Identical requests are answered from the response cache unless
+        ``use_cache`` is False, and share the generation of an identical
+        request that is already in flight. Only complete responses that
+        pass (or can be repaired to pass) the output schema are cached. Token counts and timings are
+        recorded against ``session_id``.
+        
+        Streamed XML is parsed as it arrives. Each element completed under
+        a top-level element is passed to ``on_event`` as an ``element``
+        event; if the structure breaks, the generation is cancelled, a
+        ``retry`` event tells consumers to discard the streamed tokens and
+        the request is repeated with a corrective prompt.
+        """
+        messages = self._build_messages(prompt, system_prompt)
+        request_key = self._request_key(messages)
+        
+        if use_cache and self.cache:
+            cached = self.cache.get(request_key)
+            if cached is not None:
+                if on_token:
+                    on_token(cached)
+                return cached
+        
+        if self.in_flight:
+            # Attach to an identical generation that is already running
+            (content, complete), joined = self.in_flight.do(
+                request_key, self._chat, messages, stream, on_token, session_id, on_event
+            )
+            if joined and on_token:
+                on_token(content)
+        else:
+            content, complete = self._chat(messages, stream, on_token, session_id, on_event)
+        
+        if use_cache and self.cache and self._is_cacheable(content, complete):
+            self.cache.set(request_key, content)
+        return content
+    
+    async def acall_llm(self, prompt: str, system_prompt: Optional[str] = None, stream: bool = False,
+                        on_token: Optional[Callable[[str], None]] = None, use_cache: bool = True,
+                        session_id: Optional[str] = None,
+                        on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """Asynchronously call the LLM with the given prompt."""
+        messages = self._build_messages(prompt, system_prompt)
+        request_key = self._request_key(messages)
+        
+        if use_cache and self.cache:
+            cached = self.cache.get(request_key)
+            if cached is not None:
+                if on_token:
+                    on_token(cached)
+                return cached
+        
+        if self.in_flight:
+            # Attach to an identical generation that is already running
+            (content, complete), joined = await self.in_flight.ado(
+                request_key, self._achat, messages, stream, on_token, session_id, on_event
+            )
+            if joined and on_token:
+                on_token(content)
+        else:
+            content, complete = await self._achat(messages, stream, on_token, session_id, on_event)
+        
+        if use_cache and self.cache and self._is_cacheable(content, complete):
+            self.cache.set(request_key, content)
+        return content
+    
+    def _is_cacheable(self, content: str, complete: bool) -> bool:
+        """Whether a response may be replayed from the cache: complete and valid against the output schema."""
+        if not complete:
+            return False
+        schema = self.output_schema or OUTPUT_SCHEMAS.get(self.output_key)
+        if not schema:
+            return True
+        _, errors = schema_registry.parse_and_validate(schema, content)
+        if not errors:
+            return True
+        repaired = repair_xml(content, self._stream_roots() or None)
+        return repaired["xml"] is not None and not schema_registry.parse_and_validate(schema, repaired["xml"])[1]
+    
+    def _request_key(self, messages: List[Dict[str, str]]) -> str:
+        """Content address of a chat request, shared by the cache and request coalescing."""
+        return LLMCache.make_key(self.model, messages, self.generation_profile())
+    
+    def _chat(self, messages: List[Dict[str, str]], stream: bool,
+              on_token: Optional[Callable[[str], None]], session_id: Optional[str] = None,
+              on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[str, bool]:
+        """Send a chat request to the least loaded Ollama host once the model is scheduled there.
+        
+        Returns the output and whether it is complete: not cut off by the
+        token budget and, when streamed, well-formed.
+        """
+        retries = self._stream_retries(stream)
+        for attempt in range(retries + 1):
+            validator = self._stream_validator(stream, attempt < retries, on_event)
+            try:
+                return self.router.call(
+                    self.model,
+                    lambda host: self._chat_on_host(host, messages, stream, on_token, session_id, validator)
+                )
+            except MalformedStreamError as e:
+                messages = self._corrective_messages(messages, e, attempt, on_event)
+    
+    async def _achat(self, messages: List[Dict[str, str]], stream: bool,
+                     on_token: Optional[Callable[[str], None]], session_id: Optional[str] = None,
+                     on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[str, bool]:
+        """Asynchronously send a chat request to the least loaded Ollama host once the model is scheduled there."""
+        retries = self._stream_retries(stream)
+        for attempt in range(retries + 1):
+            validator = self._stream_validator(stream, attempt < retries, on_event)
+            try:
+                return await self.router.acall(
+                    self.model,
+                    lambda host: self._achat_on_host(host, messages, stream, on_token, session_id, validator)
+                )
+            except MalformedStreamError as e:
+                messages = self._corrective_messages(messages, e, attempt, on_event)
+    
+    def _stream_roots(self) -> Tuple[str, ...]:
+        """Top-level elements expected in the agent's output."""
+        return self.output_elements or ((self.closing_tag,) if self.closing_tag else ())
+    
+    def _stream_retries(self, stream: bool) -> int:
+        """How many times a malformed stream is cancelled and requested again."""
+        if not stream or not settings.STREAM_XML_VALIDATION or not self._stream_roots():
+            return 0
+        return settings.STREAM_XML_MAX_RETRIES
+    
+    def _stream_validator(self, stream: bool, strict: bool,
+                          on_event: Optional[Callable[[Dict[str, Any]], None]]) -> Optional[IncrementalXMLValidator]:
+        """Incremental parser for one streamed attempt; the last attempt only reports elements."""
+        if not stream or not settings.STREAM_XML_VALIDATION or not self._stream_roots():
+            return None
+        
+        def on_element(element: etree._Element) -> None:
+            if on_event:
+                on_event({
+                    "type": "element",
+                    "tag": element.tag,
+                    "xml": etree.tostring(element, encoding="unicode").strip()
+                })
+        
+        return IncrementalXMLValidator(self._stream_roots(), on_element, strict=strict)
+    
+    def _corrective_messages(self, messages: List[Dict[str, str]], error: MalformedStreamError, attempt: int,
+                             on_event: Optional[Callable[[Dict[str, Any]], None]]) -> List[Dict[str, str]]:
+        """Record a cancelled stream and build the retry request that points out the problem."""
+        stream_validation_stats.record(self.name, "retried")
+        debug_logger.log("WARNING", self.name, "Cancelled a malformed stream", {"reason": error.reason, "attempt": attempt + 1})
+        if on_event:
+            on_event({"type": "retry", "attempt": attempt + 1, "reason": error.reason})
+        return messages + [
+            {'role': 'assistant', 'content': error.partial},
+            {'role': 'user', 'content': (
+                f"Your response was not well-formed XML ({error.reason}). Start over and reply with "
+                f"well-formed XML only, beginning with <{self._stream_roots()[0]}>. Close every tag you open "
+                f"and escape & and < in text as &amp; and &lt;."
+            )}
+        ]
+    
+    def _chat_on_host(self, host: OllamaHost, messages: List[Dict[str, str]], stream: bool,
+                      on_token: Optional[Callable[[str], None]], session_id: Optional[str] = None,
+                      validator: Optional[IncrementalXMLValidator] = None) -> Tuple[str, bool]:
+        """Send a chat request to an Ollama host once the model is scheduled on it."""
+        with self.scheduler.slot(self.model, host.base_url) if self.scheduler else nullcontext():
+            return self._send_chat(host, messages, stream, on_token, session_id, validator)
+    
+    def _send_chat(self, host: OllamaHost, messages: List[Dict[str, str]], stream: bool,
+                   on_token: Optional[Callable[[str], None]], session_id: Optional[str] = None,
+                   validator: Optional[IncrementalXMLValidator] = None) -> Tuple[str, bool]:
+        """Send a chat request to an Ollama host; returns the output and whether it is complete."""
+        started = time.perf_counter()
+        if not stream:
+            response = host.client.chat(model=self.model, messages=messages, **self._chat_options())
+            self._record_call(host, response, started, None, session_id)
+            done_reason = response.get('done_reason')
+            return self._finish_output(response['message']['content'], done_reason), done_reason != "length"
+        
+        content = []
+        tail = ""
+        thinking = False
+        first_token_at = None
+        final_chunk = {}
+        answered = False
+        chunks = host.client.chat(model=self.model, messages=messages, stream=True, **self._chat_options())
+        for chunk in chunks:
+            token = chunk['message']['content']
+            if token and not answered:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                token, answered, thinking = self._clip_at_closing_tag(tail, token, thinking)
+                tail = (tail + token)[-max(len(self.closing_tag) + 3, len(THINK_CLOSE)):]
+                content.append(token)
+                if on_token and token:
+                    on_token(token)
+                if validator:
+                    try:
+                        validator.feed(token)
+                    except MalformedStreamError as e:
+                        # Cancel the generation rather than wait for output that cannot be used
+                        chunks.close()
+                        e.partial = "".join(content)
+                        raise
+            if chunk.get('done'):
+                final_chunk = chunk
+            # Once the closing tag is in, the rest of the stream is only read for
+            # the final chunk's token counts and timings
+        
+        self._record_call(host, final_chunk, started, first_token_at, session_id)
+        well_formed = validator is None or not (validator.error or not validator.started)
+        if validator:
+            stream_validation_stats.record(self.name, "passed" if well_formed else "failed")
+        # Text generated after the closing tag does not make a complete output incomplete
+        done_reason = "stop" if answered else final_chunk.get('done_reason')
+        return self._finish_stream(content, done_reason, on_token), well_formed and done_reason != "length"
+    
+    async def _achat_on_host(self, host: OllamaHost, messages: List[Dict[str, str]], stream: bool,
+                             on_token: Optional[Callable[[str], None]], session_id: Optional[str] = None,
+                             validator: Optional[IncrementalXMLValidator] = None) -> Tuple[str, bool]:
+        """Asynchronously send a chat request to an Ollama host once the model is scheduled on it."""
+        async with self.scheduler.aslot(self.model, host.base_url) if self.scheduler else nullcontext():
+            return await self._asend_chat(host, messages, stream, on_token, session_id, validator)
+    
+    async def _asend_chat(self, host: OllamaHost, messages: List[Dict[str, str]], stream: bool,
+                          on_token: Optional[Callable[[str], None]], session_id: Optional[str] = None,
+                          validator: Optional[IncrementalXMLValidator] = None) -> Tuple[str, bool]:
+        """Asynchronously send a chat request to an Ollama host; returns the output and whether it is complete."""
+        started = time.perf_counter()
+        if not stream:
+            response = await host.async_client.chat(model=self.model, messages=messages, **self._chat_options())
+            self._record_call(host, response, started, None, session_id)
+            done_reason = response.get('done_reason')
+            return self._finish_output(response['message']['content'], done_reason), done_reason != "length"
+        
+        content = []
+        tail = ""
+        thinking = False
+        first_token_at = None
+        final_chunk = {}
+        answered = False
+        chunks = await host.async_client.chat(model=self.model, messages=messages, stream=True, **self._chat_options())
+        async for chunk in chunks:
+            token = chunk['message']['content']
+            if token and not answered:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                token, answered, thinking = self._clip_at_closing_tag(tail, token, thinking)
+                tail = (tail + token)[-max(len(self.closing_tag) + 3, len(THINK_CLOSE)):]
+                content.append(token)
+                if on_token and token:
+                    on_token(token)
+                if validator:
+                    try:
+                        validator.feed(token)
+                    except MalformedStreamError as e:
+                        # Cancel the generation rather than wait for output that cannot be used
+                        await chunks.aclose()
+                        e.partial = "".join(content)
+                        raise
+            if chunk.get('done'):
+                final_chunk = chunk
+            # Once the closing tag is in, the rest of the stream is only read for
+            # the final chunk's token counts and timings
+        
+        self._record_call(host, final_chunk, started, first_token_at, session_id)
+        well_formed = validator is None or not (validator.error or not validator.started)
+        if validator:
+            stream_validation_stats.record(self.name, "passed" if well_formed else "failed")
+        # Text generated after the closing tag does not make a complete output incomplete
+        done_reason = "stop" if answered else final_chunk.get('done_reason')
+        return self._finish_stream(content, done_reason, on_token), well_formed and done_reason != "length"
+    
+    def generation_profile(self) -> Dict[str, Any]:
+        """Ollama generation options for this agent: budget, sampling, context and stop sequence.
+        
+        Thinking models get no stop sequence, since their thinking may quote
+        the closing tag; streamed output is still cut at the real one.
+        """
+        options = {"num_ctx": settings.LLM_NUM_CTX, **self.generation_options}
+        options.update(settings.AGENT_GENERATION_PROFILES.get(self.output_key, {}))
+        if self.closing_tag and not self.is_thinking_model():
+            options.setdefault("stop", [f"</{self.closing_tag}>"])
+        return options
+    
+    def is_thinking_model(self) -> bool:
+        """Whether the model writes a ``<think>`` block before its answer."""
+        family = self.model.split(":")[0]
+        return family in [name.strip() for name in settings.LLM_THINKING_MODELS.split(",") if name.strip()]
+    
+    def _chat_options(self) -> Dict[str, Any]:
+        """Extra chat request options: the generation profile and how long to keep the model loaded."""
+        chat_options = {"options": self.generation_profile()}
+        if self.warmup:
+            # Decided by the traffic before this call, which only then counts as use
+            chat_options["keep_alive"] = self.warmup.keep_alive_for(self.model)
+            self.warmup.record_use(self.model)
+        return chat_options
+    
+    def _clip_at_closing_tag(self, tail: str, token: str, thinking: bool = False) -> Tuple[str, bool, bool]:
+        """Cut a streamed token just after the closing tag, if the token completes it outside thinking.
+        
+        ``tail`` is the end of the text streamed so far, long enough to hold
+        all but the last character of the tag. Returns the token, whether the
+        output is complete and whether the model is still in a ``<think>``
+        block, which often quotes the tags it is about to write.
+        """
+        if not self.closing_tag:
+            return token, False, thinking
+        tag = f"</{self.closing_tag}>"
+        text = tail + token
+        position = 0
+        while True:
+            # Only markers that end in the new token, the ones in the tail were seen before
+            found = [
+                (index, marker) for marker in ((THINK_CLOSE,) if thinking else (THINK_OPEN, tag))
+                for index in (text.find(marker, max(position, len(tail) - len(marker) + 1)),) if index != -1
+            ]
+            if not found:
+                return token, False, thinking
+            index, marker = min(found)
+            if marker == tag:
+                return token[:index + len(tag) - len(tail)], True, False
+            thinking = marker == THINK_OPEN
+            position = index + len(marker)
+    
+    def _answer_start(self, content: str) -> Optional[int]:
+        """Index where the answer starts after the model's thinking, or None while it is still thinking."""
+        think_end = content.rfind(THINK_CLOSE)
+        if content.find(THINK_OPEN, think_end + 1 if think_end != -1 else 0) != -1:
+            return None
+        return think_end + len(THINK_CLOSE) if think_end != -1 else 0
+    
+    def _finish_output(self, content: str, done_reason: Optional[str]) -> str:
+        """Restore the closing tag that the stop sequence removed from a complete output."""
+        if not self.closing_tag:
+            return content
+        start = self._answer_start(content)
+        if start is None:
+            return content
+        tag = f"</{self.closing_tag}>"
+        index = content.find(tag, start)
+        if index != -1:
+            return content[:index + len(tag)]
+        if done_reason == "stop" and f"<{self.closing_tag}" in content[start:]:
+            return content + tag
+        return content
+    
+    def _finish_stream(self, content: List[str], done_reason: Optional[str],
+                       on_token: Optional[Callable[[str], None]]) -> str:
+        """Join streamed tokens, forwarding a restored closing tag to ``on_token``."""
+        streamed = "".join(content)
+        finished = self._finish_output(streamed, done_reason)
+        if on_token and len(finished) > len(streamed):
+            on_token(finished[len(streamed):])
+        return finished
+    
+    def _record_call(self, host: OllamaHost, response: Dict[str, Any], started: float,
+                     first_token_at: Optional[float], session_id: Optional[str]) -> None:
+        """Record the token counts and timings Ollama reports with the final response."""
+        stats = ollama_call_stats(response)
+        duration = time.perf_counter() - started
+        stats.update(
+            agent=self.name,
             model=self.model,
-            messages=messages
+            host=host.base_url,
+            session=session_id,
+            duration=duration,
+            # Without streaming the first token is only seen with the whole response,
+            # so use the server-side time spent before generation started
+            time_to_first_token=(
+                first_token_at - started if first_token_at is not None
+                else stats["load_time"] + stats["prompt_eval_time"]
+            )
         )
         
-        return response['message']['content']
+        performance_monitor.record_llm_call(stats)
+        debug_logger.log_ollama_interaction(self.model, f"chat ({self.name})", duration, stats)
+        if self.scheduler:
+            self.scheduler.record_load(self.model, stats["load_time"])
     
     def format_output(self, content: str) -> str:
         """Format the output content."""
         # For now, just return the content as is
         # In the future, we might add formatting or validation
-        return content
\ No newline at end of file
+        return content
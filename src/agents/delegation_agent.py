@@ -1,12 +1,16 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base import BaseAgent
-from src.utils import create_verbose_log
 
 
 class TaskDelegationAgent(BaseAgent):
     """Task Delegation Specialist that creates detailed XML-formatted task delegation plans."""
     
-    def __init__(self, model: str, base_url: str = "http://localhost:11434"):
+    output_key = "task_delegation"
+    task_label = "task delegation"
+    closing_tag = "delegation"
+    generation_options = {"num_predict": 2048, "temperature": 0.3}
+    
+    def __init__(self, model: str, base_url: Optional[str] = None):
         super().__init__("Task Delegation Specialist", model, base_url)
     
     def get_system_prompt(self) -> str:
@@ -35,34 +39,15 @@ class TaskDelegationAgent(BaseAgent):
 
 Ensure all tasks are properly sequenced and dependencies are correctly identified."""
     
-    def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Process the task delegation task."""
+    def build_prompt(self, state: Dict[str, Any]) -> str:
+        """Build the prompt for the task delegation task."""
         # Get the problem analysis
         problem_analysis = state.get("problem_analysis", "")
         
-        # Create the prompt for the LLM
-        prompt = f"""Based on the following problem analysis, create a detailed task delegation plan with XML formatting:
+        return f"""Based on the following problem analysis, create a detailed task delegation plan with XML formatting:
 
 <problem_analysis>
 {problem_analysis}
 </problem_analysis>
 
-Assign specific subtasks to appropriate agents based on complexity, domain expertise, and model capabilities. Define clear input requirements, output specifications, validation rules, and dependencies for each task."""
-
-        # Call the LLM
-        response = self.call_llm(prompt, self.get_system_prompt())
-        
-        # Format the output
-        formatted_output = self.format_output(response)
-        
-        # Create verbose log
-        verbose_log = create_verbose_log(
-            self.name, 
-            f"Completed task delegation with {len(formatted_output)} characters of output"
-        )
-        
-        # Return updated state
-        return {
-            "task_delegation": formatted_output,
-            "verbose_logs": state.get("verbose_logs", []) + [verbose_log]
-        }
\ No newline at end of file
+Assign specific subtasks to appropriate agents based on complexity, domain expertise, and model capabilities. Define clear input requirements, output specifications, validation rules, and dependencies for each task."""
\ No newline at end of file
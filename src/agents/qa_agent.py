@@ -1,12 +1,18 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base import BaseAgent
-from src.utils import create_verbose_log
+from src.utils.xml_repair import repair_xml
 
 
 class QualityAssuranceAgent(BaseAgent):
     """Quality Assurance Specialist that verifies the accuracy, completeness, and quality of all outputs."""
     
-    def __init__(self, model: str, base_url: str = "http://localhost:11434"):
+    output_key = "final_qa_report"
+    task_label = "quality assurance"
+    closing_tag = "qa_report"
+    # qwen3 thinks before writing the report, so the budget covers both
+    generation_options = {"num_predict": 3072, "temperature": 0.2}
+    
+    def __init__(self, model: str, base_url: Optional[str] = None):
         super().__init__("Quality Assurance Specialist", model, base_url)
     
     def get_system_prompt(self) -> str:
@@ -54,34 +60,26 @@ class QualityAssuranceAgent(BaseAgent):
   </approval>
 </qa_report>"""
     
-    def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Process the quality assurance task."""
-        # Get the XML validation
+    def build_prompt(self, state: Dict[str, Any]) -> str:
+        """Build the prompt for the quality assurance task."""
+        # Get the XML validation, with mechanical defects already repaired
         xml_validation = state.get("xml_validation", "")
+        repaired = repair_xml(xml_validation, ["validation"])
+        if repaired["xml"] is not None:
+            xml_validation = repaired["xml"]
+        
+        # Results of the delegated tasks, when the plan was carried out
+        task_results = "\n".join(
+            f"<task_result id=\"{task_id}\" status=\"{result.get('status')}\" valid=\"{str(result.get('valid')).lower()}\">"
+            f"\n{result.get('output') or ''}\n</task_result>"
+            for task_id, result in (state.get("task_results") or {}).items()
+        )
+        task_results = f"\n\n<task_results>\n{task_results}\n</task_results>" if task_results else ""
         
-        # Create the prompt for the LLM
-        prompt = f"""Perform comprehensive quality assurance on the following XML validation output:
+        return f"""Perform comprehensive quality assurance on the following XML validation output:
 
 <xml_validation>
 {xml_validation}
-</xml_validation>
-
-Verify accuracy, completeness, consistency, and adherence to requirements. Provide detailed feedback and final approval status."""
+</xml_validation>{task_results}
 
-        # Call the LLM
-        response = self.call_llm(prompt, self.get_system_prompt())
-        
-        # Format the output
-        formatted_output = self.format_output(response)
-        
-        # Create verbose log
-        verbose_log = create_verbose_log(
-            self.name, 
-            f"Completed quality assurance with {len(formatted_output)} characters of output"
-        )
-        
-        # Return updated state
-        return {
-            "final_qa_report": formatted_output,
-            "verbose_logs": state.get("verbose_logs", []) + [verbose_log]
-        }
\ No newline at end of file
+Verify accuracy, completeness, consistency, and adherence to requirements. Provide detailed feedback and final approval status."""
\ No newline at end of file
@@ -1,12 +1,18 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base import BaseAgent
-from src.utils import create_verbose_log
 
 
 class SeniorReasoningAgent(BaseAgent):
     """Senior Reasoning Agent that breaks down complex problems into step-by-step reasoning processes."""
     
-    def __init__(self, model: str, base_url: str = "http://localhost:11434"):
+    output_key = "problem_analysis"
+    task_label = "problem analysis"
+    closing_tag = "conclusion"
+    output_elements = ("reasoning", "variables", "conclusion")
+    # Leaves room for qwen3's thinking ahead of the answer
+    generation_options = {"num_predict": 4096, "temperature": 0.6}
+    
+    def __init__(self, model: str, base_url: Optional[str] = None):
         super().__init__("Senior Reasoning Agent", model, base_url)
     
     def get_system_prompt(self) -> str:
@@ -35,32 +41,13 @@ class SeniorReasoningAgent(BaseAgent):
 
 Ensure all XML is properly nested and validated."""
     
-    def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Process the problem analysis task."""
+    def build_prompt(self, state: Dict[str, Any]) -> str:
+        """Build the prompt for the problem analysis task."""
         # Get the user input
         user_input = state.get("messages", [""])[-1] if state.get("messages") else ""
         
-        # Create the prompt for the LLM
-        prompt = f"""Analyze the following problem in detail and break it down into explicit step-by-step reasoning processes:
+        return f"""Analyze the following problem in detail and break it down into explicit step-by-step reasoning processes:
 
 {user_input}
 
-Provide a comprehensive reasoning structure with input requirements and expected outputs for each step. Use the XML format specified in your system prompt."""
-
-        # Call the LLM
-        response = self.call_llm(prompt, self.get_system_prompt())
-        
-        # Format the output
-        formatted_output = self.format_output(response)
-        
-        # Create verbose log
-        verbose_log = create_verbose_log(
-            self.name, 
-            f"Completed problem analysis with {len(formatted_output)} characters of output"
-        )
-        
-        # Return updated state
-        return {
-            "problem_analysis": formatted_output,
-            "verbose_logs": state.get("verbose_logs", []) + [verbose_log]
-        }
\ No newline at end of file
+Provide a comprehensive reasoning structure with input requirements and expected outputs for each step. Use the XML format specified in your system prompt."""
\ No newline at end of file
@@ -0,0 +1,81 @@
+from typing import Dict, Any, Optional
+from .base import BaseAgent
+from src.utils import create_verbose_log
+from src.utils.xml_repair import repair_xml
+from src.utils.xml_schemas import schema_registry
+
+
+class TaskWorkerAgent(BaseAgent):
+    """Task Worker that carries out a single task from the delegation plan."""
+    
+    output_key = "task_results"
+    task_label = "delegated task"
+    closing_tag = "task_result"
+    output_schema = "task_result"
+    generation_options = {"num_predict": 1024, "temperature": 0.3}
+    
+    def __init__(self, model: str, base_url: Optional[str] = None):
+        super().__init__("Task Worker", model, base_url)
+    
+    def get_system_prompt(self) -> str:
+        return """You are a Task Worker. You carry out one task from a delegation plan and report the result using XML:
+
+<task_result id="[task id]">
+  <status>completed|blocked</status>
+  <output>[the work product for this task]</output>
+  <notes>[assumptions, open questions or reasons the task is blocked]</notes>
+</task_result>
+
+Use the results of the tasks this one depends on. Do only this task."""
+    
+    def build_prompt(self, state: Dict[str, Any]) -> str:
+        """Build the prompt for one task, with the request and the results of its dependencies."""
+        task = state["task"]
+        requirements = "\n".join(f"- {requirement}" for requirement in task.get("requirements", []))
+        dependency_results = "\n\n".join(
+            f"<task_result id=\"{task_id}\">{result.get('output') or ''}</task_result>"
+            for task_id, result in state.get("dependency_results", {}).items()
+        )
+        
+        return f"""Original request:
+{state.get("request", "")}
+
+Task {task["id"]}: {task.get("title") or ""}
+{task.get("description") or ""}
+
+Input requirements:
+{requirements or "- none"}
+
+Results of the tasks this one depends on:
+{dependency_results or "none"}
+
+Carry out the task and report its result."""
+    
+    def build_update(self, state: Dict[str, Any], response: str) -> Dict[str, Any]:
+        """Validate the task result and add it to the joined results."""
+        task_id = state["task"]["id"]
+        root, errors = schema_registry.parse_and_validate("task_result", response)
+        if errors:
+            repaired = repair_xml(response, ["task_result"])
+            if repaired["xml"] is not None:
+                repaired_root, repaired_errors = schema_registry.parse_and_validate("task_result", repaired["xml"])
+                if repaired_root is not None and (root is None or not repaired_errors):
+                    root, errors, response = repaired_root, repaired_errors, repaired["xml"]
+        
+        status = (root.findtext("status") or "").strip() if root is not None else ""
+        output = root.find("output") if root is not None else None
+        output = "".join(output.itertext()).strip() if output is not None else response
+        
+        verbose_log = create_verbose_log(self.name, f"Completed task {task_id} ({status or 'unparsed'})")
+        return {
+            "task_results": {
+                task_id: {
+                    "title": state["task"].get("title"),
+                    "status": status or "completed",
+                    "valid": not errors,
+                    "output": output,
+                    "raw": response
+                }
+            },
+            "verbose_logs": [verbose_log]
+        }
@@ -2,26 +2,65 @@ from fastapi import FastAPI, HTTPException, BackgroundTasks, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
-from typing import Dict, Any, Optional, List, AsyncGenerator
+from typing import Dict, Any, Optional, List, AsyncGenerator, Tuple, Union
+from contextlib import asynccontextmanager
 import asyncio
 import uuid
 import json
 import time
 
-from src.workflow import WorkflowEngine
+from src.workflow import WorkflowEngine, WorkflowExecutor, RetentionService, checkpoint_storage, checkpoint_writer
 from src.utils import (
+    event_broker,
+    llm_cache,
+    llm_singleflight,
+    workflow_singleflight,
+    ollama_clients,
+    ollama_client,
+    ollama_router,
+    model_scheduler,
+    warmup_manager,
     ollama_monitor, 
     security_manager, 
     access_control,
     performance_monitor,
     analytics_engine,
     data_exporter,
-    report_generator
+    report_generator,
+    schema_registry,
+    stream_validation_stats,
+    output_summaries
 )
+from src.utils.events import END_OF_STREAM, SUBSCRIBER_LAGGED, ReplayGap
 from src.utils.debug_logger import debug_logger, log_debug, log_workflow_step, Timer
 from src.config import settings
 
-app = FastAPI(title="Multi-Agent Prompt Engine API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background services with the API."""
+    ollama_client.start_health_probe()
+    ollama_router.start_inventory_refresh()
+    if settings.WARMUP_ENABLED:
+        # Preload models in the background so the first request skips the load
+        warmup_manager.start()
+    if settings.RETENTION_ENABLED:
+        # Expire old checkpoints and logs now and then every interval
+        retention_service.start()
+    yield
+    retention_service.stop()
+    warmup_manager.stop()
+    ollama_router.stop_inventory_refresh()
+    ollama_client.stop_health_probe()
+    # Let in-flight workflow runs finish before exiting
+    workflow_executor.shutdown(wait=True)
+    # Write the checkpoints still queued by finished runs
+    await asyncio.to_thread(checkpoint_writer.stop)
+    await ollama_clients.aclose()
+    ollama_clients.close()
+
+
+app = FastAPI(title="Multi-Agent Prompt Engine API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -35,16 +74,20 @@ app.add_middleware(
 # Global workflow engine instance
 workflow_engine = WorkflowEngine()
 
+# Bounded worker pool that keeps blocking workflow runs off the event loop
+workflow_executor = WorkflowExecutor(workflow_engine)
+
+# Garbage collection of checkpoints, graph state and logs
+retention_service = RetentionService(checkpointer=workflow_engine.checkpointer)
+
 # Store for active sessions
 active_sessions = {}
 
-# Store for SSE connections
-sse_connections = {}
-
 
 class PromptRequest(BaseModel):
     prompt: str
     session_id: Optional[str] = None
+    bypass_cache: bool = False
 
 
 class FeedbackRequest(BaseModel):
@@ -57,6 +100,7 @@ class SessionStatus(BaseModel):
     status: str
     result: Optional[Dict[str, Any]] = None
     logs: List[Dict[str, Any]] = []
+    llm_metrics: Optional[Dict[str, Any]] = None
 
 
 class AuthRequest(BaseModel):
@@ -90,6 +134,8 @@ async def health_check():
     return {
         "status": "healthy" if server_status else "unhealthy",
         "ollama_server": "running" if server_status else "not running",
+        "ollama_connection": ollama_client.get_status(),
+        "model_status": warmup_manager.get_status(),
         "models": ollama_monitor.client.list_models(),
         "system_metrics": system_metrics,
         "ollama_metrics": ollama_metrics
@@ -130,6 +176,10 @@ async def process_prompt(
         if not access_control.check_permission(authorization, "execute_workflows"):
             raise HTTPException(status_code=403, detail="Insufficient permissions")
     
+    # Reject early if the workflow queue is saturated
+    if not workflow_executor.has_capacity():
+        raise HTTPException(status_code=503, detail="Workflow queue is full, please retry later")
+    
     # Generate session ID if not provided
     session_id = request.session_id or str(uuid.uuid4())
     
@@ -141,8 +191,9 @@ async def process_prompt(
         "last_updated": time.time()
     }
     
-    # Initialize SSE connections for this session
-    sse_connections[session_id] = []
+    # Open the event channel that SSE clients subscribe to
+    event_broker.open(session_id)
+    event_broker.publish(session_id, {"type": "status", "status": "processing"})
     
     # Log the prompt processing event
     user_id = "anonymous"
@@ -158,7 +209,7 @@ async def process_prompt(
     )
     
     # Run workflow in background
-    background_tasks.add_task(run_workflow, session_id, request.prompt, user_id)
+    background_tasks.add_task(run_workflow, session_id, request.prompt, user_id, request.bypass_cache)
     
     return SessionStatus(
         session_id=session_id,
@@ -189,7 +240,8 @@ async def get_session_status(
         session_id=session_id,
         status=session["status"],
         result=session["result"],
-        logs=session["logs"]
+        logs=session["logs"],
+        llm_metrics=performance_monitor.get_session_llm_metrics(session_id)
     )
 
 
@@ -242,9 +294,16 @@ async def list_models():
 @app.get("/stream-workflow/{session_id}")
 async def stream_workflow(
     session_id: str,
-    authorization: Optional[str] = Header(None)
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None)
 ):
-    """Stream workflow updates using Server-Sent Events."""
+    """Stream workflow updates using Server-Sent Events.
+    
+    Clients that reconnect with a Last-Event-ID header resume from the
+    session's replay buffer. If events they missed have already left the
+    buffer, a ``reset`` event comes first so they can reload the session
+    instead of continuing from an incomplete stream.
+    """
     # Check authentication if provided
     if authorization:
         session = security_manager.validate_session(authorization)
@@ -257,41 +316,56 @@ async def stream_workflow(
     if session_id not in active_sessions:
         raise HTTPException(status_code=404, detail="Session not found")
     
+    try:
+        resume_from = int(last_event_id) if last_event_id else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID header")
+    
     async def event_generator() -> AsyncGenerator[str, None]:
-        # Keep track of last sent log index
-        last_log_index = 0
+        subscription = event_broker.subscribe(session_id, resume_from)
         
-        while True:
-            # Check if session still exists
-            if session_id not in active_sessions:
-                break
+        # The channel has already been retired, send the stored outcome
+        if subscription is None:
+            session = active_sessions.get(session_id, {})
+            final_data = {
+                "type": "final",
+                "status": session.get("status"),
+                "result": session.get("result"),
+                "final": True
+            }
+            yield f"data: {json.dumps(final_data, default=str)}\n\n"
+            return
+        
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), timeout=settings.SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Comment lines keep proxies from closing idle connections
+                    yield ": keepalive\n\n"
+                    continue
                 
-            session = active_sessions[session_id]
-            
-            # Send new logs
-            logs = session.get("logs", [])
-            if len(logs) > last_log_index:
-                for i in range(last_log_index, len(logs)):
-                    log_entry = logs[i]
-                    data = {
-                        "status": session["status"],
-                        "log": log_entry
+                if item is END_OF_STREAM:
+                    break
+                if item is SUBSCRIBER_LAGGED:
+                    # Ask the client to reconnect and resume from its last event ID
+                    yield "retry: 1000\n\n"
+                    break
+                if isinstance(item, ReplayGap):
+                    reset = {
+                        "type": "reset",
+                        "session_id": session_id,
+                        "status": active_sessions.get(session_id, {}).get("status"),
+                        "first_missed": item.first_missed,
+                        "first_available": item.first_available
                     }
-                    yield f"data: {json.dumps(data)}\n\n"
-                last_log_index = len(logs)
-            
-            # If workflow is completed, send final update and break
-            if session["status"] in ["completed", "error", "feedback_received"]:
-                final_data = {
-                    "status": session["status"],
-                    "result": session.get("result"),
-                    "final": True
-                }
-                yield f"data: {json.dumps(final_data)}\n\n"
-                break
-            
-            # Wait before checking again
-            await asyncio.sleep(1)
+                    yield f"event: reset\ndata: {json.dumps(reset, default=str)}\n\n"
+                    continue
+                
+                event_id, event = item
+                yield f"id: {event_id}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            event_broker.unsubscribe(subscription)
     
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -304,7 +378,23 @@ async def get_performance_metrics():
     
     return {
         "system": system_metrics,
-        "ollama": ollama_metrics
+        "ollama": ollama_metrics,
+        "llm_calls": performance_monitor.get_llm_metrics(),
+        "executor": workflow_executor.get_metrics(),
+        "xml_fast_path": workflow_engine.xml_agent.get_fast_path_metrics(),
+        "stream_validation": stream_validation_stats.get_metrics(),
+        "output_summaries": output_summaries.get_metrics(),
+        "checkpoint_writer": checkpoint_writer.get_metrics(),
+        "retention": retention_service.get_metrics(),
+        "llm_cache": llm_cache.get_metrics() if llm_cache else {"enabled": False},
+        "ollama_clients": ollama_clients.get_metrics(),
+        "ollama_hosts": ollama_router.get_metrics(),
+        "model_scheduler": model_scheduler.get_metrics(),
+        "warmup": warmup_manager.get_metrics(),
+        "coalescing": {
+            "llm_calls": llm_singleflight.get_metrics(),
+            "workflow_runs": workflow_singleflight.get_metrics()
+        }
     }
 
 
@@ -322,6 +412,60 @@ async def get_analytics_report():
     return report
 
 
+@app.get("/analytics/schema-conformance")
+async def get_schema_conformance():
+    """Validate the agent outputs stored in checkpoints and report schema conformance per model."""
+    await asyncio.to_thread(checkpoint_writer.flush, 5.0)
+    return await asyncio.to_thread(
+        lambda: schema_registry.validate_checkpoints(data for _, data in checkpoint_storage.iter_checkpoints())
+    )
+
+
+def _parse_cursor(after: Optional[str]) -> Optional[Union[str, Tuple[float, str]]]:
+    """Read a ``timestamp:session_id`` page cursor; a plain session ID is passed through."""
+    if after is None:
+        return None
+    timestamp, separator, session_id = after.partition(":")
+    try:
+        return (float(timestamp), session_id) if separator else after
+    except ValueError:
+        return after
+
+
+@app.get("/checkpoints")
+async def list_checkpoints(
+    status: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    after: Optional[str] = None,
+    limit: int = 100
+):
+    """List stored checkpoints, oldest first; pass the ``next`` cursor of a page as ``after`` for the next page."""
+    await asyncio.to_thread(checkpoint_writer.flush, 5.0)
+    limit = min(limit, 1000)
+    entries = await asyncio.to_thread(
+        checkpoint_storage.list_checkpoint_entries, status, start, end, _parse_cursor(after), limit
+    )
+    # The cursor holds the last row's position, so it stays valid if that session is deleted meanwhile
+    last = entries[-1] if len(entries) == limit else None
+    return {"checkpoints": entries, "next": f"{last['timestamp']!r}:{last['session_id']}" if last else None}
+
+
+@app.post("/maintenance/retention")
+async def run_retention(authorization: Optional[str] = Header(None)):
+    """Run a retention pass now and report what it reclaimed; requires the admin permission."""
+    # The pass deletes checkpoints and logs for good, so a session is always required
+    session = security_manager.validate_session(authorization) if authorization else None
+    if not session:
+        raise HTTPException(status_code=401, detail="Invalid session")
+    if not access_control.check_permission(authorization, "admin"):
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    security_manager.log_audit_event("maintenance", session["user_id"], {"action": "retention"})
+    
+    await asyncio.to_thread(checkpoint_writer.flush, 5.0)
+    return await asyncio.to_thread(retention_service.collect)
+
+
 @app.post("/export/session")
 async def export_session_data(
     request: ExportRequest,
@@ -504,7 +648,7 @@ async def get_system_info():
     return system_info
 
 
-async def run_workflow(session_id: str, prompt: str, user_id: str):
+async def run_workflow(session_id: str, prompt: str, user_id: str, bypass_cache: bool = False):
     """Run the workflow in the background with enhanced debug logging."""
     start_time = time.time()
     
@@ -515,16 +659,8 @@ async def run_workflow(session_id: str, prompt: str, user_id: str):
     
     try:
         with Timer("Complete Workflow Execution", "WORKFLOW"):
-            # Log workflow steps
-            log_workflow_step("Prompt Analysis", "active", "Senior Reasoning Agent")
-            
-            # Run the workflow
-            result = workflow_engine.run(prompt)
-            
-            log_workflow_step("Prompt Analysis", "completed", "Senior Reasoning Agent")
-            log_workflow_step("Task Delegation", "completed", "Delegation Specialist")
-            log_workflow_step("XML Validation", "completed", "XML Validator")
-            log_workflow_step("Quality Assurance", "completed", "QA Specialist")
+            # Run the workflow on the worker pool; the engine reports each step as it runs
+            result = await workflow_executor.run(prompt, session_id=session_id, use_cache=not bypass_cache)
             
         # Calculate execution time
         execution_time = time.time() - start_time
@@ -535,10 +671,18 @@ async def run_workflow(session_id: str, prompt: str, user_id: str):
         active_sessions[session_id]["logs"] = result.get("verbose_logs", [])
         active_sessions[session_id]["last_updated"] = time.time()
         
+        # Push the outcome to SSE subscribers
+        event_broker.publish(session_id, {
+            "type": "final",
+            "status": "completed",
+            "result": result,
+            "final": True
+        })
+        
         # Enhanced debug logging
         log_debug("SUCCESS", "WORKFLOW", 
                  f"Workflow completed for session {session_id} in {execution_time:.3f}s",
-                 {"result_size": len(str(result)), "steps_completed": 4})
+                 {"result_size": len(str(result)), "steps_completed": len(result.get("verbose_logs", []))})
         
         log_workflow_step("Workflow Completion", "completed", "System", 
                          {"execution_time": execution_time, "result_size": len(str(result))})
@@ -578,12 +722,22 @@ async def run_workflow(session_id: str, prompt: str, user_id: str):
         ]
         active_sessions[session_id]["last_updated"] = time.time()
         
+        # Push the failure to SSE subscribers
+        event_broker.publish(session_id, {
+            "type": "final",
+            "status": "error",
+            "result": {"error": str(e)},
+            "final": True
+        })
+        
         # Log error
         security_manager.log_audit_event(
             "workflow_error", 
             user_id, 
             {"session_id": session_id, "error": str(e)}
         )
+    finally:
+        event_broker.close(session_id)
 
 
 if __name__ == "__main__":
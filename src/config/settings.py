@@ -1,10 +1,20 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Any, Dict, Optional
 
 
 class Settings(BaseSettings):
     # Ollama settings
     OLLAMA_BASE_URL: str = "http://localhost:11434"
+    OLLAMA_HOSTS: str = ""  # comma-separated URLs to balance across, defaults to OLLAMA_BASE_URL
+    OLLAMA_INVENTORY_REFRESH_INTERVAL: float = 30.0  # seconds between model inventory refreshes
+    OLLAMA_MAX_CONNECTIONS: int = 16
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS: int = 8
+    OLLAMA_KEEPALIVE_EXPIRY: float = 60.0  # seconds
+    OLLAMA_CONNECT_TIMEOUT: float = 5.0
+    OLLAMA_READ_TIMEOUT: Optional[float] = 300.0  # None to wait indefinitely for a generation
+    OLLAMA_HEALTH_CHECK_INTERVAL: float = 10.0  # seconds between background health probes
+    OLLAMA_CIRCUIT_FAILURE_THRESHOLD: int = 3
+    OLLAMA_CIRCUIT_RESET_TIMEOUT: float = 30.0  # seconds before a trial request is let through
     
     # Model settings
     QWEN_MODEL: str = "qwen3:latest"
@@ -18,12 +28,83 @@ class Settings(BaseSettings):
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
     
+    # Generation settings
+    LLM_NUM_CTX: int = 8192
+    # Per-agent Ollama option overrides keyed by output key, e.g. {"final_qa_report": {"num_predict": 1024}}
+    AGENT_GENERATION_PROFILES: Dict[str, Dict[str, Any]] = {}
+    # Comma-separated model families that think before answering and get no stop sequence
+    LLM_THINKING_MODELS: str = "qwen3,deepseek-r1"
+    
+    # LLM response cache settings
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 256
+    LLM_CACHE_PATH: str = "./cache/llm_cache.sqlite"  # empty to disable the disk tier
+    LLM_CACHE_TTL: int = 7 * 24 * 3600  # seconds
+    LLM_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    
+    # Model warm-up and keep-alive
+    WARMUP_ENABLED: bool = True
+    WARMUP_CHECK_INTERVAL: float = 30.0  # seconds between loaded model checks
+    WARMUP_ACTIVE_WINDOW: float = 600.0  # seconds a model counts as in use after a call
+    WARMUP_KEEP_ALIVE_ACTIVE: str = "30m"
+    WARMUP_KEEP_ALIVE_IDLE: str = "5m"
+    
+    # Model affinity scheduling: batch LLM calls by model to avoid weight swaps
+    MODEL_SCHEDULER_ENABLED: bool = True
+    MODEL_SCHEDULER_MAX_CONCURRENT: int = 4  # calls admitted at once for the model loaded on each host
+    MODEL_SCHEDULER_MAX_WAIT: float = 30.0  # seconds a call waits before its model is loaded next
+    
+    # Coalesce identical concurrent LLM calls and workflow runs
+    COALESCE_IDENTICAL_REQUESTS: bool = True
+    
+    # Streaming settings
+    SSE_KEEPALIVE_INTERVAL: float = 15.0
+    SSE_REPLAY_BUFFER_SIZE: int = 1000
+    SSE_SUBSCRIBER_QUEUE_SIZE: int = 1000
+    SSE_TOKEN_BATCH_CHARS: int = 64  # streamed characters per token event, 0 to publish every token on its own
+    SSE_TOKEN_BATCH_INTERVAL: float = 0.05  # seconds a buffered token waits for its chunk to fill
+    
     # Workflow settings
     MAX_ITERATIONS: int = 30
     VERBOSE_LOGGING: bool = True
+    STREAM_TOKENS: bool = True
+    GRAPH_CHECKPOINT_PATH: str = "./checkpoints/graph_state.sqlite"  # empty to keep graph checkpoints in memory
+    GRAPH_CHECKPOINT_KEEP_PER_THREAD: int = 4  # newest checkpoints kept per session, 0 to keep all
+    GRAPH_CHECKPOINT_MAX_DELTA_CHAIN: int = 16  # deltas between full copies of a channel value, 0 to store every change in full
+    # Write-behind persistence of session checkpoints
+    CHECKPOINT_WRITE_BEHIND: bool = True
+    CHECKPOINT_WRITER_QUEUE_SIZE: int = 10000  # sessions waiting to be written before new ones are dropped
+    CHECKPOINT_WRITER_BATCH_SIZE: int = 256
+    CHECKPOINT_WRITER_FLUSH_INTERVAL: float = 0.05  # seconds to gather a batch
+    
+    # Retention of checkpoints, audit logs and performance logs
+    RETENTION_ENABLED: bool = True
+    RETENTION_INTERVAL: float = 3600.0  # seconds between collection passes
+    RETENTION_MAX_AGE_DAYS: float = 30.0  # 0 to keep data regardless of age
+    RETENTION_MAX_BYTES: int = 1024 * 1024 * 1024  # budget across checkpoints and logs, 0 for none
+    # Newest checkpoints kept per status, e.g. {"completed": 10000, "failed": 1000}
+    RETENTION_KEEP_LAST_PER_STATUS: Dict[str, int] = {}
+    RETENTION_BATCH_SIZE: int = 500  # checkpoints deleted per transaction
+    RETENTION_COMPACT_LOGS: bool = True  # gzip the log files of past days
+    
+    # Delegated task fan-out
+    TASK_FANOUT_ENABLED: bool = True
+    TASK_FANOUT_MAX_TASKS: int = 8
+    TASK_FANOUT_MAX_CONCURRENCY: int = 4
+    OUTPUT_SUMMARY_CACHE_SIZE: int = 256
+    # Incremental XML validation of streamed outputs
+    STREAM_XML_VALIDATION: bool = True
+    STREAM_XML_MAX_PREAMBLE: int = 2000
+    STREAM_XML_MAX_RETRIES: int = 1
+    
+    # Execution settings
+    # thread|process|async; process runs each graph in a worker process and relays its events and review back
+    WORKFLOW_EXECUTOR: str = "thread"
+    WORKFLOW_MAX_WORKERS: int = 4
+    WORKFLOW_QUEUE_SIZE: int = 64
     
     class Config:
         env_file = ".env"
 
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
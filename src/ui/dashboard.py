@@ -250,6 +250,12 @@ if st.session_state.result:
     with tab4:
         st.subheader("QA Report")
         qa_report = st.session_state.result.get("final_qa_report", "No QA report available")
+        qa_summary = (st.session_state.result.get("summaries") or {}).get("final_qa_report")
+        if qa_summary:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Score", qa_summary["score"] if qa_summary["score"] is not None else "n/a")
+            col2.metric("Recommendation", qa_summary["action"] or "n/a")
+            col3.metric("Issues", len(qa_summary["issues"]))
         st.text_area("QA Report Content", value=qa_report, height=300, key="qa_report", label_visibility="collapsed")
     
     with tab5:
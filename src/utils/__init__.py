@@ -1,19 +1,40 @@
 from .helpers import format_xml, validate_xml_structure, create_verbose_log
-from .ollama_client import OllamaClient, OllamaMonitor, ollama_client, ollama_monitor
+from .xml_repair import repair_xml
+from .ollama_client import CircuitBreaker, OllamaClient, OllamaClientRegistry, OllamaMonitor, ollama_clients, ollama_client, ollama_monitor
+from .ollama_router import OllamaHost, OllamaRouter, NoHealthyHostError, ollama_router
+from .model_scheduler import ModelAffinityScheduler, model_scheduler
+from .warmup import ModelWarmupManager, warmup_manager
 from .prompt_tuner import PromptTuner, prompt_tuner
 from .security import SecurityManager, AccessControl, security_manager, access_control
 from .visualization import WorkflowVisualizer, DataVisualizer, workflow_visualizer, data_visualizer
 from .monitoring import PerformanceMonitor, AnalyticsEngine, performance_monitor, analytics_engine
 from .export import DataExporter, ReportGenerator, data_exporter, report_generator
+from .events import SessionEventBroker, event_broker
+from .llm_cache import LLMCache, llm_cache
+from .singleflight import SingleFlight, llm_singleflight, workflow_singleflight
+from .xml_schemas import SchemaRegistry, schema_registry
+from .xml_summaries import OutputSummaryCache, output_summaries
+from .xml_stream import IncrementalXMLValidator, MalformedStreamError, stream_validation_stats
 
 __all__ = [
     "format_xml", 
     "validate_xml_structure", 
     "create_verbose_log",
+    "CircuitBreaker",
     "OllamaClient",
+    "OllamaClientRegistry",
     "OllamaMonitor",
+    "ollama_clients",
     "ollama_client",
     "ollama_monitor",
+    "OllamaHost",
+    "OllamaRouter",
+    "NoHealthyHostError",
+    "ollama_router",
+    "ModelAffinityScheduler",
+    "model_scheduler",
+    "ModelWarmupManager",
+    "warmup_manager",
     "PromptTuner",
     "prompt_tuner",
     "SecurityManager",
@@ -31,5 +52,12 @@ __all__ = [
     "DataExporter",
     "ReportGenerator",
     "data_exporter",
-    "report_generator"
+    "report_generator",
+    "SessionEventBroker",
+    "event_broker",
+    "LLMCache",
+    "llm_cache",
+    "SingleFlight",
+    "llm_singleflight",
+    "workflow_singleflight"
 ]
\ No newline at end of file
@@ -0,0 +1,303 @@
+from typing import Dict, Any, Callable, Collection, List, Optional, Tuple
+from collections import OrderedDict, deque
+import asyncio
+import threading
+import time
+
+from src.config import settings
+
+
+# Queue items that tell a subscriber the stream is over
+END_OF_STREAM = object()
+SUBSCRIBER_LAGGED = object()
+
+
+class ReplayGap:
+    """Queue item telling a resuming subscriber that some of the events it missed are gone.
+
+    The replay buffer no longer holds the events from ``first_missed`` up to
+    (not including) ``first_available``; the client has to reset its view
+    instead of assuming the stream continues where it left off.
+    """
+
+    def __init__(self, first_missed: int, first_available: int):
+        self.first_missed = first_missed
+        self.first_available = first_available
+
+
+class EventSubscription:
+    """A single subscriber's view of a session channel."""
+
+    def __init__(self, session_id: str, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.session_id = session_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.lagged = False
+
+    def deliver(self, item: Any) -> None:
+        """Put an item on the subscriber queue (runs on the subscriber's loop)."""
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop the backlog and tell the subscriber to
+            # reconnect, it can resume from the replay buffer with Last-Event-ID
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(SUBSCRIBER_LAGGED)
+
+
+class _SessionChannel:
+    """Replay buffer and subscriber list for one session."""
+
+    def __init__(self, replay_size: int):
+        self.next_id = 1
+        self.replay: deque = deque(maxlen=replay_size)
+        self.subscribers: List[EventSubscription] = []
+        # Sessions whose channels receive a copy of the events published here, with the
+        # event types they take (None for all)
+        self.forwards: List[Tuple[str, Optional[Collection[str]]]] = []
+        self.closed = False
+
+
+class SessionEventBroker:
+    """Per-session pub/sub channels that carry live workflow events to SSE clients.
+
+    Events may be published from any thread (workflow workers, agent token
+    callbacks); each subscriber receives them on its own event loop. Every
+    event gets a per-session sequential ID and is kept in a bounded replay
+    buffer so clients can resume with ``Last-Event-ID``. Subscribers have
+    bounded queues; one that falls too far behind is cut off rather than
+    slowing down the publisher. A session can be forwarded to another one,
+    e.g. when a run shares the execution of an identical run in flight.
+    In a workflow worker process the broker instead relays every event to
+    the API process, whose broker publishes it.
+    """
+
+    def __init__(self, replay_size: Optional[int] = None, subscriber_queue_size: Optional[int] = None,
+                 max_closed_channels: int = 256):
+        self.replay_size = replay_size or settings.SSE_REPLAY_BUFFER_SIZE
+        self.subscriber_queue_size = subscriber_queue_size or settings.SSE_SUBSCRIBER_QUEUE_SIZE
+        self.max_closed_channels = max_closed_channels
+        self._lock = threading.Lock()
+        self._channels: "OrderedDict[str, _SessionChannel]" = OrderedDict()
+        self._stats = {"published": 0, "lagged_subscribers": 0}
+        self._relay: Optional[Callable[[Tuple[str, Dict[str, Any]]], None]] = None
+
+    def relay_to(self, relay: Callable[[Tuple[str, Dict[str, Any]]], None]) -> None:
+        """Hand every published ``(session_id, event)`` to ``relay`` instead of local subscribers."""
+        self._relay = relay
+
+    def open(self, session_id: str) -> None:
+        """Open a channel for a session; events for unknown sessions are dropped.
+
+        Reopening a finished session (a resume or another run) starts a fresh
+        channel whose event IDs continue from the previous run's, so a
+        client's Last-Event-ID stays valid.
+        """
+        with self._lock:
+            channel = self._channels.get(session_id)
+            if channel is not None and not channel.closed:
+                return
+            self._channels[session_id] = _SessionChannel(self.replay_size)
+            self._channels.move_to_end(session_id)
+            if channel is not None:
+                self._channels[session_id].next_id = channel.next_id
+
+    def publish(self, session_id: str, event: Dict[str, Any]) -> int:
+        """Publish an event to every subscriber of a session and return its event ID.
+
+        Returns 0 when the session has no open channel or events are relayed.
+        """
+        event.setdefault("timestamp", time.time())
+        if self._relay is not None:
+            self._relay((session_id, event))
+            return 0
+        with self._lock:
+            event_id, deliveries = self._append(session_id, event)
+
+        for subscription, item in deliveries:
+            self._dispatch(subscription, item)
+        return event_id
+
+    def forward(self, source: str, target: str, types: Optional[Collection[str]] = None) -> None:
+        """Republish a session's buffered and future events on another session's channel.
+
+        Only events whose type is in ``types`` are forwarded, when given.
+        """
+        with self._lock:
+            channel = self._channels.get(source)
+            if channel is None or source == target:
+                return
+            deliveries = []
+            for _, event in channel.replay:
+                if types is None or event.get("type") in types:
+                    deliveries.extend(self._append(target, self._retarget(event, target))[1])
+            if not channel.closed and all(forward[0] != target for forward in channel.forwards):
+                channel.forwards.append((target, types))
+
+        for subscription, item in deliveries:
+            self._dispatch(subscription, item)
+
+    @staticmethod
+    def _retarget(event: Dict[str, Any], session_id: str) -> Dict[str, Any]:
+        """Copy of an event addressed to another session."""
+        return {**event, "session_id": session_id} if "session_id" in event else dict(event)
+
+    def _append(self, session_id: str, event: Dict[str, Any],
+                visited: Tuple[str, ...] = ()) -> Tuple[int, List[Tuple[EventSubscription, Any]]]:
+        """Buffer an event on a session and its forwards (lock must be held).
+
+        Returns the event ID and the deliveries to dispatch once the lock is released.
+        """
+        channel = self._channels.get(session_id)
+        if channel is None or channel.closed or session_id in visited:
+            return 0, []
+        event_id = channel.next_id
+        channel.next_id += 1
+        channel.replay.append((event_id, event))
+        self._stats["published"] += 1
+        deliveries = [(subscription, (event_id, event)) for subscription in channel.subscribers]
+        for target, types in channel.forwards:
+            if types is None or event.get("type") in types:
+                deliveries.extend(self._append(target, self._retarget(event, target), visited + (session_id,))[1])
+        return event_id, deliveries
+
+    def close(self, session_id: str) -> None:
+        """Mark a session's stream as finished and release its subscribers."""
+        with self._lock:
+            channel = self._channels.get(session_id)
+            if channel is None:
+                return
+            channel.closed = True
+            subscribers = list(channel.subscribers)
+            self._evict_closed_channels()
+
+        for subscription in subscribers:
+            self._dispatch(subscription, END_OF_STREAM)
+
+    def _dispatch(self, subscription: EventSubscription, item: Any) -> None:
+        """Hand an item to a subscriber on its own loop."""
+        try:
+            subscription.loop.call_soon_threadsafe(self._deliver, subscription, item)
+        except RuntimeError:
+            # The subscriber's loop has been closed
+            self.unsubscribe(subscription)
+
+    def _deliver(self, subscription: EventSubscription, item: Any) -> None:
+        """Deliver an item and count subscribers that fall behind."""
+        was_lagged = subscription.lagged
+        subscription.deliver(item)
+        if subscription.lagged and not was_lagged:
+            with self._lock:
+                self._stats["lagged_subscribers"] += 1
+
+    def _evict_closed_channels(self) -> None:
+        """Drop the oldest finished channels beyond the retention limit (lock must be held)."""
+        closed = [sid for sid, ch in self._channels.items() if ch.closed and not ch.subscribers]
+        for session_id in closed[:max(0, len(closed) - self.max_closed_channels)]:
+            del self._channels[session_id]
+
+    def subscribe(self, session_id: str, last_event_id: Optional[int] = None) -> Optional[EventSubscription]:
+        """Subscribe to a session on the running event loop.
+
+        Buffered events newer than ``last_event_id`` (or the whole replay
+        buffer when it is not given) are queued before any live events,
+        preceded by a ``ReplayGap`` when some of them have already left the
+        buffer. Returns None when the session has no channel.
+        """
+        subscription = EventSubscription(session_id, asyncio.get_running_loop(), self.subscriber_queue_size)
+        with self._lock:
+            channel = self._channels.get(session_id)
+            if channel is None:
+                return None
+            replay = [item for item in channel.replay if last_event_id is None or item[0] > last_event_id]
+            first_available = channel.replay[0][0] if channel.replay else channel.next_id
+            if last_event_id is not None and last_event_id + 1 < first_available:
+                replay.insert(0, ReplayGap(last_event_id + 1, first_available))
+            closed = channel.closed
+            if not closed:
+                channel.subscribers.append(subscription)
+
+        for item in replay:
+            subscription.deliver(item)
+        if closed:
+            subscription.deliver(END_OF_STREAM)
+        return subscription
+
+    def unsubscribe(self, subscription: EventSubscription) -> None:
+        """Remove a subscriber from its session."""
+        with self._lock:
+            channel = self._channels.get(subscription.session_id)
+            if channel and subscription in channel.subscribers:
+                channel.subscribers.remove(subscription)
+
+    def discard(self, session_id: str) -> None:
+        """Forget a session's channel and replay buffer."""
+        with self._lock:
+            self._channels.pop(session_id, None)
+
+    def subscriber_count(self, session_id: str) -> int:
+        """Number of subscribers currently attached to a session."""
+        with self._lock:
+            channel = self._channels.get(session_id)
+            return len(channel.subscribers) if channel else 0
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get broker fan-out metrics."""
+        with self._lock:
+            return {
+                "channels": len(self._channels),
+                "open_channels": sum(1 for ch in self._channels.values() if not ch.closed),
+                "subscribers": sum(len(ch.subscribers) for ch in self._channels.values()),
+                "published": self._stats["published"],
+                "lagged_subscribers": self._stats["lagged_subscribers"]
+            }
+
+
+class TokenBatcher:
+    """Publishes streamed tokens to a session as chunked token events.
+
+    Tokens are buffered until the chunk holds ``max_chars`` characters or its
+    first token has waited ``max_delay`` seconds, so each event, and each
+    slot of the replay buffer, covers a span of output rather than a single
+    token. Call ``flush`` when the stream ends or before publishing another
+    event, to keep the session's events in order.
+    """
+
+    def __init__(self, broker: SessionEventBroker, session_id: str, fields: Dict[str, Any],
+                 max_chars: Optional[int] = None, max_delay: Optional[float] = None):
+        self.broker = broker
+        self.session_id = session_id
+        self.fields = fields
+        self.max_chars = settings.SSE_TOKEN_BATCH_CHARS if max_chars is None else max_chars
+        self.max_delay = settings.SSE_TOKEN_BATCH_INTERVAL if max_delay is None else max_delay
+        self._tokens: List[str] = []
+        self._size = 0
+        self._started = 0.0
+
+    def add(self, token: str) -> None:
+        """Buffer a token, publishing the chunk once it is full or old enough."""
+        if not token:
+            return
+        if not self._tokens:
+            self._started = time.monotonic()
+        self._tokens.append(token)
+        self._size += len(token)
+        if self._size >= self.max_chars or time.monotonic() - self._started >= self.max_delay:
+            self.flush()
+
+    def flush(self) -> int:
+        """Publish the buffered tokens as one event and return its ID (0 when there were none)."""
+        if not self._tokens:
+            return 0
+        event = {"type": "token", **self.fields, "content": "".join(self._tokens), "tokens": len(self._tokens)}
+        self._tokens = []
+        self._size = 0
+        return self.broker.publish(self.session_id, event)
+
+
+# Global instance
+event_broker = SessionEventBroker()
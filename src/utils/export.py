@@ -174,6 +174,9 @@ class ReportGenerator:
     
     def generate_session_report(self, session_data: Dict[str, Any]) -> Dict[str, Any]:
         """Generate a comprehensive report for a session."""
+        result = session_data.get("result")
+        summaries = (result.get("summaries") if isinstance(result, dict) else None) or {}
+        qa_summary = summaries.get("final_qa_report") or {}
         report = {
             "report_type": "session_report",
             "generated_at": datetime.now().isoformat(),
@@ -182,7 +185,11 @@ class ReportGenerator:
             "summary": {
                 "total_logs": len(session_data.get("logs", [])),
                 "result_size": len(str(session_data.get("result", {}))),
-                "duration": self._calculate_session_duration(session_data)
+                "duration": self._calculate_session_duration(session_data),
+                "tasks": len((summaries.get("task_delegation") or {}).get("tasks", [])),
+                "qa_score": qa_summary.get("score"),
+                "qa_action": qa_summary.get("action"),
+                "qa_issue_severities": qa_summary.get("severities", {})
             },
             "data": session_data
         }
@@ -1,4 +1,7 @@
 from typing import Dict, Any, List
+import gzip
+import json
+import os
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 
@@ -46,4 +49,18 @@ def create_verbose_log(agent_name: str, message: str, log_type: str = "info") ->
         "agent": agent_name,
         "message": message,
         "type": log_type
-    }
\ No newline at end of file
+    }
+
+
+def load_json_log(path: str) -> List[Dict[str, Any]]:
+    """Load a JSON log file, or its gzip-compacted copy if it has been compacted."""
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+        if os.path.exists(path + ".gz"):
+            with gzip.open(path + ".gz", 'rt') as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
+    return []
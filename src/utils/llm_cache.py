@@ -0,0 +1,244 @@
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.config import settings
+
+
+class MemoryCacheTier:
+    """Size-bounded in-memory LRU tier."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if self.ttl and time.time() - created_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, created_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, created_at or time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries}
+
+
+class SQLiteCacheTier:
+    """Persistent SQLite tier with TTL and a total size budget.
+
+    Access times used for least recently used eviction are kept in memory
+    and written in batches, so a cache hit does not cost a write transaction.
+    """
+
+    name = "disk"
+    # Pending access times written at once
+    access_flush_size = 64
+
+    def __init__(self, db_path: str, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        self._accessed: Dict[str, float] = {}
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, size, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._total_bytes -= size
+                self._accessed.pop(key, None)
+                return None
+            self._accessed[key] = now
+            if len(self._accessed) >= self.access_flush_size:
+                self._flush_access_times()
+                self._conn.commit()
+            return value, created_at
+
+    def _flush_access_times(self) -> None:
+        """Write the pending access times (lock must be held, the caller commits)."""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._accessed.items()]
+            )
+            self._accessed.clear()
+
+    def set(self, key: str, value: str, created_at: Optional[float] = None) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, created_at or now, now)
+            )
+            self._total_bytes += size - (row[0] if row else 0)
+            self._accessed.pop(key, None)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drop expired entries, then least recently used ones over the byte budget (lock must be held)."""
+        if self.ttl:
+            expired = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+            if expired.rowcount:
+                self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if not self.max_bytes or self._total_bytes <= self.max_bytes:
+            return
+        self._flush_access_times()
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at")
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self._total_bytes = 0
+            self._accessed.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return {"entries": entries, "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+class LLMCache:
+    """Content-addressed cache for LLM responses.
+
+    Entries are keyed on a hash of the model, generation options and
+    messages, and looked up through a list of tiers from fastest to
+    slowest. A hit in a slower tier is promoted into the faster ones with
+    its original creation time, so promotion does not extend its TTL. Any
+    object with ``get`` (returning ``(value, created_at)``), ``set``,
+    ``clear`` and ``get_stats`` can be used as a tier.
+    """
+
+    def __init__(self, tiers: List[Any]):
+        self.tiers = tiers
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0}
+        self._tier_hits = {tier.name: 0 for tier in tiers}
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> str:
+        """Build the content address for a chat request."""
+        payload = json.dumps(
+            {"model": model, "options": options or {}, "messages": messages},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response."""
+        for index, tier in enumerate(self.tiers):
+            entry = tier.get(key)
+            if entry is not None:
+                value, created_at = entry
+                for faster in self.tiers[:index]:
+                    faster.set(key, value, created_at)
+                with self._lock:
+                    self._stats["hits"] += 1
+                    self._tier_hits[tier.name] += 1
+                return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response in every tier."""
+        created_at = time.time()
+        for tier in self.tiers:
+            tier.set(key, value, created_at)
+        with self._lock:
+            self._stats["writes"] += 1
+
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        for tier in self.tiers:
+            tier.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get hit/miss counters and per-tier usage."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            metrics = {
+                "hits": self._stats["hits"],
+                "misses": self._stats["misses"],
+                "writes": self._stats["writes"],
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0,
+                "tier_hits": dict(self._tier_hits)
+            }
+        metrics["tiers"] = {tier.name: tier.get_stats() for tier in self.tiers}
+        return metrics
+
+
+def create_llm_cache() -> Optional[LLMCache]:
+    """Build the LLM cache configured in settings."""
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+
+    tiers = [MemoryCacheTier(settings.LLM_CACHE_MAX_ENTRIES, settings.LLM_CACHE_TTL)]
+    if settings.LLM_CACHE_PATH:
+        tiers.append(SQLiteCacheTier(settings.LLM_CACHE_PATH, settings.LLM_CACHE_TTL, settings.LLM_CACHE_MAX_BYTES))
+    return LLMCache(tiers)
+
+
+# Global instance
+llm_cache = create_llm_cache()
@@ -0,0 +1,180 @@
+from typing import Dict, Any, Optional
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import threading
+import time
+
+from src.config import settings
+
+
+class HostSchedule:
+    """Queues, loaded model and running calls of one Ollama host."""
+
+    def __init__(self):
+        self.queues: Dict[str, deque] = {}
+        self.active: Optional[str] = None
+        self.running = 0
+
+
+class ModelAffinityScheduler:
+    """Admission gate that batches LLM calls by model on each Ollama host.
+
+    Each host loads models independently, so every host has its own
+    queues, loaded model and concurrency limit. Calls for the model that is
+    currently loaded on a host are admitted up to ``max_concurrent`` at a
+    time. Calls for other models queue until the loaded model's queue
+    drains and its running calls finish, so a memory-constrained host swaps
+    weights once per batch instead of once per call. A call that has waited
+    longer than ``max_wait`` stops further admissions for the loaded model
+    so its model gets a turn. Sync and async callers share the same queues.
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None, max_wait: Optional[float] = None):
+        self.max_concurrent = max_concurrent or settings.MODEL_SCHEDULER_MAX_CONCURRENT
+        self.max_wait = max_wait if max_wait is not None else settings.MODEL_SCHEDULER_MAX_WAIT
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, HostSchedule] = {}
+        self._stats = {"switches": 0, "forced_switches": 0, "load_time": 0.0}
+        self._model_stats: Dict[str, Dict[str, float]] = {}
+
+    def _enqueue(self, model: str, host: str) -> Future:
+        """Queue a call for a model on a host and admit whatever can run."""
+        future = Future()
+        with self._lock:
+            schedule = self._hosts.setdefault(host, HostSchedule())
+            schedule.queues.setdefault(model, deque()).append((time.monotonic(), future))
+            self._pump(schedule)
+        return future
+
+    def _overdue_model(self, schedule: HostSchedule) -> Optional[str]:
+        """The other model whose oldest call has waited past max_wait (lock must be held)."""
+        deadline = time.monotonic() - self.max_wait
+        overdue = [
+            (queue[0][0], model) for model, queue in schedule.queues.items()
+            if model != schedule.active and queue and queue[0][0] <= deadline
+        ]
+        return min(overdue)[1] if overdue else None
+
+    def _next_model(self, schedule: HostSchedule) -> Optional[str]:
+        """Choose the model to load once the running calls have finished (lock must be held)."""
+        overdue = self._overdue_model(schedule)
+        if overdue:
+            self._stats["forced_switches"] += 1
+            return overdue
+        if schedule.queues.get(schedule.active):
+            return schedule.active
+        waiting = [(queue[0][0], model) for model, queue in schedule.queues.items() if queue]
+        return min(waiting)[1] if waiting else None
+
+    def _pump(self, schedule: HostSchedule) -> None:
+        """Admit queued calls for the host's loaded model, switching models when it is idle (lock must be held)."""
+        while True:
+            if schedule.running == 0:
+                model = self._next_model(schedule)
+                if model is None:
+                    return
+                if model != schedule.active:
+                    if schedule.active is not None:
+                        self._stats["switches"] += 1
+                    schedule.active = model
+
+            queue = schedule.queues.get(schedule.active)
+            if not queue or schedule.running >= self.max_concurrent:
+                return
+            if schedule.running > 0 and self._overdue_model(schedule):
+                # Let the loaded model drain so the overdue one can go next
+                return
+
+            enqueued_at, future = queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            schedule.running += 1
+            stats = self._model_entry(schedule.active)
+            waited = time.monotonic() - enqueued_at
+            stats["admitted"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+            future.set_result(None)
+
+    def _model_entry(self, model: str) -> Dict[str, float]:
+        """Per-model counters (lock must be held)."""
+        return self._model_stats.setdefault(model, {"admitted": 0, "total_wait": 0.0, "max_wait": 0.0, "load_time": 0.0})
+
+    def release(self, host: str = "") -> None:
+        """Finish an admitted call on a host."""
+        with self._lock:
+            schedule = self._hosts[host]
+            schedule.running -= 1
+            self._pump(schedule)
+
+    @contextmanager
+    def slot(self, model: str, host: str = ""):
+        """Wait until a call for ``model`` may run on ``host``."""
+        self._enqueue(model, host).result()
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    @asynccontextmanager
+    async def aslot(self, model: str, host: str = ""):
+        """Asynchronously wait until a call for ``model`` may run on ``host``."""
+        future = self._enqueue(model, host)
+        try:
+            await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # The slot may have been granted just as the caller was cancelled
+            if future.done() and not future.cancelled():
+                self.release(host)
+            raise
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def record_load(self, model: str, seconds: float) -> None:
+        """Record time Ollama spent loading a model's weights."""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._stats["load_time"] += seconds
+            self._model_entry(model)["load_time"] += seconds
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get model switch, load and queueing metrics, overall and per host."""
+        with self._lock:
+            queued: Dict[str, int] = {}
+            for schedule in self._hosts.values():
+                for model, queue in schedule.queues.items():
+                    if queue:
+                        queued[model] = queued.get(model, 0) + len(queue)
+            return {
+                "running": sum(schedule.running for schedule in self._hosts.values()),
+                "queued": queued,
+                "hosts": {
+                    host: {
+                        "active_model": schedule.active,
+                        "running": schedule.running,
+                        "queued": {model: len(queue) for model, queue in schedule.queues.items() if queue}
+                    }
+                    for host, schedule in self._hosts.items()
+                },
+                "switches": self._stats["switches"],
+                "forced_switches": self._stats["forced_switches"],
+                "load_time": self._stats["load_time"],
+                "models": {
+                    model: {
+                        "admitted": stats["admitted"],
+                        "avg_wait": stats["total_wait"] / stats["admitted"] if stats["admitted"] else 0,
+                        "max_wait": stats["max_wait"],
+                        "load_time": stats["load_time"]
+                    }
+                    for model, stats in self._model_stats.items()
+                }
+            }
+
+
+# Global instance
+model_scheduler = ModelAffinityScheduler()
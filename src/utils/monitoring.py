@@ -1,12 +1,56 @@
 from typing import Dict, Any, List, Optional
+from collections import OrderedDict, deque
+import threading
 import time
 import psutil
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+from src.utils.helpers import load_json_log
 from src.utils.ollama_client import ollama_monitor
 
 
+# Ollama reports durations in nanoseconds
+NANOSECONDS = 1e9
+
+
+def ollama_call_stats(response: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract token counts and timings from a final Ollama chat response."""
+    prompt_eval_duration = (response.get("prompt_eval_duration") or 0) / NANOSECONDS
+    eval_duration = (response.get("eval_duration") or 0) / NANOSECONDS
+    prompt_tokens = response.get("prompt_eval_count") or 0
+    completion_tokens = response.get("eval_count") or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "load_time": (response.get("load_duration") or 0) / NANOSECONDS,
+        "prompt_eval_time": prompt_eval_duration,
+        "eval_time": eval_duration,
+        "total_time": (response.get("total_duration") or 0) / NANOSECONDS,
+        "prompt_tokens_per_sec": prompt_tokens / prompt_eval_duration if prompt_eval_duration else 0,
+        "tokens_per_sec": completion_tokens / eval_duration if eval_duration else 0
+    }
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    """Summarize samples as count, mean and percentiles."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+    
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "p99": percentile(0.99),
+        "max": ordered[-1]
+    }
+
+
 class PerformanceMonitor:
     """Performance monitoring and analytics for the multi-agent system."""
     
@@ -14,6 +58,12 @@ class PerformanceMonitor:
         self.log_path = log_path
         os.makedirs(log_path, exist_ok=True)
         self.metrics_history = []
+        self._llm_lock = threading.Lock()
+        self._llm_samples: deque = deque(maxlen=1000)
+        self._llm_totals: Dict[str, "OrderedDict[str, Dict[str, float]]"] = {
+            "agent": OrderedDict(), "model": OrderedDict(), "session": OrderedDict()
+        }
+        self._max_tracked_sessions = 1000
     
     def collect_system_metrics(self) -> Dict[str, Any]:
         """Collect system-level performance metrics."""
@@ -89,6 +139,61 @@ class PerformanceMonitor:
             "throughput": output_size / execution_time if execution_time > 0 else 0
         }
     
+    def record_llm_call(self, stats: Dict[str, Any]) -> None:
+        """Record the counters of one LLM call, keyed by its agent, model and session."""
+        with self._llm_lock:
+            self._llm_samples.append(stats)
+            for group in ("agent", "model", "session"):
+                key = stats.get(group)
+                if key is None:
+                    continue
+                totals = self._llm_totals[group].setdefault(key, {
+                    "calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                    "prompt_eval_time": 0.0, "eval_time": 0.0, "load_time": 0.0, "duration": 0.0
+                })
+                totals["calls"] += 1
+                for field in ("prompt_tokens", "completion_tokens", "prompt_eval_time", "eval_time", "load_time", "duration"):
+                    totals[field] += stats.get(field, 0)
+                self._llm_totals[group].move_to_end(key)
+            sessions = self._llm_totals["session"]
+            while len(sessions) > self._max_tracked_sessions:
+                sessions.popitem(last=False)
+    
+    def _summarize_llm_totals(self, totals: Dict[str, float]) -> Dict[str, Any]:
+        """Add throughput rates to accumulated LLM call counters."""
+        return {
+            **totals,
+            "tokens_per_sec": totals["completion_tokens"] / totals["eval_time"] if totals["eval_time"] else 0,
+            "prompt_tokens_per_sec": totals["prompt_tokens"] / totals["prompt_eval_time"] if totals["prompt_eval_time"] else 0
+        }
+    
+    def get_llm_metrics(self, recent_sessions: int = 20) -> Dict[str, Any]:
+        """Get token throughput, time-to-first-token and load-time distributions for LLM calls."""
+        with self._llm_lock:
+            samples = list(self._llm_samples)
+            totals = {group: dict(entries) for group, entries in self._llm_totals.items()}
+        
+        return {
+            "calls": sum(entry["calls"] for entry in totals["model"].values()),
+            "distributions": {
+                "tokens_per_sec": _distribution([s["tokens_per_sec"] for s in samples if s["tokens_per_sec"]]),
+                "time_to_first_token": _distribution([s["time_to_first_token"] for s in samples]),
+                "load_time": _distribution([s["load_time"] for s in samples])
+            },
+            "by_agent": {key: self._summarize_llm_totals(value) for key, value in totals["agent"].items()},
+            "by_model": {key: self._summarize_llm_totals(value) for key, value in totals["model"].items()},
+            "by_session": {
+                key: self._summarize_llm_totals(value)
+                for key, value in list(totals["session"].items())[-recent_sessions:]
+            }
+        }
+    
+    def get_session_llm_metrics(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get accumulated LLM call counters for one session."""
+        with self._llm_lock:
+            totals = self._llm_totals["session"].get(session_id)
+            return self._summarize_llm_totals(dict(totals)) if totals else None
+    
     def log_metrics(self, metrics: Dict[str, Any]) -> None:
         """Log metrics to file."""
         self.metrics_history.append(metrics)
@@ -116,21 +221,10 @@ class PerformanceMonitor:
         """Get metrics history for the specified number of days."""
         history = []
         
-        # Get files for the last N days
+        # Get files for the last N days, including compacted ones
         for i in range(days):
-            date = datetime.now().strftime('%Y-%m-%d')
-            log_file = os.path.join(self.log_path, f"metrics_{date}.json")
-            
-            if os.path.exists(log_file):
-                try:
-                    with open(log_file, 'r') as f:
-                        entries = json.load(f)
-                        history.extend(entries)
-                except:
-                    pass
-            
-            # Move to previous day
-            datetime.now().replace(day=datetime.now().day - 1)
+            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
+            history.extend(load_json_log(os.path.join(self.log_path, f"metrics_{date}.json")))
         
         return history
     
@@ -1,84 +1,266 @@
 import ollama
+import httpx
 import asyncio
+import threading
+import weakref
+import time
 from typing import Dict, Any, List, Optional
 from src.config import settings
 
 
+class OllamaClientRegistry:
+    """Process-wide pool of Ollama clients, one per base URL.
+    
+    Every client shares the keep-alive connection pool limits and timeouts
+    from settings, so callers reuse warm connections instead of opening new
+    ones per stage. Async clients are bound to the event loop that created
+    them, so they are kept per loop.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, ollama.Client] = {}
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, ollama.AsyncClient]]" = (
+            weakref.WeakKeyDictionary()
+        )
+    
+    def _client_options(self) -> Dict[str, Any]:
+        """Connection pool and timeout options passed to httpx."""
+        return {
+            "limits": httpx.Limits(
+                max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY
+            ),
+            "timeout": httpx.Timeout(settings.OLLAMA_READ_TIMEOUT, connect=settings.OLLAMA_CONNECT_TIMEOUT)
+        }
+    
+    def get_client(self, base_url: Optional[str] = None) -> ollama.Client:
+        """Get the shared client for a base URL."""
+        base_url = (base_url or settings.OLLAMA_BASE_URL).rstrip("/")
+        with self._lock:
+            client = self._clients.get(base_url)
+            if client is None:
+                client = ollama.Client(host=base_url, **self._client_options())
+                self._clients[base_url] = client
+            return client
+    
+    def get_async_client(self, base_url: Optional[str] = None) -> ollama.AsyncClient:
+        """Get the shared async client for a base URL on the running event loop."""
+        base_url = (base_url or settings.OLLAMA_BASE_URL).rstrip("/")
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(base_url)
+            if client is None:
+                client = ollama.AsyncClient(host=base_url, **self._client_options())
+                clients[base_url] = client
+            return client
+    
+    def close(self) -> None:
+        """Close the pooled connections of the sync clients."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client._client.close()
+    
+    async def aclose(self) -> None:
+        """Close the pooled connections of the async clients on the running loop."""
+        with self._lock:
+            clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client._client.aclose()
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get the number of pooled clients and the pool limits."""
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "async_clients": sum(len(clients) for clients in self._async_clients.values()),
+                "max_connections": settings.OLLAMA_MAX_CONNECTIONS,
+                "max_keepalive_connections": settings.OLLAMA_MAX_KEEPALIVE_CONNECTIONS
+            }
+
+
+class CircuitBreaker:
+    """Tracks Ollama failures and stops calls while the server is down.
+    
+    The circuit opens after ``failure_threshold`` consecutive failures. Once
+    ``reset_timeout`` seconds have passed it half-opens and lets a single
+    trial request through; success closes it again, failure reopens it.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+    
+    def allow_request(self) -> bool:
+        """Check whether a call may go to the server, reserving the half-open trial."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+    
+    def record_failure(self) -> bool:
+        """Count a failure and return True if it opened the circuit."""
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                opened = self._state != self.OPEN
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                return opened
+            return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {"state": state, "consecutive_failures": self._failures}
+
+
 class OllamaClient:
-    """Client for interacting with Ollama models."""
+    """Client for interacting with Ollama models.
+    
+    Connection state is tracked by a circuit breaker fed by real calls and
+    an optional background health probe, so calls never pay for a
+    speculative round trip to check the server first.
+    """
     
     def __init__(self, base_url: str = None):
         self.base_url = base_url or settings.OLLAMA_BASE_URL
-        self.client = None
-        self._initialize_client()
+        self.client = ollama_clients.get_client(self.base_url)
+        self.breaker = CircuitBreaker(
+            settings.OLLAMA_CIRCUIT_FAILURE_THRESHOLD,
+            settings.OLLAMA_CIRCUIT_RESET_TIMEOUT
+        )
+        self.last_health_check: Optional[float] = None
+        self._probe_thread: Optional[threading.Thread] = None
+        self._probe_stop = threading.Event()
     
-    def _initialize_client(self):
-        """Initialize the Ollama client with error handling."""
-        try:
-            self.client = ollama.Client(host=self.base_url)
-            # Test connection
-            self.client.list()
-        except Exception as e:
+    def _record_failure(self, error: Exception) -> None:
+        """Record a failed call and explain how to fix the connection when the circuit opens."""
+        if self.breaker.record_failure():
             print(f"⚠️  Failed to connect to Ollama at {self.base_url}")
-            print(f"Error: {e}")
+            print(f"Error: {error}")
             print("🔧 Please ensure Ollama is installed and running:")
             print("   1. Install Ollama: https://ollama.com/download")
             print("   2. Start Ollama: ollama serve")
             print("   3. Or run: python setup_ollama.py")
-            self.client = None
     
-    def is_connected(self) -> bool:
-        """Check if client is connected to Ollama."""
-        if self.client is None:
-            return False
+    def check_health(self) -> bool:
+        """Probe the server with a lightweight request and update the connection state."""
+        self.last_health_check = time.time()
         try:
             self.client.list()
-            return True
-        except:
+        except Exception as e:
+            self._record_failure(e)
             return False
+        self.breaker.record_success()
+        return True
+    
+    def start_health_probe(self, interval: Optional[float] = None) -> None:
+        """Probe the server periodically on a background thread."""
+        if self._probe_thread and self._probe_thread.is_alive():
+            return
+        interval = interval or settings.OLLAMA_HEALTH_CHECK_INTERVAL
+        self._probe_stop.clear()
+        
+        def probe():
+            while not self._probe_stop.is_set():
+                self.check_health()
+                self._probe_stop.wait(interval)
+        
+        self._probe_thread = threading.Thread(target=probe, name="ollama-health-probe", daemon=True)
+        self._probe_thread.start()
+    
+    def stop_health_probe(self) -> None:
+        """Stop the background health probe."""
+        self._probe_stop.set()
+        if self._probe_thread:
+            self._probe_thread.join(timeout=5)
+            self._probe_thread = None
+    
+    def is_connected(self) -> bool:
+        """Check if client is connected to Ollama, from the cached connection state."""
+        return self.breaker.state != CircuitBreaker.OPEN
     
     def reconnect(self) -> bool:
         """Attempt to reconnect to Ollama."""
-        self._initialize_client()
-        return self.is_connected()
+        return self.check_health()
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get the cached connection state."""
+        return {
+            "connected": self.is_connected(),
+            "last_health_check": self.last_health_check,
+            "circuit": self.breaker.get_stats()
+        }
     
     def list_models(self) -> List[Dict[str, Any]]:
         """List available models."""
-        if not self.is_connected():
+        if not self.breaker.allow_request():
             print("Failed to connect to Ollama. Please check that Ollama is downloaded, running and accessible. https://ollama.com/download")
             return []
         
         try:
             response = self.client.list()
-            return response.get('models', [])
         except Exception as e:
             print(f"Error listing models: {e}")
-            # Try to reconnect
-            if self.reconnect():
-                try:
-                    response = self.client.list()
-                    return response.get('models', [])
-                except:
-                    pass
+            self._record_failure(e)
             return []
+        self.breaker.record_success()
+        return response.get('models', [])
     
     def pull_model(self, model_name: str) -> bool:
         """Pull a model from Ollama."""
-        if not self.is_connected():
+        if not self.breaker.allow_request():
             print(f"Cannot pull model {model_name}: Not connected to Ollama")
             return False
         
         try:
             # This will pull the model if it doesn't exist
             self.client.chat(model=model_name, messages=[{"role": "user", "content": "ping"}])
-            return True
         except Exception as e:
             print(f"Error pulling model {model_name}: {e}")
+            self._record_failure(e)
             return False
+        self.breaker.record_success()
+        return True
     
     def chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Chat with a model."""
-        if not self.is_connected():
+        if not self.breaker.allow_request():
             print(f"Cannot chat with model {model}: Not connected to Ollama")
             return {}
         
@@ -88,49 +270,46 @@ class OllamaClient:
                 messages=messages,
                 options=options or {}
             )
-            return response
         except Exception as e:
             print(f"Error chatting with model {model}: {e}")
+            self._record_failure(e)
             return {}
+        self.breaker.record_success()
+        return response
     
     async def async_chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Asynchronously chat with a model."""
-        if not self.is_connected():
+        if not self.breaker.allow_request():
             print(f"Cannot async chat with model {model}: Not connected to Ollama")
             return {}
         
         try:
-            # Using asyncio to make the call non-blocking
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None, 
-                lambda: self.client.chat(
-                    model=model,
-                    messages=messages,
-                    options=options or {}
-                )
+            response = await ollama_clients.get_async_client(self.base_url).chat(
+                model=model,
+                messages=messages,
+                options=options or {}
             )
-            return response
         except Exception as e:
             print(f"Error asynchronously chatting with model {model}: {e}")
+            self._record_failure(e)
             return {}
+        self.breaker.record_success()
+        return response
 
 
 class OllamaMonitor:
     """Monitor for Ollama server status and model performance."""
     
-    def __init__(self, base_url: str = None):
+    def __init__(self, base_url: str = None, client: Optional[OllamaClient] = None):
         self.base_url = base_url or settings.OLLAMA_BASE_URL
-        self.client = OllamaClient(base_url)
+        self.client = client or OllamaClient(base_url)
     
     def check_server_status(self) -> bool:
         """Check if the Ollama server is running."""
-        try:
-            # Try to list models as a health check
-            self.client.list_models()
-            return True
-        except Exception:
-            return False
+        # Use the cached state once the server has been probed
+        if self.client.last_health_check is not None:
+            return self.client.is_connected()
+        return self.client.check_health()
     
     def get_model_info(self, model_name: str) -> Dict[str, Any]:
         """Get information about a specific model."""
@@ -155,5 +334,6 @@ class OllamaMonitor:
 
 
 # Global instance for easy access
+ollama_clients = OllamaClientRegistry()
 ollama_client = OllamaClient()
-ollama_monitor = OllamaMonitor()
\ No newline at end of file
+ollama_monitor = OllamaMonitor(client=ollama_client)
\ No newline at end of file
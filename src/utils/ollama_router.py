@@ -0,0 +1,212 @@
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Set
+import threading
+
+import httpx
+import ollama
+
+from src.utils.ollama_client import CircuitBreaker, ollama_clients
+from src.config import settings
+
+
+class NoHealthyHostError(RuntimeError):
+    """Raised when every Ollama host is ejected."""
+
+
+class OllamaHost:
+    """One Ollama endpoint with its health, load and model inventory."""
+
+    def __init__(self, base_url: str, client: Optional[ollama.Client] = None):
+        self.base_url = base_url.rstrip("/")
+        self.client = client or ollama_clients.get_client(self.base_url)
+        self.breaker = CircuitBreaker(
+            settings.OLLAMA_CIRCUIT_FAILURE_THRESHOLD,
+            settings.OLLAMA_CIRCUIT_RESET_TIMEOUT
+        )
+        # None until the first inventory refresh, then the set of model names
+        self.models: Optional[Set[str]] = None
+        self.outstanding = 0
+        self.served = 0
+        self.failures = 0
+
+    @property
+    def async_client(self) -> ollama.AsyncClient:
+        """Shared async client for this host on the running event loop."""
+        return ollama_clients.get_async_client(self.base_url)
+
+    def has_model(self, model: str) -> bool:
+        return self.models is None or normalize_model(model) in self.models
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "outstanding": self.outstanding,
+            "served": self.served,
+            "failures": self.failures,
+            "models": sorted(self.models) if self.models is not None else None
+        }
+
+
+def normalize_model(model: str) -> str:
+    """Model name with an explicit tag, as reported by /api/tags."""
+    return model if ":" in model else f"{model}:latest"
+
+
+def parse_hosts(hosts: str) -> List[str]:
+    """Split a comma-separated host list."""
+    return [host.strip() for host in hosts.split(",") if host.strip()]
+
+
+class OllamaRouter:
+    """Routes LLM calls across Ollama hosts.
+
+    Each call goes to the healthy host that has the model and the fewest
+    in-flight requests. Hosts whose connections fail are ejected by their
+    circuit breaker and re-admitted by a successful trial request or
+    inventory refresh. A call that cannot connect is retried on the next
+    host, since nothing reached the failed one.
+    """
+
+    def __init__(self, hosts: List[OllamaHost]):
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+        self.hosts = hosts
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._refresh_stop = threading.Event()
+
+    @classmethod
+    def from_urls(cls, base_urls: List[str]) -> "OllamaRouter":
+        return cls([OllamaHost(base_url) for base_url in base_urls])
+
+    def acquire(self, model: str, exclude: Optional[Set[OllamaHost]] = None) -> OllamaHost:
+        """Pick a host for a call and count it as in flight."""
+        exclude = exclude or set()
+        with self._lock:
+            candidates = [
+                host for host in self.hosts
+                if host not in exclude and host.breaker.state != CircuitBreaker.OPEN
+            ]
+            # Prefer hosts that already have the model, but any healthy host can pull it
+            with_model = [host for host in candidates if host.has_model(model)]
+            for host in sorted(with_model or candidates, key=lambda h: h.outstanding):
+                if host.breaker.allow_request():
+                    host.outstanding += 1
+                    return host
+        raise NoHealthyHostError(f"No healthy Ollama host available for {model}")
+
+    def release(self, host: OllamaHost, failed: bool = False) -> None:
+        """Finish a call and update the host's health."""
+        with self._lock:
+            host.outstanding -= 1
+            if failed:
+                host.failures += 1
+            else:
+                host.served += 1
+        if failed:
+            host.breaker.record_failure()
+        else:
+            host.breaker.record_success()
+
+    def call(self, model: str, fn: Callable[[OllamaHost], Any]) -> Any:
+        """Run ``fn(host)`` on the best host, failing over on connection errors."""
+        tried: Set[OllamaHost] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            try:
+                host = self.acquire(model, tried)
+            except NoHealthyHostError:
+                if last_error is not None:
+                    raise last_error
+                raise
+            try:
+                result = fn(host)
+            except (ConnectionError, httpx.ConnectError) as e:
+                self.release(host, failed=True)
+                tried.add(host)
+                last_error = e
+                continue
+            except httpx.TransportError:
+                self.release(host, failed=True)
+                raise
+            except ollama.ResponseError as e:
+                # A rejected request says nothing about the host, a server error does
+                self.release(host, failed=not 400 <= e.status_code < 500)
+                raise
+            except BaseException:
+                self.release(host)
+                raise
+            self.release(host)
+            return result
+
+    async def acall(self, model: str, fn: Callable[[OllamaHost], Awaitable[Any]]) -> Any:
+        """Await ``fn(host)`` on the best host, failing over on connection errors."""
+        tried: Set[OllamaHost] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            try:
+                host = self.acquire(model, tried)
+            except NoHealthyHostError:
+                if last_error is not None:
+                    raise last_error
+                raise
+            try:
+                result = await fn(host)
+            except (ConnectionError, httpx.ConnectError) as e:
+                self.release(host, failed=True)
+                tried.add(host)
+                last_error = e
+                continue
+            except httpx.TransportError:
+                self.release(host, failed=True)
+                raise
+            except ollama.ResponseError as e:
+                # A rejected request says nothing about the host, a server error does
+                self.release(host, failed=not 400 <= e.status_code < 500)
+                raise
+            except BaseException:
+                self.release(host)
+                raise
+            self.release(host)
+            return result
+
+    def refresh_inventory(self) -> None:
+        """Refresh each host's model list from /api/tags, re-admitting hosts that answer."""
+        for host in self.hosts:
+            try:
+                response = host.client.list()
+            except Exception:
+                host.breaker.record_failure()
+                continue
+            host.models = {normalize_model(model["model"]) for model in response.get("models", [])}
+            host.breaker.record_success()
+
+    def start_inventory_refresh(self, interval: Optional[float] = None) -> None:
+        """Refresh inventories periodically on a background thread."""
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        interval = interval or settings.OLLAMA_INVENTORY_REFRESH_INTERVAL
+        self._refresh_stop.clear()
+
+        def refresh():
+            while not self._refresh_stop.is_set():
+                self.refresh_inventory()
+                self._refresh_stop.wait(interval)
+
+        self._refresh_thread = threading.Thread(target=refresh, name="ollama-inventory", daemon=True)
+        self._refresh_thread.start()
+
+    def stop_inventory_refresh(self) -> None:
+        """Stop the background inventory refresh."""
+        self._refresh_stop.set()
+        if self._refresh_thread:
+            self._refresh_thread.join(timeout=5)
+            self._refresh_thread = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get per-host health, load and inventory."""
+        with self._lock:
+            return {host.base_url: host.get_stats() for host in self.hosts}
+
+
+# Global instance
+ollama_router = OllamaRouter.from_urls(parse_hosts(settings.OLLAMA_HOSTS) or [settings.OLLAMA_BASE_URL])
@@ -6,6 +6,8 @@ import json
 from datetime import datetime
 import os
 
+from src.utils.helpers import load_json_log
+
 
 class SecurityManager:
     """Security manager for the multi-agent system."""
@@ -95,16 +97,7 @@ class SecurityManager:
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
         
-        log_file = os.path.join(self.audit_log_path, f"audit_{date}.json")
-        
-        if os.path.exists(log_file):
-            try:
-                with open(log_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return []
-        
-        return []
+        return load_json_log(os.path.join(self.audit_log_path, f"audit_{date}.json"))
 
 
 class AccessControl:
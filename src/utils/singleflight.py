@@ -0,0 +1,96 @@
+from typing import Dict, Any, Callable, Optional, Tuple, Awaitable
+from concurrent.futures import Future
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still in flight wait for and share its result. Works
+    across threads and event loops, and between sync and async callers.
+
+    The leader may describe its call with a ``context`` value, which
+    ``on_join`` receives on every caller that joins it before that caller
+    starts waiting.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Tuple[Future, Any]] = {}
+        self._stats = {"executions": 0, "coalesced": 0}
+
+    def _join(self, key: str, context: Any,
+              on_join: Optional[Callable[[Any], None]]) -> Tuple[Future, bool]:
+        """Get the in-flight future for a key, or register a new one."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                future = Future()
+                self._calls[key] = (future, context)
+                self._stats["executions"] += 1
+                return future, True
+            self._stats["coalesced"] += 1
+            future, leader_context = call
+        if on_join:
+            on_join(leader_context)
+        return future, False
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key: str, fn: Callable[..., Any], *args, context: Any = None,
+           on_join: Optional[Callable[[Any], None]] = None, **kwargs) -> Tuple[Any, bool]:
+        """Run ``fn`` unless an identical call is in flight.
+
+        Returns the result and whether it was shared from another caller.
+        """
+        future, leader = self._join(key, context, on_join)
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._finish(key)
+
+    async def ado(self, key: str, fn: Callable[..., Awaitable[Any]], *args, context: Any = None,
+                  on_join: Optional[Callable[[Any], None]] = None, **kwargs) -> Tuple[Any, bool]:
+        """Asynchronously await ``fn`` unless an identical call is in flight."""
+        future, leader = self._join(key, context, on_join)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._finish(key)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get execution and coalescing counters."""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self._stats["executions"],
+                "coalesced": self._stats["coalesced"]
+            }
+
+
+# Global instances
+llm_singleflight = SingleFlight("llm")
+workflow_singleflight = SingleFlight("workflow")
@@ -0,0 +1,164 @@
+from typing import Dict, Any, List, Optional
+import threading
+import time
+
+from src.utils.ollama_client import CircuitBreaker
+from src.utils.ollama_router import OllamaHost, OllamaRouter, ollama_router, normalize_model
+from src.config import settings
+
+
+COLD = "cold"
+WARMING = "warming"
+LOADED = "loaded"
+
+
+def configured_models() -> List[str]:
+    """Models named in settings, in pipeline order."""
+    return list(dict.fromkeys([settings.QWEN_MODEL, settings.GEMMA_MODEL]))
+
+
+class ModelWarmupManager:
+    """Preloads configured models and keeps them resident while they are in use.
+
+    Models are loaded on every host with an empty generate request, which
+    loads the weights without producing tokens. Calls ask Ollama to keep a
+    model loaded for longer while it has recent traffic. A background check
+    lists the models each host has loaded; a host that comes back after
+    failing is taken to have restarted and is warmed again. Models evicted
+    to make room for another one, or unloaded when their keep-alive expires,
+    are only marked cold, so warming never fights the model scheduler or
+    keeps idle models resident.
+    """
+
+    def __init__(self, router: Optional[OllamaRouter] = None, models: Optional[List[str]] = None):
+        self.router = router or ollama_router
+        self.models = models or configured_models()
+        self._lock = threading.Lock()
+        self._status: Dict[str, Dict[str, str]] = {
+            host.base_url: {model: COLD for model in self.models} for host in self.router.hosts
+        }
+        self._last_used: Dict[str, float] = {}
+        self._host_down: Dict[str, bool] = {}
+        self._stats = {"warmups": 0, "failed_warmups": 0, "restarts_detected": 0}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def record_use(self, model: str) -> None:
+        """Note traffic for a model."""
+        with self._lock:
+            self._last_used[model] = time.time()
+
+    def keep_alive_for(self, model: str) -> str:
+        """How long Ollama should keep a model loaded after a call, based on recent traffic."""
+        with self._lock:
+            last_used = self._last_used.get(model)
+        if last_used is not None and time.time() - last_used <= settings.WARMUP_ACTIVE_WINDOW:
+            return settings.WARMUP_KEEP_ALIVE_ACTIVE
+        return settings.WARMUP_KEEP_ALIVE_IDLE
+
+    def _set_status(self, host: OllamaHost, model: str, status: str) -> None:
+        with self._lock:
+            self._status.setdefault(host.base_url, {})[model] = status
+
+    def warm(self, host: OllamaHost, model: str) -> bool:
+        """Load a model on a host without generating any tokens."""
+        self._set_status(host, model, WARMING)
+        try:
+            host.client.generate(model=model, prompt="", keep_alive=self.keep_alive_for(model))
+        except Exception:
+            self._set_status(host, model, COLD)
+            with self._lock:
+                self._stats["failed_warmups"] += 1
+            return False
+        self._set_status(host, model, LOADED)
+        with self._lock:
+            self._stats["warmups"] += 1
+        return True
+
+    def warm_host(self, host: OllamaHost) -> None:
+        """Load every configured model on a host."""
+        for model in self.models:
+            self.warm(host, model)
+
+    def warm_all(self) -> None:
+        """Load every configured model on every reachable host."""
+        for host in self.router.hosts:
+            if host.breaker.state != CircuitBreaker.OPEN:
+                self.warm_host(host)
+
+    def check_hosts(self) -> None:
+        """Refresh loaded status from each host and re-warm hosts that restarted."""
+        for host in self.router.hosts:
+            try:
+                loaded = {normalize_model(model["model"]) for model in host.client.ps().get("models", [])}
+            except Exception:
+                with self._lock:
+                    self._host_down[host.base_url] = True
+                for model in self.models:
+                    self._set_status(host, model, COLD)
+                continue
+
+            with self._lock:
+                if host.breaker.state != CircuitBreaker.CLOSED:
+                    # Calls or health checks are failing: warm the host again once it has recovered
+                    self._host_down[host.base_url] = True
+                    restarted = False
+                else:
+                    restarted = self._host_down.pop(host.base_url, False)
+                statuses = dict(self._status.get(host.base_url, {}))
+            # A host that stayed up with nothing loaded has only let idle models expire
+            if restarted:
+                with self._lock:
+                    self._stats["restarts_detected"] += 1
+                self.warm_host(host)
+                continue
+
+            for model in self.models:
+                if statuses.get(model) != WARMING:
+                    self._set_status(host, model, LOADED if normalize_model(model) in loaded else COLD)
+
+    def start(self, interval: Optional[float] = None) -> None:
+        """Warm all models, then keep checking the hosts on a background thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        interval = interval or settings.WARMUP_CHECK_INTERVAL
+        self._stop.clear()
+
+        def run():
+            self.warm_all()
+            while not self._stop.wait(interval):
+                self.check_hosts()
+
+        self._thread = threading.Thread(target=run, name="ollama-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background checks."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get each model's loaded/warming/cold status, overall and per host."""
+        with self._lock:
+            status = {}
+            for model in self.models:
+                hosts = {base_url: models.get(model, COLD) for base_url, models in self._status.items()}
+                if LOADED in hosts.values():
+                    overall = LOADED
+                elif WARMING in hosts.values():
+                    overall = WARMING
+                else:
+                    overall = COLD
+                status[model] = {"status": overall, "hosts": hosts, "last_used": self._last_used.get(model)}
+            return status
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get warm-up counters."""
+        with self._lock:
+            return dict(self._stats)
+
+
+# Global instance
+warmup_manager = ModelWarmupManager()
@@ -0,0 +1,153 @@
+from typing import Dict, Any, List, Optional, Sequence
+import re
+
+
+# Markup the repairer recognizes; anything else that starts with "<" is text
+MARKUP_PATTERN = re.compile(
+    r"<!--.*?-->"
+    r"|<!\[CDATA\[.*?\]\]>"
+    r"|<\?.*?\?>"
+    r"|<(/?)([A-Za-z_][\w.\-]*(?::[\w.\-]+)?)((?:\s+[^<>]*?)?)\s*(/?)>",
+    re.DOTALL
+)
+ATTRIBUTE_PATTERN = re.compile(r"([A-Za-z_][\w.\-:]*)(?:\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s\"'>]+))?")
+FENCE_PATTERN = re.compile(r"^[ \t]*```[\w-]*", re.MULTILINE)
+# Ampersands that do not start a character or predefined entity reference
+BARE_AMPERSAND = re.compile(r"&(?!#\d+;|#x[0-9a-fA-F]+;|(?:amp|lt|gt|quot|apos);)")
+
+# HTML elements models emit without closing them
+VOID_ELEMENTS = {"br", "hr", "img", "wbr"}
+
+
+def _escape_text(text: str) -> str:
+    return BARE_AMPERSAND.sub("&amp;", text).replace("<", "&lt;")
+
+
+def _repair_attributes(raw: str, repairs: List[str]) -> str:
+    """Quote, escape and de-duplicate the attributes of a start tag."""
+    attributes = []
+    seen = set()
+    for name, value in ATTRIBUTE_PATTERN.findall(raw):
+        if name in seen:
+            repairs.append("duplicate_attribute")
+            continue
+        seen.add(name)
+        if not value:
+            repairs.append("attribute_value")
+            value = name
+        elif value[0] in "\"'":
+            value = value[1:-1]
+        else:
+            repairs.append("attribute_quoting")
+        escaped = _escape_text(value).replace('"', "&quot;")
+        if escaped != value.replace('"', "&quot;"):
+            repairs.append("entity_escaping")
+        attributes.append(f' {name}="{escaped}"')
+    return "".join(attributes)
+
+
+def _extract_span(text: str, roots: Optional[Sequence[str]], repairs: List[str]) -> Optional[str]:
+    """Cut the output down to its XML: skip thinking, fences and prose around the root elements."""
+    think_end = text.rfind("</think>")
+    if think_end != -1:
+        text = text[think_end + len("</think>"):]
+        repairs.append("think_removed")
+    if "```" in text:
+        text = FENCE_PATTERN.sub("", text)
+        repairs.append("fence_stripped")
+
+    if roots:
+        match = re.search(f"<{re.escape(roots[0])}(?=[\\s/>])", text)
+        if match is None:
+            return None
+        start = match.start()
+        end = text.rfind(f"</{roots[-1]}>")
+        end = end + len(roots[-1]) + 3 if end > start else len(text)
+    else:
+        match = re.search(r"<[A-Za-z_]", text)
+        if match is None:
+            return None
+        start, end = match.start(), len(text)
+
+    if text[:start].strip() or text[end:].strip():
+        repairs.append("prose_removed")
+    return text[start:end]
+
+
+def repair_xml(text: str, roots: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Repair common defects in model-generated XML with deterministic rules.
+
+    The output is cut down to the span from the first ``roots[0]`` element
+    to the last ``roots[-1]`` element (or from the first element, without
+    ``roots``), dropping thinking, markdown fences and surrounding prose.
+    One pass over the markup then quotes attributes, escapes bare ``&`` and
+    ``<``, turns ``<br>`` into a newline, self-closes other HTML void
+    elements, closes elements left open by a mismatched end tag, drops end
+    tags that match nothing and closes whatever is still open at the end.
+    Runs in time linear in the output.
+
+    Returns the repaired XML (None when no root element is found) and the
+    kinds of repair applied.
+    """
+    repairs: List[str] = []
+    span = _extract_span(text, roots, repairs)
+    if span is None:
+        return {"xml": None, "repairs": repairs, "changed": False}
+
+    out: List[str] = []
+    stack: List[str] = []
+    position = 0
+    for match in MARKUP_PATTERN.finditer(span):
+        between = span[position:match.start()]
+        # Prose between top-level elements is not part of the document
+        if between and (stack or not between.strip()):
+            escaped = _escape_text(between)
+            if escaped != between:
+                repairs.append("entity_escaping")
+            out.append(escaped)
+        position = match.end()
+
+        closing, name, raw_attributes, self_closing = match.groups()
+        if name is None:
+            # Comments, CDATA and processing instructions
+            if not match.group(0).startswith("<?"):
+                out.append(match.group(0))
+            continue
+
+        if closing:
+            if name in stack:
+                while stack[-1] != name:
+                    out.append(f"</{stack.pop()}>")
+                    repairs.append("auto_closed")
+                stack.pop()
+                out.append(f"</{name}>")
+            else:
+                repairs.append("stray_end_tag")
+            continue
+
+        if name.lower() == "br":
+            # Line breaks in text fields, which the schemas type as plain strings
+            repairs.append("line_break")
+            out.append("\n")
+            continue
+        attributes = _repair_attributes(raw_attributes, repairs)
+        if self_closing or name.lower() in VOID_ELEMENTS:
+            if not self_closing:
+                repairs.append("void_element")
+            out.append(f"<{name}{attributes}/>")
+        else:
+            stack.append(name)
+            out.append(f"<{name}{attributes}>")
+
+    tail = span[position:]
+    if tail and stack:
+        escaped = _escape_text(tail)
+        if escaped != tail:
+            repairs.append("entity_escaping")
+        out.append(escaped)
+    while stack:
+        out.append(f"</{stack.pop()}>")
+        repairs.append("auto_closed")
+
+    repaired = "".join(out)
+    return {"xml": repaired, "repairs": sorted(set(repairs)), "changed": bool(repairs)}
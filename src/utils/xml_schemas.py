@@ -0,0 +1,432 @@
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
+import json
+import re
+import threading
+
+from src.config import settings
+
+
+# Free text that may also contain markup, used for descriptive fields
+TEXT_TYPE = """
+  <xs:complexType name="text" mixed="true">
+    <xs:sequence>
+      <xs:any processContents="skip" minOccurs="0" maxOccurs="unbounded"/>
+    </xs:sequence>
+    <xs:anyAttribute processContents="skip"/>
+  </xs:complexType>
+"""
+
+# Output of SeniorReasoningAgent: <reasoning>, <variables> and <conclusion> siblings,
+# validated under a synthetic <analysis> root
+REASONING_XSD = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">""" + TEXT_TYPE + """
+  <xs:simpleType name="stepType">
+    <xs:restriction base="xs:string">
+      <xs:enumeration value="analysis"/>
+      <xs:enumeration value="calculation"/>
+      <xs:enumeration value="inference"/>
+    </xs:restriction>
+  </xs:simpleType>
+
+  <xs:complexType name="step">
+    <xs:all>
+      <xs:element name="description" type="text"/>
+      <xs:element name="input" type="text" minOccurs="0"/>
+      <xs:element name="output" type="text" minOccurs="0"/>
+    </xs:all>
+    <xs:attribute name="id" type="xs:string" use="required"/>
+    <xs:attribute name="type" type="stepType"/>
+  </xs:complexType>
+
+  <xs:complexType name="var">
+    <xs:all>
+      <xs:element name="description" type="text" minOccurs="0"/>
+      <xs:element name="format" type="text" minOccurs="0"/>
+      <xs:element name="example" type="text" minOccurs="0"/>
+    </xs:all>
+    <xs:attribute name="name" type="xs:string" use="required"/>
+    <xs:attribute name="type" type="xs:string"/>
+    <xs:attribute name="required" type="xs:string"/>
+  </xs:complexType>
+
+  <xs:element name="analysis">
+    <xs:complexType>
+      <xs:all>
+        <xs:element name="reasoning">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="step" type="step" maxOccurs="unbounded"/>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+        <xs:element name="variables" minOccurs="0">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="var" type="var" minOccurs="0" maxOccurs="unbounded"/>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+        <xs:element name="conclusion">
+          <xs:complexType>
+            <xs:all>
+              <xs:element name="summary" type="text"/>
+              <xs:element name="next_steps" type="text" minOccurs="0"/>
+            </xs:all>
+          </xs:complexType>
+        </xs:element>
+      </xs:all>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+# Structure of the plan requested by TaskDelegationAgent.get_system_prompt.
+# Task children may come in any order; only the title and description are required.
+DELEGATION_XSD = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:simpleType name="priority">
+    <xs:restriction base="xs:string">
+      <xs:enumeration value="high"/>
+      <xs:enumeration value="medium"/>
+      <xs:enumeration value="low"/>
+    </xs:restriction>
+  </xs:simpleType>
+
+  <xs:complexType name="agent">
+    <xs:attribute name="role" type="xs:string" use="required"/>
+    <xs:attribute name="model" type="xs:string"/>
+    <xs:attribute name="capability" type="xs:string"/>
+  </xs:complexType>
+
+  <xs:complexType name="inputRequirements">
+    <xs:sequence>
+      <xs:element name="requirement" type="xs:string" minOccurs="0" maxOccurs="unbounded"/>
+    </xs:sequence>
+  </xs:complexType>
+
+  <xs:complexType name="validationRules">
+    <xs:sequence>
+      <xs:element name="rule" type="xs:string" minOccurs="0" maxOccurs="unbounded"/>
+    </xs:sequence>
+  </xs:complexType>
+
+  <xs:complexType name="outputSpecification">
+    <xs:all>
+      <xs:element name="format" type="xs:string" minOccurs="0"/>
+      <xs:element name="structure" type="xs:string" minOccurs="0"/>
+      <xs:element name="validation_rules" type="validationRules" minOccurs="0"/>
+    </xs:all>
+  </xs:complexType>
+
+  <xs:complexType name="task">
+    <xs:all>
+      <xs:element name="title" type="xs:string"/>
+      <xs:element name="description" type="xs:string"/>
+      <xs:element name="agent" type="agent" minOccurs="0"/>
+      <xs:element name="input_requirements" type="inputRequirements" minOccurs="0"/>
+      <xs:element name="output_specification" type="outputSpecification" minOccurs="0"/>
+      <xs:element name="time_estimation" type="xs:string" minOccurs="0"/>
+    </xs:all>
+    <xs:attribute name="id" type="xs:string" use="required"/>
+    <xs:attribute name="priority" type="priority"/>
+    <xs:attribute name="dependencies" type="xs:string"/>
+  </xs:complexType>
+
+  <xs:element name="delegation">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="task" type="task" maxOccurs="unbounded"/>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+# Output of XMLFormatterAgent
+VALIDATION_XSD = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">""" + TEXT_TYPE + """
+  <xs:complexType name="issue">
+    <xs:all>
+      <xs:element name="description" type="text"/>
+      <xs:element name="suggested_fix" type="text" minOccurs="0"/>
+    </xs:all>
+    <xs:attribute name="line" type="xs:string"/>
+    <xs:attribute name="severity" type="xs:string"/>
+  </xs:complexType>
+
+  <xs:element name="validation">
+    <xs:complexType>
+      <xs:all>
+        <xs:element name="input" type="text" minOccurs="0"/>
+        <xs:element name="schema_validation">
+          <xs:complexType>
+            <xs:all>
+              <xs:element name="status" type="xs:string"/>
+              <xs:element name="issues" minOccurs="0">
+                <xs:complexType>
+                  <xs:sequence>
+                    <xs:element name="issue" type="issue" minOccurs="0" maxOccurs="unbounded"/>
+                  </xs:sequence>
+                </xs:complexType>
+              </xs:element>
+            </xs:all>
+          </xs:complexType>
+        </xs:element>
+        <xs:element name="formatting" minOccurs="0">
+          <xs:complexType>
+            <xs:all>
+              <xs:element name="status" type="xs:string" minOccurs="0"/>
+              <xs:element name="formatted_output" type="text" minOccurs="0"/>
+            </xs:all>
+          </xs:complexType>
+        </xs:element>
+        <xs:element name="compliance" type="text" minOccurs="0"/>
+      </xs:all>
+      <xs:attribute name="source" type="xs:string"/>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+# Output of QualityAssuranceAgent
+QA_REPORT_XSD = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">""" + TEXT_TYPE + """
+  <xs:simpleType name="score">
+    <xs:restriction base="xs:decimal">
+      <xs:minInclusive value="0"/>
+      <xs:maxInclusive value="100"/>
+    </xs:restriction>
+  </xs:simpleType>
+
+  <xs:simpleType name="action">
+    <xs:restriction base="xs:string">
+      <xs:enumeration value="approve"/>
+      <xs:enumeration value="revise"/>
+      <xs:enumeration value="reject"/>
+    </xs:restriction>
+  </xs:simpleType>
+
+  <xs:element name="qa_report">
+    <xs:complexType>
+      <xs:all>
+        <xs:element name="metadata" type="text" minOccurs="0"/>
+        <xs:element name="completeness" type="text" minOccurs="0"/>
+        <xs:element name="accuracy">
+          <xs:complexType>
+            <xs:all>
+              <xs:element name="score" type="score"/>
+              <xs:element name="issues" type="text" minOccurs="0"/>
+            </xs:all>
+          </xs:complexType>
+        </xs:element>
+        <xs:element name="consistency" type="text" minOccurs="0"/>
+        <xs:element name="recommendation">
+          <xs:complexType>
+            <xs:all>
+              <xs:element name="action" type="action"/>
+              <xs:element name="details" type="text" minOccurs="0"/>
+            </xs:all>
+          </xs:complexType>
+        </xs:element>
+        <xs:element name="approval" type="text" minOccurs="0"/>
+      </xs:all>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+# Output of TaskWorkerAgent for one delegated task
+TASK_RESULT_XSD = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">""" + TEXT_TYPE + """
+  <xs:simpleType name="status">
+    <xs:restriction base="xs:string">
+      <xs:enumeration value="completed"/>
+      <xs:enumeration value="blocked"/>
+    </xs:restriction>
+  </xs:simpleType>
+
+  <xs:element name="task_result">
+    <xs:complexType>
+      <xs:all>
+        <xs:element name="status" type="status"/>
+        <xs:element name="output" type="text"/>
+        <xs:element name="notes" type="text" minOccurs="0"/>
+      </xs:all>
+      <xs:attribute name="id" type="xs:string"/>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+
+# Schema that validates each workflow state output
+OUTPUT_SCHEMAS = {
+    "problem_analysis": "reasoning",
+    "task_delegation": "delegation",
+    "xml_validation": "validation",
+    "final_qa_report": "qa_report"
+}
+
+
+def output_models() -> Dict[str, str]:
+    """Model that produces each workflow state output."""
+    return {
+        "problem_analysis": settings.QWEN_MODEL,
+        "task_delegation": settings.GEMMA_MODEL,
+        "xml_validation": settings.GEMMA_MODEL,
+        "final_qa_report": settings.QWEN_MODEL
+    }
+
+
+def checkpoint_outputs(checkpoint_data: Dict[str, Any]) -> Dict[str, str]:
+    """Agent outputs stored in a checkpoint, keyed by state key."""
+    state = checkpoint_data.get("state") or {}
+    return {key: state[key] for key in OUTPUT_SCHEMAS if state.get(key)}
+
+
+def load_checkpoint_outputs(path: str) -> Dict[str, str]:
+    """Agent outputs stored in a checkpoint JSON file, keyed by state key."""
+    try:
+        with open(path, "r") as f:
+            return checkpoint_outputs(json.load(f))
+    except (OSError, ValueError):
+        return {}
+
+
+def extract_element(text: str, tag: str, last_tag: Optional[str] = None) -> Optional[str]:
+    """Return the span from the first ``<tag>`` to the last ``</last_tag>`` in model output, ignoring surrounding prose."""
+    last_tag = last_tag or tag
+    # Skip the model's thinking, which often quotes the tags it is about to write
+    think_end = text.rfind("</think>")
+    if think_end != -1:
+        text = text[think_end + len("</think>"):]
+    start = re.search(f"<{re.escape(tag)}(?=[\\s/>])", text)
+    end = text.rfind(f"</{last_tag}>")
+    if start is None or end < start.start():
+        return None
+    return text[start.start():end + len(last_tag) + 3]
+
+
+class SchemaRegistry:
+    """Compiled XML schemas for agent outputs.
+    
+    Each schema names the root elements an output spans; outputs with
+    several top-level elements are validated under a synthetic wrapper
+    root. lxml parsers and validators must not be shared between threads,
+    so every thread compiles its own copy once, on first use.
+    """
+    
+    def __init__(self):
+        self._sources: Dict[str, Tuple[str, List[str], Optional[str]]] = {}
+        self._local = threading.local()
+    
+    def register(self, name: str, xsd: str, roots: List[str], wrapper: Optional[str] = None) -> None:
+        """Register a schema whose outputs span the ``roots`` elements, in order."""
+        self._sources[name] = (xsd, roots, wrapper)
+        etree.XMLSchema(etree.fromstring(xsd.encode("utf-8")))
+    
+    def _compiled(self) -> Dict[str, etree.XMLSchema]:
+        """This thread's compiled schemas and parser."""
+        compiled = getattr(self._local, "schemas", None)
+        if compiled is None:
+            compiled = self._local.schemas = {
+                name: etree.XMLSchema(etree.fromstring(xsd.encode("utf-8")))
+                for name, (xsd, _, _) in self._sources.items()
+            }
+            # Hardened parser: no entity expansion or network access
+            self._local.parser = etree.XMLParser(resolve_entities=False, no_network=True, remove_blank_text=True)
+        return compiled
+    
+    @property
+    def names(self) -> List[str]:
+        return list(self._sources)
+    
+    @property
+    def parser(self) -> etree.XMLParser:
+        """This thread's hardened parser: no entity expansion or network access."""
+        self._compiled()
+        return self._local.parser
+    
+    def roots(self, name: str) -> List[str]:
+        """First and last top-level elements of outputs checked by a schema."""
+        return list(self._sources[name][1])
+    
+    def parse_and_validate(self, name: str, text: str) -> Tuple[Optional[etree._Element], List[str]]:
+        """Parse an output and check it against a schema.
+        
+        Returns the parsed root (None if the output has no parsable element)
+        and the validation errors.
+        """
+        schema = self._compiled()[name]
+        _, roots, wrapper = self._sources[name]
+        
+        fragment = extract_element(text, roots[0], roots[-1])
+        if fragment is None:
+            return None, [f"No <{roots[0]}> element found"]
+        if wrapper:
+            fragment = f"<{wrapper}>{fragment}</{wrapper}>"
+        
+        try:
+            root = etree.fromstring(fragment.encode("utf-8"), self._local.parser)
+        except etree.XMLSyntaxError as e:
+            return None, [f"XML Parse Error: {e}"]
+        
+        if schema.validate(root):
+            return root, []
+        return root, [f"line {error.line}: {error.message}" for error in schema.error_log]
+    
+    def validate(self, name: str, text: str) -> Dict[str, Any]:
+        """Check an output against a schema."""
+        root, errors = self.parse_and_validate(name, text)
+        return {"schema": name, "valid": not errors, "well_formed": root is not None, "errors": errors}
+    
+    def validate_batch(self, items: Iterable[Tuple[str, str]], max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Validate ``(schema name, text)`` pairs in parallel."""
+        items = list(items)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(lambda item: self.validate(*item), items, chunksize=64))
+    
+    def validate_checkpoints(self, checkpoints: Iterable[Dict[str, Any]], max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """Validate every agent output stored in the given checkpoints and report conformance per schema and model."""
+        models = output_models()
+        
+        def check(checkpoint_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+            results = []
+            for output_key, text in checkpoint_outputs(checkpoint_data).items():
+                result = self.validate(OUTPUT_SCHEMAS[output_key], text)
+                result["model"] = models[output_key]
+                results.append(result)
+            return results
+        
+        checkpoints = list(checkpoints)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = [result for checkpoint_results in pool.map(check, checkpoints) for result in checkpoint_results]
+        
+        report = {"checkpoints": len(checkpoints), "outputs": len(results), "by_schema": {}, "by_model": {}}
+        for result in results:
+            for group, key in (("by_schema", result["schema"]), ("by_model", result["model"])):
+                entry = report[group].setdefault(key, {"validated": 0, "valid": 0, "well_formed": 0})
+                entry["validated"] += 1
+                entry["valid"] += result["valid"]
+                entry["well_formed"] += result["well_formed"]
+        for group in ("by_schema", "by_model"):
+            for entry in report[group].values():
+                entry["conformance_rate"] = entry["valid"] / entry["validated"]
+        return report
+
+
+def create_schema_registry() -> SchemaRegistry:
+    """Build the registry with a schema per agent output."""
+    registry = SchemaRegistry()
+    registry.register("reasoning", REASONING_XSD, ["reasoning", "conclusion"], wrapper="analysis")
+    registry.register("delegation", DELEGATION_XSD, ["delegation"])
+    registry.register("validation", VALIDATION_XSD, ["validation"])
+    registry.register("qa_report", QA_REPORT_XSD, ["qa_report"])
+    registry.register("task_result", TASK_RESULT_XSD, ["task_result"])
+    return registry
+
+
+# Global instance
+schema_registry = create_schema_registry()
@@ -0,0 +1,153 @@
+from typing import Dict, Any, Callable, Optional, Sequence
+from lxml import etree
+import re
+import threading
+
+from src.config import settings
+
+
+# Start or end tag, used to find where the XML begins in a model's output
+TAG_PATTERN = re.compile(r"<(/?)([A-Za-z_][\w.\-]*)")
+
+# Synthetic root that lets outputs with several top-level elements parse as one document
+STREAM_ROOT = "stream"
+
+
+class MalformedStreamError(ValueError):
+    """Raised when streamed model output can no longer become the expected XML."""
+
+    def __init__(self, reason: str, partial: str = ""):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial = partial
+
+
+class IncrementalXMLValidator:
+    """Parses model output as it streams and fails as soon as its structure breaks.
+
+    Text before the first element, including ``<think>`` blocks, is skipped.
+    From the first element on, tokens are fed to a pull parser under a
+    synthetic root, so an unexpected close tag, an element outside ``roots``
+    or any other syntax error is reported when the offending token arrives
+    rather than after the whole generation. Elements that complete directly
+    under a root element (a ``<step>``, a ``<task>``) are passed to
+    ``on_element`` as soon as their closing tag is parsed.
+
+    A non-strict validator records the first error in ``error`` and stops
+    parsing instead of raising.
+    """
+
+    def __init__(self, roots: Sequence[str], on_element: Optional[Callable[[etree._Element], None]] = None,
+                 max_preamble: Optional[int] = None, strict: bool = True):
+        self.roots = list(roots)
+        self.on_element = on_element
+        self.max_preamble = max_preamble if max_preamble is not None else settings.STREAM_XML_MAX_PREAMBLE
+        self.strict = strict
+        self.error: Optional[str] = None
+        self.elements = 0
+        self._parser: Optional[etree.XMLPullParser] = None
+        self._pending = ""
+        self._scan_from = 0
+        self._in_think = False
+        self._think_end = 0
+        self._depth = 0
+
+    @property
+    def started(self) -> bool:
+        """Whether the XML part of the output has begun."""
+        return self._parser is not None
+
+    def feed(self, token: str) -> None:
+        """Parse the next chunk of output."""
+        if self.error is not None or not token:
+            return
+        try:
+            if self._parser is None:
+                self._pending += token
+                start = self._find_start()
+                if start is None:
+                    return
+                token = self._pending[start:]
+                self._pending = ""
+                self._parser = etree.XMLPullParser(
+                    events=("start", "end"), resolve_entities=False, no_network=True
+                )
+                self._parser.feed(f"<{STREAM_ROOT}>")
+            self._parser.feed(token)
+            self._read_events()
+        except etree.XMLSyntaxError as e:
+            self._fail(f"XML Parse Error: {e}")
+        except MalformedStreamError as e:
+            self._fail(e.reason)
+
+    def _fail(self, reason: str) -> None:
+        self.error = reason
+        if self.strict:
+            raise MalformedStreamError(reason)
+
+    def _find_start(self) -> Optional[int]:
+        """Index of the first root element in the buffered preamble, if it has arrived."""
+        text = self._pending
+        while True:
+            match = TAG_PATTERN.search(text, self._scan_from)
+            if match is None or match.end() == len(text):
+                # Nothing yet, or a tag name that may still be growing
+                partial = match.start() if match else text.rfind("<", self._scan_from)
+                self._scan_from = partial if partial != -1 else len(text)
+                break
+            closing, name = match.groups()
+            self._scan_from = match.end()
+            if name == "think":
+                self._in_think = not closing
+                if closing:
+                    self._think_end = match.end()
+                continue
+            if self._in_think:
+                continue
+            if closing:
+                raise MalformedStreamError(f"Unexpected closing tag </{name}> before <{self.roots[0]}>")
+            if name not in self.roots:
+                raise MalformedStreamError(f"Expected <{self.roots[0]}> but the output starts with <{name}>")
+            return match.start()
+
+        if not self._in_think and len(text) - self._think_end > self.max_preamble:
+            raise MalformedStreamError(f"No <{self.roots[0]}> element in the first {self.max_preamble} characters")
+        return None
+
+    def _read_events(self) -> None:
+        for event, element in self._parser.read_events():
+            if element.tag == STREAM_ROOT:
+                continue
+            if event == "start":
+                self._depth += 1
+                if self._depth == 1 and element.tag not in self.roots:
+                    raise MalformedStreamError(f"Unexpected top-level element <{element.tag}>")
+                continue
+            if self._depth == 2:
+                self.elements += 1
+                if self.on_element:
+                    self.on_element(element)
+            self._depth -= 1
+
+
+class StreamValidationStats:
+    """Counts streamed generations by how incremental validation ended."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, agent: str, outcome: str) -> None:
+        """Record an outcome: ``passed``, ``retried`` or ``failed``."""
+        with self._lock:
+            stats = self._stats.setdefault(agent, {"passed": 0, "retried": 0, "failed": 0})
+            stats[outcome] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get outcome counts per agent."""
+        with self._lock:
+            return {agent: dict(stats) for agent, stats in self._stats.items()}
+
+
+# Global instance
+stream_validation_stats = StreamValidationStats()
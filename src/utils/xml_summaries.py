@@ -0,0 +1,179 @@
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from lxml import etree
+import hashlib
+import threading
+
+from src.utils.xml_repair import repair_xml
+from src.utils.xml_schemas import OUTPUT_SCHEMAS, extract_element, schema_registry
+from src.config import settings
+
+
+# Severities that send a QA report to human review
+BLOCKING_SEVERITIES = ("critical", "major")
+
+
+def parse_output(output_key: str, text: str) -> Optional[etree._Element]:
+    """Parse an agent output into a tree, repairing it first if it is malformed.
+
+    Outputs with several top-level elements are returned under an
+    ``<output>`` root. Returns None when the output has no root element.
+    """
+    roots = schema_registry.roots(OUTPUT_SCHEMAS[output_key])
+    fragment = extract_element(text, roots[0], roots[-1])
+    if fragment is not None:
+        try:
+            return etree.fromstring(f"<output>{fragment}</output>".encode("utf-8"), schema_registry.parser)
+        except etree.XMLSyntaxError:
+            pass
+    repaired = repair_xml(text, roots)["xml"]
+    if repaired is None:
+        return None
+    try:
+        return etree.fromstring(f"<output>{repaired}</output>".encode("utf-8"), schema_registry.parser)
+    except etree.XMLSyntaxError:
+        return None
+
+
+def _text(element: Optional[etree._Element], path: str) -> Optional[str]:
+    value = element.findtext(path) if element is not None else None
+    return value.strip() if value and value.strip() else None
+
+
+def _issues(parent: Optional[etree._Element]) -> List[Dict[str, Any]]:
+    if parent is None:
+        return []
+    return [
+        {
+            "severity": (issue.get("severity") or "").lower() or None,
+            "description": _text(issue, "description") or (issue.text or "").strip() or None
+        }
+        for issue in parent.iter("issue")
+    ]
+
+
+def _summarize_analysis(tree: etree._Element) -> Dict[str, Any]:
+    return {
+        "steps": [
+            {"id": step.get("id"), "type": step.get("type"), "description": _text(step, "description")}
+            for step in tree.iterfind("reasoning/step")
+        ],
+        "variables": [var.get("name") for var in tree.iterfind("variables/var")],
+        "conclusion": _text(tree, "conclusion/summary")
+    }
+
+
+def _summarize_delegation(tree: etree._Element) -> Dict[str, Any]:
+    return {
+        "tasks": [
+            {
+                "id": task.get("id"),
+                "title": _text(task, "title"),
+                "description": _text(task, "description"),
+                "requirements": [
+                    "".join(requirement.itertext()).strip()
+                    for requirement in task.iterfind("input_requirements/requirement")
+                ],
+                "priority": task.get("priority"),
+                "dependencies": [dep.strip() for dep in (task.get("dependencies") or "").split(",") if dep.strip()],
+                "agent_role": task.find("agent").get("role") if task.find("agent") is not None else None
+            }
+            for task in tree.iterfind("delegation/task")
+        ]
+    }
+
+
+def _summarize_validation(tree: etree._Element) -> Dict[str, Any]:
+    validation = tree.find("validation")
+    return {
+        "status": _text(validation, "schema_validation/status"),
+        "source": validation.get("source", "model") if validation is not None else None,
+        "issues": _issues(validation.find("schema_validation/issues") if validation is not None else None)
+    }
+
+
+def _summarize_qa_report(tree: etree._Element) -> Dict[str, Any]:
+    report = tree.find("qa_report")
+    score = _text(report, "accuracy/score")
+    try:
+        score = float(score) if score is not None else None
+    except ValueError:
+        score = None
+    issues = _issues(report)
+    severities: Dict[str, int] = {}
+    for issue in issues:
+        if issue["severity"]:
+            severities[issue["severity"]] = severities.get(issue["severity"], 0) + 1
+    action = _text(report, "recommendation/action")
+    return {
+        "score": score,
+        "action": action.lower() if action else None,
+        "issues": issues,
+        "severities": severities
+    }
+
+
+SUMMARIZERS = {
+    "problem_analysis": _summarize_analysis,
+    "task_delegation": _summarize_delegation,
+    "xml_validation": _summarize_validation,
+    "final_qa_report": _summarize_qa_report
+}
+
+
+class OutputSummaryCache:
+    """Typed summaries of agent outputs, parsed once per distinct output.
+
+    Each summary is a plain dict of the fields that routing, exports and
+    dashboards query (steps, tasks, issue severities, QA score), so it can
+    travel in the workflow state and in checkpoints. Summaries are cached
+    by output content, so an output is parsed at most once however many
+    consumers ask for it.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.OUTPUT_SUMMARY_CACHE_SIZE
+        self._entries: "OrderedDict[tuple, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def summarize(self, output_key: str, text: str) -> Optional[Dict[str, Any]]:
+        """Summary of an output, or None if it has no parsable root element."""
+        if output_key not in SUMMARIZERS or not text:
+            return None
+        key = (output_key, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._entries[key]
+            self._stats["misses"] += 1
+
+        tree = parse_output(output_key, text)
+        summary = SUMMARIZERS[output_key](tree) if tree is not None else None
+        with self._lock:
+            self._entries[key] = summary
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return summary
+
+    def from_state(self, state: Dict[str, Any], output_key: str) -> Optional[Dict[str, Any]]:
+        """Summary carried in a workflow state, computed if the state predates summaries."""
+        summary = (state.get("summaries") or {}).get(output_key)
+        if summary is None:
+            summary = self.summarize(output_key, state.get(output_key, ""))
+        return summary
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get cache hit counts and size."""
+        with self._lock:
+            total = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": self._stats["hits"] / total if total else 0
+            }
+
+
+# Global instance
+output_summaries = OutputSummaryCache()
@@ -1,5 +1,9 @@
 from .state import AgentState
 from .engine import WorkflowEngine
+from .executor import WorkflowExecutor, WorkflowQueueFullError
 from .tracing import tracer, checkpoint_storage
+from .checkpointer import SQLiteCheckpointSaver
+from .checkpoint_writer import CheckpointWriter, checkpoint_writer
+from .retention import RetentionService
 
-__all__ = ["AgentState", "WorkflowEngine", "tracer", "checkpoint_storage"]
\ No newline at end of file
+__all__ = ["AgentState", "WorkflowEngine", "WorkflowExecutor", "WorkflowQueueFullError", "tracer", "checkpoint_storage", "SQLiteCheckpointSaver", "CheckpointWriter", "checkpoint_writer", "RetentionService"]
@@ -0,0 +1,164 @@
+from typing import Dict, Any, Optional
+from collections import OrderedDict
+import atexit
+import threading
+import time
+
+from src.workflow.tracing import CheckpointStorage, checkpoint_storage
+from src.utils.debug_logger import debug_logger
+from src.config import settings
+
+
+class CheckpointWriter:
+    """Write-behind persistence for workflow checkpoints.
+
+    ``save`` only queues a checkpoint; a background thread writes queued
+    checkpoints to the storage in batched transactions. A session queued
+    again before it is written keeps only its latest checkpoint. The queue
+    holds at most ``max_queue_size`` sessions; a checkpoint for a new
+    session that does not fit is dropped and counted rather than blocking
+    the caller. ``stop`` writes everything still queued before returning.
+    """
+
+    def __init__(self, storage: Optional[CheckpointStorage] = None, max_queue_size: Optional[int] = None,
+                 batch_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.storage = storage or checkpoint_storage
+        self.max_queue_size = max_queue_size or settings.CHECKPOINT_WRITER_QUEUE_SIZE
+        self.batch_size = batch_size or settings.CHECKPOINT_WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else settings.CHECKPOINT_WRITER_FLUSH_INTERVAL
+        # session ID -> (sequence number, queued at, checkpoint), oldest first
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._sequence = 0
+        self._written_sequence = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._stats = {
+            "queued": 0,
+            "coalesced": 0,
+            "written": 0,
+            "batches": 0,
+            "dropped": 0,
+            "failed_batches": 0,
+            "max_lag": 0.0
+        }
+
+    def start(self) -> None:
+        """Start the background writer."""
+        with self._condition:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+            self._thread.start()
+        # Write whatever is still queued when the interpreter exits
+        atexit.unregister(self.stop)
+        atexit.register(self.stop)
+
+    def save(self, session_id: str, checkpoint_data: Dict[str, Any]) -> bool:
+        """Queue a checkpoint for writing; returns False if it was dropped because the queue is full."""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        with self._condition:
+            if session_id in self._pending:
+                self._pending.pop(session_id)
+                self._stats["coalesced"] += 1
+            elif len(self._pending) >= self.max_queue_size:
+                self._stats["dropped"] += 1
+                return False
+            self._sequence += 1
+            self._pending[session_id] = (self._sequence, time.time(), checkpoint_data)
+            self._stats["queued"] += 1
+            self._condition.notify_all()
+        return True
+
+    def load_checkpoint(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Load a checkpoint, including one that is still queued."""
+        with self._condition:
+            pending = self._pending.get(session_id)
+        return pending[2] if pending else self.storage.load_checkpoint(session_id)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                if not self._stopping:
+                    # Let more checkpoints arrive so they share a transaction
+                    self._condition.wait(self.flush_interval)
+            self._write_batch()
+
+    def _write_batch(self) -> None:
+        """Write the oldest queued checkpoints in one transaction."""
+        with self._condition:
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                session_id, entry = self._pending.popitem(last=False)
+                batch.append((session_id, entry))
+        if not batch:
+            return
+
+        try:
+            self.storage.save_checkpoints([(session_id, entry[2]) for session_id, entry in batch])
+        except Exception as e:
+            debug_logger.log("ERROR", "CHECKPOINT", f"Failed to write {len(batch)} checkpoints", {"error": str(e)})
+            with self._condition:
+                self._stats["failed_batches"] += 1
+                if self._stopping:
+                    self._stats["dropped"] += len(batch)
+                    self._written_sequence = max(self._written_sequence, batch[-1][1][0])
+                else:
+                    # Queue them again unless a newer checkpoint of the session arrived meanwhile
+                    for session_id, entry in reversed(batch):
+                        if session_id not in self._pending:
+                            self._pending[session_id] = entry
+                            self._pending.move_to_end(session_id, last=False)
+                self._condition.notify_all()
+            if not self._stopping:
+                time.sleep(self.flush_interval or 0.1)
+            return
+
+        now = time.time()
+        with self._condition:
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["max_lag"] = max(self._stats["max_lag"], now - batch[0][1][1])
+            self._written_sequence = max(self._written_sequence, batch[-1][1][0])
+            self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every checkpoint queued so far has been written; returns False on timeout."""
+        if self._pending:
+            self.start()
+        with self._condition:
+            target = self._sequence
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: self._written_sequence >= target, timeout)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Write everything still queued, then stop the background writer."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout)
+        self._thread = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get queue depth, lag and write counters."""
+        now = time.time()
+        with self._condition:
+            oldest = next(iter(self._pending.values()), None)
+            return {
+                **self._stats,
+                "pending": len(self._pending),
+                "max_queue_size": self.max_queue_size,
+                "lag": now - oldest[1] if oldest else 0.0
+            }
+
+
+# Global instance
+checkpoint_writer = CheckpointWriter()
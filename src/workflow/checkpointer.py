@@ -0,0 +1,443 @@
+from typing import Dict, Any, Iterator, AsyncIterator, Optional, Sequence, Tuple
+from collections import OrderedDict
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.config import settings
+
+
+def encode_delta(previous: Any, value: Any) -> Optional[Any]:
+    """What ``value`` adds to ``previous``, or None if it is not an extension of it.
+
+    Lists that only had items appended yield the new items; dicts that only
+    had keys added or replaced yield those keys.
+    """
+    if isinstance(previous, list) and isinstance(value, list):
+        if len(value) >= len(previous) and value[:len(previous)] == previous:
+            return value[len(previous):]
+    elif isinstance(previous, dict) and isinstance(value, dict):
+        if previous.keys() <= value.keys():
+            return {key: item for key, item in value.items() if key not in previous or previous[key] != item}
+    return None
+
+
+def apply_delta(base: Any, delta: Any) -> Any:
+    """Rebuild a value from the value it extends and its delta."""
+    return base + delta if isinstance(base, list) else {**base, **delta}
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """Durable LangGraph checkpointer backed by a single WAL-mode SQLite file.
+
+    A checkpoint row holds only the channel versions; each channel value is
+    stored once per version, and only for the channels a step changed.
+    Lists and dicts that a step only appended to or added keys to (logs,
+    messages, summaries, task results) are stored as a delta on the previous
+    version, with a full copy every ``max_delta_chain`` versions, so a write
+    scales with what the node changed rather than with the whole state.
+    Any stored checkpoint is rebuilt from its base values and deltas on read.
+
+    Values are encoded with the saver's serializer (msgpack). Only the newest
+    ``keep_per_thread`` checkpoints of a thread are kept, along with the
+    values they need; a run can always be continued from the latest one,
+    together with the writes of the nodes that finished before it stopped.
+    """
+
+    # Latest value written per (thread, namespace, channel), the base for the next delta
+    value_cache_size = 4096
+
+    def __init__(self, db_path: str, keep_per_thread: Optional[int] = None,
+                 max_delta_chain: Optional[int] = None, serde=None):
+        super().__init__(serde=serde)
+        self.db_path = db_path
+        self.keep_per_thread = keep_per_thread if keep_per_thread is not None else settings.GRAPH_CHECKPOINT_KEEP_PER_THREAD
+        self.max_delta_chain = max_delta_chain if max_delta_chain is not None else settings.GRAPH_CHECKPOINT_MAX_DELTA_CHAIN
+        self._last_values: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._stats = {"checkpoint_bytes": 0, "value_bytes": 0, "write_bytes": 0, "full_values": 0, "delta_values": 0}
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # Freed pages can be returned to the file system a few at a time (new databases only)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, "
+            "parent_id TEXT, type TEXT NOT NULL, checkpoint BLOB NOT NULL, "
+            "metadata_type TEXT NOT NULL, metadata BLOB NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS writes ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, "
+            "task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL, "
+            "type TEXT NOT NULL, value BLOB NOT NULL, task_path TEXT NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+        )
+        # A value with a base_version is a delta on that version of the channel
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS channel_values ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL, version TEXT NOT NULL, "
+            "base_version TEXT, type TEXT NOT NULL, value BLOB NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, channel, version))"
+        )
+        self._conn.commit()
+
+    def _row_to_tuple(self, thread_id: str, checkpoint_ns: str, row: tuple,
+                      metadata: Optional[CheckpointMetadata] = None) -> CheckpointTuple:
+        """Build a checkpoint tuple with its pending writes (lock must be held)."""
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata_blob = row
+        writes = self._conn.execute(
+            "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        writes.sort(key=lambda write: writes_sort_key(write[5], write[0], write[1]))
+        checkpoint = self.serde.loads_typed((type_, checkpoint))
+        if "channel_values" not in checkpoint:
+            checkpoint["channel_values"] = self._load_values(thread_id, checkpoint_ns, checkpoint["channel_versions"])
+        return CheckpointTuple(
+            config=self._config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint=checkpoint,
+            metadata=metadata if metadata is not None else self.serde.loads_typed((metadata_type, metadata_blob)),
+            parent_config=self._config(thread_id, checkpoint_ns, parent_id) if parent_id else None,
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, _, channel, value_type, value, _ in writes
+            ]
+        )
+
+    def _load_values(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        """Rebuild channel values from their stored versions (lock must be held)."""
+        values = {}
+        for channel, version in versions.items():
+            # Follow the deltas back to a full value, then apply them forward
+            chain = []
+            current = str(version)
+            while current is not None:
+                row = self._conn.execute(
+                    "SELECT base_version, type, value FROM channel_values "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                    (thread_id, checkpoint_ns, channel, current)
+                ).fetchone()
+                if row is None:
+                    chain = []
+                    break
+                chain.append(row)
+                current = row[0]
+            if not chain or chain[-1][1] == "empty":
+                continue
+            value = self.serde.loads_typed(chain[-1][1:])
+            for _, type_, delta in reversed(chain[:-1]):
+                value = apply_delta(value, self.serde.loads_typed((type_, delta)))
+            values[channel] = value
+        return values
+
+    @staticmethod
+    def _config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id
+            }
+        }
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Get the checkpoint named in the config, or the latest one of its thread."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        query = (
+            "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+            "WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        with self._lock:
+            if checkpoint_id:
+                row = self._conn.execute(
+                    query + " AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    query + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)
+                ).fetchone()
+            return self._row_to_tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        """List checkpoints, newest first, matching the config, metadata filter and ``before`` bound."""
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata "
+                f"FROM checkpoints{where} ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC",
+                params
+            ).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                metadata = self.serde.loads_typed((row[4], row[5]))
+                if filter and not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+                results.append(self._row_to_tuple(thread_id, checkpoint_ns, tuple(row), metadata))
+        yield from results
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """Store a checkpoint with the values of the channels it changed, then apply the retention limit."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        stored = checkpoint.copy()
+        values = stored.pop("channel_values")
+        type_, blob = self.serde.dumps_typed(stored)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            rows = [
+                (thread_id, checkpoint_ns, channel, str(version),
+                 *self._encode_value(thread_id, checkpoint_ns, channel, str(version), values))
+                for channel, version in new_versions.items()
+            ]
+            self._conn.executemany("INSERT OR REPLACE INTO channel_values VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_id, "
+                "type, checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, blob, metadata_type, metadata_blob)
+            )
+            self._stats["checkpoint_bytes"] += len(blob) + len(metadata_blob)
+            self._stats["value_bytes"] += sum(len(row[6]) for row in rows)
+            if self.keep_per_thread:
+                self._prune(thread_id, checkpoint_ns)
+            self._conn.commit()
+        return self._config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def _encode_value(self, thread_id: str, checkpoint_ns: str, channel: str, version: str,
+                      values: Dict[str, Any]) -> Tuple[Optional[str], str, bytes]:
+        """Encode one channel version as a full value or a delta on the last one written (lock must be held)."""
+        key = (thread_id, checkpoint_ns, channel)
+        if channel not in values:
+            self._last_values.pop(key, None)
+            return None, "empty", b""
+
+        value = values[channel]
+        last = self._last_values.pop(key, None)
+        delta = None
+        if last is not None and last[2] < self.max_delta_chain:
+            delta = encode_delta(last[1], value)
+        if delta is None:
+            base_version, chain = None, 0
+            type_, blob = self.serde.dumps_typed(value)
+            self._stats["full_values"] += 1
+        else:
+            base_version, chain = last[0], last[2] + 1
+            type_, blob = self.serde.dumps_typed(delta)
+            self._stats["delta_values"] += 1
+
+        # Keep a shallow copy, so an in-place append is still seen as a change next time
+        if isinstance(value, (list, dict)):
+            self._last_values[key] = (version, type(value)(value), chain)
+            while len(self._last_values) > self.value_cache_size:
+                self._last_values.popitem(last=False)
+        return base_version, type_, blob
+
+    def _prune(self, thread_id: str, checkpoint_ns: str, keep: Optional[int] = None) -> None:
+        """Delete all but the newest checkpoints of a thread, with the writes and values only they used (lock must be held)."""
+        row = self._conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, (keep or self.keep_per_thread) - 1)
+        ).fetchone()
+        if row is None:
+            return
+        deleted = 0
+        for table in ("checkpoints", "writes"):
+            deleted += self._conn.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, row[0])
+            ).rowcount
+        if deleted:
+            self._collect_values(thread_id, checkpoint_ns)
+
+    def _collect_values(self, thread_id: str, checkpoint_ns: str) -> None:
+        """Delete channel values that no remaining checkpoint reads, directly or as a delta base (lock must be held)."""
+        live = set()
+        for type_, blob in self._conn.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns)
+        ):
+            live.update((channel, str(version)) for channel, version in
+                        self.serde.loads_typed((type_, blob))["channel_versions"].items())
+        bases = {
+            (channel, version): base_version
+            for channel, version, base_version in self._conn.execute(
+                "SELECT channel, version, base_version FROM channel_values WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns)
+            )
+        }
+        for channel, version in list(live):
+            base_version = bases.get((channel, version))
+            while base_version is not None and (channel, base_version) not in live:
+                live.add((channel, base_version))
+                base_version = bases.get((channel, base_version))
+        self._conn.executemany(
+            "DELETE FROM channel_values WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            [(thread_id, checkpoint_ns, *key) for key in bases if key not in live]
+        )
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        """Store the writes a task made on top of a checkpoint."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for index, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, index)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel,
+                         *self.serde.dumps_typed(value), task_path))
+        # Regular writes are stored once; special writes (errors, interrupts) replace earlier ones
+        with self._lock:
+            self._stats["write_bytes"] += sum(len(row[7]) for row in rows)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for row in rows if row[4] >= 0]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for row in rows if row[4] < 0]
+            )
+            self._conn.commit()
+
+    def prune(self, thread_id: str, keep: int = 1) -> int:
+        """Keep only the newest ``keep`` checkpoints of a thread; returns the stored bytes removed."""
+        with self._lock:
+            before = self._stored_bytes(thread_id)
+            for (checkpoint_ns,) in self._conn.execute(
+                "SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)
+            ).fetchall():
+                self._prune(thread_id, checkpoint_ns, keep)
+            self._conn.commit()
+            return before - self._stored_bytes(thread_id)
+
+    def _stored_bytes(self, thread_id: Optional[str] = None) -> int:
+        """Bytes of checkpoints, writes and values stored for a thread or for all threads (lock must be held)."""
+        where, params = (" WHERE thread_id = ?", (thread_id,)) if thread_id is not None else ("", ())
+        return sum(
+            self._conn.execute(f"SELECT COALESCE(SUM({columns}), 0) FROM {table}{where}", params).fetchone()[0]
+            for table, columns in (
+                ("checkpoints", "LENGTH(checkpoint) + LENGTH(metadata)"),
+                ("writes", "LENGTH(value)"),
+                ("channel_values", "LENGTH(value)")
+            )
+        )
+
+    def stored_bytes(self, thread_id: Optional[str] = None) -> int:
+        """Bytes of checkpoints, writes and values stored for a thread, or for all threads."""
+        with self._lock:
+            return self._stored_bytes(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete every checkpoint and write of a thread."""
+        with self._lock:
+            for table in ("checkpoints", "writes", "channel_values"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self._conn.commit()
+            for key in [key for key in self._last_values if key[0] == thread_id]:
+                del self._last_values[key]
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        results = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in results:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        """Next channel version, with a random suffix so forks of a thread never reuse a stored version."""
+        current_v = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def reclaim_space(self, max_pages: int = 1000) -> int:
+        """Return up to ``max_pages`` free pages to the file system; returns the bytes released."""
+        with self._lock:
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            free_before = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            self._conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+            free_after = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (free_before - free_after) * page_size
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get stored row counts and the bytes written since startup."""
+        with self._lock:
+            threads, checkpoints = self._conn.execute(
+                "SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints"
+            ).fetchone()
+            writes = self._conn.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+            values = self._conn.execute("SELECT COUNT(*) FROM channel_values").fetchone()[0]
+            return {"threads": threads, "checkpoints": checkpoints, "writes": writes, "values": values,
+                    "keep_per_thread": self.keep_per_thread, **self._stats,
+                    "bytes_written": self._stats["checkpoint_bytes"] + self._stats["value_bytes"] + self._stats["write_bytes"]}
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def create_checkpointer() -> BaseCheckpointSaver:
+    """Build the graph checkpointer configured in settings."""
+    if not settings.GRAPH_CHECKPOINT_PATH:
+        return MemorySaver()
+    return SQLiteCheckpointSaver(
+        settings.GRAPH_CHECKPOINT_PATH,
+        settings.GRAPH_CHECKPOINT_KEEP_PER_THREAD,
+        settings.GRAPH_CHECKPOINT_MAX_DELTA_CHAIN
+    )
@@ -1,45 +1,50 @@
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional, Tuple, Union
+from langchain_core.runnables import RunnableLambda, RunnableConfig
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Send
+import asyncio
 import uuid
 import time
 
 from src.workflow.state import AgentState
 from src.workflow.human_review import HumanReviewInterface, HumanReviewNode
+from src.workflow.task_graph import delegated_tasks, ready_tasks
+from src.workflow.progress import NodeProgressReporter
+from src.workflow.checkpointer import create_checkpointer
 from src.workflow.tracing import tracer, checkpoint_storage
+from src.workflow.checkpoint_writer import checkpoint_writer
+from src.utils.events import TokenBatcher, event_broker
+from src.utils.llm_cache import LLMCache
+from src.utils.singleflight import workflow_singleflight
 from src.agents import (
+    BaseAgent,
     SeniorReasoningAgent, 
     TaskDelegationAgent, 
     XMLFormatterAgent, 
-    QualityAssuranceAgent
+    QualityAssuranceAgent,
+    TaskWorkerAgent
 )
 from src.config import settings
 
 
+# Graph supersteps outside the task waves: reasoning, delegation, xml_validation,
+# the first dispatch_tasks, qa and human_review, plus a margin
+FIXED_SUPERSTEPS = 8
+
+# Events of a run that a joined run receives; status and outcome events are per session
+FORWARDED_EVENT_TYPES = ("token", "element", "retry", "log", "node")
+
+
 class WorkflowEngine:
     """LangGraph workflow engine with DAG subgraphs."""
     
     def __init__(self):
-        # Initialize agents
-        self.reasoning_agent = SeniorReasoningAgent(
-            model=settings.QWEN_MODEL,
-            base_url=settings.OLLAMA_BASE_URL
-        )
-        
-        self.delegation_agent = TaskDelegationAgent(
-            model=settings.GEMMA_MODEL,
-            base_url=settings.OLLAMA_BASE_URL
-        )
-        
-        self.xml_agent = XMLFormatterAgent(
-            model=settings.GEMMA_MODEL,
-            base_url=settings.OLLAMA_BASE_URL
-        )
-        
-        self.qa_agent = QualityAssuranceAgent(
-            model=settings.QWEN_MODEL,
-            base_url=settings.OLLAMA_BASE_URL
-        )
+        # Initialize agents, which share the configured Ollama hosts
+        self.reasoning_agent = SeniorReasoningAgent(model=settings.QWEN_MODEL)
+        self.delegation_agent = TaskDelegationAgent(model=settings.GEMMA_MODEL)
+        self.xml_agent = XMLFormatterAgent(model=settings.GEMMA_MODEL)
+        self.qa_agent = QualityAssuranceAgent(model=settings.QWEN_MODEL)
+        self.task_worker = TaskWorkerAgent(model=settings.GEMMA_MODEL)
         
         # Initialize human review system
         self.human_review_interface = HumanReviewInterface()
@@ -48,11 +53,11 @@ class WorkflowEngine:
         # Build the workflow graph
         self.workflow = self._build_workflow()
         
-        # Set up memory
-        self.memory = MemorySaver()
+        # Durable graph checkpoints, so interrupted runs can be resumed
+        self.checkpointer = create_checkpointer()
         
         # Compile the workflow
-        self.app = self.workflow.compile(checkpointer=self.memory)
+        self.app = self.workflow.compile(checkpointer=self.checkpointer)
         
         # Trace ID for this engine instance
         self.trace_id = str(uuid.uuid4())
@@ -66,16 +71,24 @@ class WorkflowEngine:
         workflow = StateGraph(AgentState)
         
         # Add nodes for each agent
-        workflow.add_node("reasoning", self._reasoning_node)
-        workflow.add_node("delegation", self._delegation_node)
-        workflow.add_node("xml_validation", self._xml_validation_node)
-        workflow.add_node("qa", self._qa_node)
+        workflow.add_node("reasoning", self._agent_node("reasoning", self.reasoning_agent, "messages"))
+        workflow.add_node("delegation", self._agent_node("delegation", self.delegation_agent, "problem_analysis"))
+        workflow.add_node("xml_validation", self._agent_node("xml_validation", self.xml_agent, "task_delegation"))
+        workflow.add_node("qa", self._agent_node("qa", self.qa_agent, "xml_validation"))
+        workflow.add_node("dispatch_tasks", self._dispatch_tasks_node)
+        workflow.add_node("task_worker", self._agent_node("task_worker", self.task_worker, "task"))
         workflow.add_node("human_review", self._human_review_node)
         
         # Add edges between nodes
         workflow.add_edge("reasoning", "delegation")
         workflow.add_edge("delegation", "xml_validation")
-        workflow.add_edge("xml_validation", "qa")
+        if settings.TASK_FANOUT_ENABLED:
+            # Run the delegated tasks in dependency waves, each wave in parallel, then join before QA
+            workflow.add_edge("xml_validation", "dispatch_tasks")
+            workflow.add_conditional_edges("dispatch_tasks", self._route_tasks, ["task_worker", "qa"])
+            workflow.add_edge("task_worker", "dispatch_tasks")
+        else:
+            workflow.add_edge("xml_validation", "qa")
         
         # Add conditional edge for human review
         workflow.add_conditional_edges(
@@ -95,153 +108,360 @@ class WorkflowEngine:
         
         return workflow
     
-    def _reasoning_node(self, state: AgentState) -> Dict[str, Any]:
-        """Process the reasoning node."""
-        span_id = str(uuid.uuid4())
-        tracer.add_span(
-            self.trace_id, 
-            span_id, 
-            "reasoning", 
-            {"input": state.get("messages", [])}, 
-            {}
-        )
-        
-        try:
-            result = self.reasoning_agent.process(state)
-            tracer.add_span(
-                self.trace_id, 
-                f"{span_id}_result", 
-                "reasoning_result", 
-                {}, 
-                result
-            )
+    def _agent_node(self, step: str, agent: BaseAgent, input_key: str) -> RunnableLambda:
+        """Wrap an agent as a graph node with sync and async implementations."""
+        def run(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+            span_id = self._start_span(step, {input_key: state.get(input_key, "")})
+            options, tokens = self._llm_options(step, agent, config)
+            try:
+                result = agent.process(state, **options)
+            except Exception as e:
+                tracer.log_error(self.trace_id, str(e), f"{step}_error")
+                raise
+            finally:
+                if tokens:
+                    tokens.flush()
+            self._end_span(step, span_id, result)
+            self._publish_log(step, config, result)
             return result
-        except Exception as e:
-            tracer.log_error(self.trace_id, str(e), "reasoning_error")
-            raise
-    
-    def _delegation_node(self, state: AgentState) -> Dict[str, Any]:
-        """Process the delegation node."""
-        span_id = str(uuid.uuid4())
-        tracer.add_span(
-            self.trace_id, 
-            span_id, 
-            "delegation", 
-            {"problem_analysis": state.get("problem_analysis", "")}, 
-            {}
-        )
         
-        try:
-            result = self.delegation_agent.process(state)
-            tracer.add_span(
-                self.trace_id, 
-                f"{span_id}_result", 
-                "delegation_result", 
-                {}, 
-                result
-            )
+        async def arun(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+            span_id = self._start_span(step, {input_key: state.get(input_key, "")})
+            options, tokens = self._llm_options(step, agent, config)
+            try:
+                result = await agent.aprocess(state, **options)
+            except Exception as e:
+                tracer.log_error(self.trace_id, str(e), f"{step}_error")
+                raise
+            finally:
+                if tokens:
+                    tokens.flush()
+            self._end_span(step, span_id, result)
+            self._publish_log(step, config, result)
             return result
-        except Exception as e:
-            tracer.log_error(self.trace_id, str(e), "delegation_error")
-            raise
+        
+        return RunnableLambda(run, afunc=arun, name=step)
     
-    def _xml_validation_node(self, state: AgentState) -> Dict[str, Any]:
-        """Process the XML validation node."""
-        span_id = str(uuid.uuid4())
-        tracer.add_span(
-            self.trace_id, 
-            span_id, 
-            "xml_validation", 
-            {"task_delegation": state.get("task_delegation", "")}, 
-            {}
-        )
+    def _session_id(self, config: RunnableConfig) -> Optional[str]:
+        """Get the session ID of the run a node belongs to."""
+        return (config or {}).get("configurable", {}).get("thread_id")
+    
+    def _publish_log(self, step: str, config: RunnableConfig, result: Dict[str, Any]) -> None:
+        """Publish the verbose log a node just produced to the session channel."""
+        session_id = self._session_id(config)
+        if session_id and result.get("verbose_logs"):
+            event_broker.publish(session_id, {
+                "type": "log",
+                "node": step,
+                "log": result["verbose_logs"][-1]
+            })
+    
+    def _llm_options(self, step: str, agent: BaseAgent,
+                     config: RunnableConfig) -> Tuple[Dict[str, Any], Optional[TokenBatcher]]:
+        """Build the LLM call options for a node, streaming tokens to the session channel.
         
-        try:
-            result = self.xml_agent.process(state)
-            tracer.add_span(
-                self.trace_id, 
-                f"{span_id}_result", 
-                "xml_validation_result", 
-                {}, 
-                result
-            )
-            return result
-        except Exception as e:
-            tracer.log_error(self.trace_id, str(e), "xml_validation_error")
-            raise
+        Tokens are published in chunks; the returned batcher (None when
+        tokens are not streamed) must be flushed once the node finishes.
+        """
+        configurable = (config or {}).get("configurable", {})
+        options = {"use_cache": configurable.get("use_cache", True)}
+        
+        session_id = self._session_id(config)
+        if session_id:
+            options["session_id"] = session_id
+        if not settings.STREAM_TOKENS or not session_id:
+            return options, None
+        
+        tokens = TokenBatcher(event_broker, session_id, {
+            "session_id": session_id,
+            "agent": agent.name,
+            "node": step
+        })
+        
+        def on_event(event: Dict[str, Any]) -> None:
+            # Completed elements and stream retries, after the tokens they follow
+            tokens.flush()
+            event_broker.publish(session_id, {
+                **event,
+                "session_id": session_id,
+                "agent": agent.name,
+                "node": step
+            })
+        
+        options.update(stream=True, on_token=tokens.add, on_event=on_event)
+        return options, tokens
     
-    def _qa_node(self, state: AgentState) -> Dict[str, Any]:
-        """Process the QA node."""
+    def _start_span(self, step: str, input_data: Dict[str, Any]) -> str:
+        """Record the start of a node in the trace."""
         span_id = str(uuid.uuid4())
-        tracer.add_span(
-            self.trace_id, 
-            span_id, 
-            "qa", 
-            {"xml_validation": state.get("xml_validation", "")}, 
-            {}
-        )
-        
-        try:
-            result = self.qa_agent.process(state)
-            tracer.add_span(
-                self.trace_id, 
-                f"{span_id}_result", 
-                "qa_result", 
-                {}, 
-                result
-            )
-            return result
-        except Exception as e:
-            tracer.log_error(self.trace_id, str(e), "qa_error")
-            raise
+        tracer.add_span(self.trace_id, span_id, step, input_data, {})
+        return span_id
+    
+    def _end_span(self, step: str, span_id: str, result: Dict[str, Any]) -> None:
+        """Record the result of a node in the trace."""
+        tracer.add_span(self.trace_id, f"{span_id}_result", f"{step}_result", {}, result)
     
-    def _human_review_node(self, state: AgentState) -> Dict[str, Any]:
+    def _human_review_node(self, state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
         """Process the human review node."""
-        # Process human review with session ID
-        session_id = "default_session"  # In a real app, this would come from the config
+        # Process human review with the run's session ID
+        session_id = config.get("configurable", {}).get("thread_id", "default_session")
         return self.human_review_node.process(state, session_id)
     
+    def _dispatch_tasks_node(self, state: AgentState) -> Dict[str, Any]:
+        """Join point between waves of task workers; routing happens on its outgoing edge."""
+        return {}
+    
+    def _route_tasks(self, state: AgentState) -> Union[str, List[Send]]:
+        """Send every task whose dependencies have finished to a task worker, or move on to QA."""
+        results = state.get("task_results") or {}
+        ready = ready_tasks(delegated_tasks(state), results)
+        if not ready:
+            return "qa"
+        
+        messages = state.get("messages") or []
+        request = getattr(messages[0], "content", "") if messages else ""
+        return [
+            Send("task_worker", {
+                "task": task,
+                "request": request,
+                "dependency_results": {dep: results[dep] for dep in task["dependencies"] if dep in results}
+            })
+            for task in ready
+        ]
+    
     def _should_human_review(self, state: AgentState) -> str:
         """Determine if human review is required."""
         # Check if human review is needed based on QA report
         return "human_review" if self.human_review_interface.should_request_review(state) else "end"
     
-    def run(self, input_message: str) -> Dict[str, Any]:
-        """Run the workflow with the given input."""
-        initial_state = {
+    def _initial_state(self, input_message: str) -> Dict[str, Any]:
+        """Build the initial state for a run."""
+        return {
             "messages": [{"role": "user", "content": input_message}],
             "problem_analysis": "",
             "task_delegation": "",
             "xml_validation": "",
             "final_qa_report": "",
+            "summaries": {},
+            "task_results": {},
             "human_review_required": False,
             "human_feedback": "",
             "verbose_logs": []
         }
-        
-        # Save initial checkpoint
-        session_id = str(uuid.uuid4())
-        checkpoint_storage.save_checkpoint(session_id, {
-            "state": initial_state,
+    
+    def _save_checkpoint(self, session_id: str, state: Dict[str, Any], status: str) -> None:
+        """Save a run checkpoint, queued for the background writer unless write-behind is disabled."""
+        checkpoint_data = {
+            "state": state,
             "timestamp": time.time(),
-            "status": "started"
+            "status": status
+        }
+        if settings.CHECKPOINT_WRITE_BEHIND:
+            checkpoint_writer.save(session_id, checkpoint_data)
+        else:
+            checkpoint_storage.save_checkpoint(session_id, checkpoint_data)
+    
+    def _run_config(self, session_id: str, use_cache: bool) -> Dict[str, Any]:
+        """Graph config for a run; max_concurrency bounds how many task workers run at once.
+        
+        Each dependency wave takes a task_worker and a dispatch_tasks
+        superstep, and a plan of chained tasks has one wave per task, so the
+        recursion limit grows with the number of tasks a plan may have.
+        """
+        return {
+            "configurable": {"thread_id": session_id, "use_cache": use_cache},
+            "max_concurrency": settings.TASK_FANOUT_MAX_CONCURRENCY,
+            "recursion_limit": 2 * settings.TASK_FANOUT_MAX_TASKS + FIXED_SUPERSTEPS
+        }
+    
+    def _progress_reporter(self, session_id: str) -> NodeProgressReporter:
+        """Reporter for the node start and end events of a run."""
+        return NodeProgressReporter(session_id, {
+            "reasoning": self.reasoning_agent.name,
+            "delegation": self.delegation_agent.name,
+            "xml_validation": self.xml_agent.name,
+            "task_worker": self.task_worker.name,
+            "qa": self.qa_agent.name,
+            "human_review": "Human Reviewer"
         })
+    
+    def _run_key(self, input_message: str, use_cache: bool) -> str:
+        """Key identifying identical workflow runs."""
+        return LLMCache.make_key(
+            f"{settings.QWEN_MODEL}|{settings.GEMMA_MODEL}",
+            [{"role": "user", "content": input_message}],
+            {"use_cache": use_cache}
+        )
+    
+    def run(self, input_message: str, session_id: Optional[str] = None, use_cache: bool = True,
+            runner: Optional[Callable[[str, str, bool], Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Run the workflow with the given input.
+        
+        The session ID names the run's checkpoint thread and event channel.
+        With ``use_cache=False`` every agent calls the model even when an
+        identical response is cached. A run identical to one already in
+        flight waits for and shares that run's result: the leader's events
+        are forwarded to this session's channel and its human review is
+        registered under this session too.
+        
+        ``runner`` executes the graph for a leading run, in this process by
+        default; the process executor passes one that uses a worker process.
+        """
+        session_id = session_id or str(uuid.uuid4())
+        runner = runner or self._run
         
-        config = {"configurable": {"thread_id": session_id}}
-        result = self.app.invoke(initial_state, config)
+        if not settings.COALESCE_IDENTICAL_REQUESTS:
+            return runner(input_message, session_id, use_cache)
+        
+        leader = {}
+        result, joined = workflow_singleflight.do(
+            self._run_key(input_message, use_cache), runner, input_message, session_id, use_cache,
+            context=session_id, on_join=self._follow_run(session_id, leader)
+        )
+        if joined:
+            self._share_review(leader["session_id"], session_id, result)
+            self._save_checkpoint(session_id, result, "completed")
+        return result
+    
+    async def arun(self, input_message: str, session_id: Optional[str] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """Run the workflow asynchronously with the given input."""
+        session_id = session_id or str(uuid.uuid4())
+        
+        if not settings.COALESCE_IDENTICAL_REQUESTS:
+            return await self._arun(input_message, session_id, use_cache)
+        
+        leader = {}
+        result, joined = await workflow_singleflight.ado(
+            self._run_key(input_message, use_cache), self._arun, input_message, session_id, use_cache,
+            context=session_id, on_join=self._follow_run(session_id, leader)
+        )
+        if joined:
+            self._share_review(leader["session_id"], session_id, result)
+            await asyncio.to_thread(self._save_checkpoint, session_id, result, "completed")
+        return result
+    
+    def _follow_run(self, session_id: str, leader: Dict[str, str]) -> Callable[[str], None]:
+        """Join hook that records the leader's session and forwards its events to this session."""
+        def on_join(leader_session_id: str) -> None:
+            leader["session_id"] = leader_session_id
+            event_broker.forward(leader_session_id, session_id, FORWARDED_EVENT_TYPES)
+        
+        return on_join
+    
+    def _share_review(self, leader_session_id: str, session_id: str, result: Dict[str, Any]) -> None:
+        """Register the leader's human review under a session that shared its result."""
+        if result.get("human_review_required"):
+            self.human_review_interface.share_review(leader_session_id, session_id)
+    
+    def _run(self, input_message: str, session_id: str, use_cache: bool) -> Dict[str, Any]:
+        """Execute the graph for one run."""
+        initial_state = self._initial_state(input_message)
+        
+        # Save initial checkpoint
+        self._save_checkpoint(session_id, initial_state, "started")
+        
+        # A new run on a session replaces the graph state of its previous run
+        self.checkpointer.delete_thread(session_id)
+        result = self._stream(initial_state, session_id, use_cache, initial_state)
         
         # Save final checkpoint
-        checkpoint_storage.save_checkpoint(session_id, {
-            "state": result,
-            "timestamp": time.time(),
-            "status": "completed"
-        })
+        self._save_checkpoint(session_id, result, "completed")
+        
+        # End trace
+        tracer.end_trace(self.trace_id, result)
+        
+        return result
+    
+    async def _arun(self, input_message: str, session_id: str, use_cache: bool) -> Dict[str, Any]:
+        """Execute the graph asynchronously for one run."""
+        initial_state = self._initial_state(input_message)
+        
+        # Save initial checkpoint off the event loop
+        await asyncio.to_thread(self._save_checkpoint, session_id, initial_state, "started")
+        
+        await self.checkpointer.adelete_thread(session_id)
+        result = await self._astream(initial_state, session_id, use_cache, initial_state)
+        
+        # Save final checkpoint
+        await asyncio.to_thread(self._save_checkpoint, session_id, result, "completed")
         
         # End trace
         tracer.end_trace(self.trace_id, result)
         
         return result
     
+    def _stream(self, graph_input: Optional[Dict[str, Any]], session_id: str, use_cache: bool,
+                result: Dict[str, Any]) -> Dict[str, Any]:
+        """Stream the graph, reporting node progress, and return the final state.
+        
+        If a node fails, the state it started from is saved with status
+        ``failed`` before the error propagates.
+        """
+        progress = self._progress_reporter(session_id)
+        try:
+            for mode, chunk in self.app.stream(graph_input, self._run_config(session_id, use_cache),
+                                               stream_mode=["tasks", "values"]):
+                if mode == "tasks":
+                    progress.handle(chunk)
+                else:
+                    result = chunk
+        except Exception:
+            self._save_checkpoint(session_id, result, "failed")
+            raise
+        return result
+    
+    async def _astream(self, graph_input: Optional[Dict[str, Any]], session_id: str, use_cache: bool,
+                       result: Dict[str, Any]) -> Dict[str, Any]:
+        """Stream the graph asynchronously and return the final state."""
+        progress = self._progress_reporter(session_id)
+        try:
+            async for mode, chunk in self.app.astream(graph_input, self._run_config(session_id, use_cache),
+                                                      stream_mode=["tasks", "values"]):
+                if mode == "tasks":
+                    progress.handle(chunk)
+                else:
+                    result = chunk
+        except Exception:
+            await asyncio.to_thread(self._save_checkpoint, session_id, result, "failed")
+            raise
+        return result
+    
+    def _resume_state(self, session_id: str, use_cache: bool) -> Any:
+        """Latest graph checkpoint of a session."""
+        snapshot = self.app.get_state(self._run_config(session_id, use_cache))
+        if not snapshot.values:
+            raise ValueError(f"No graph checkpoint found for session {session_id}")
+        return snapshot
+    
+    def resume(self, session_id: str, use_cache: bool = True) -> Dict[str, Any]:
+        """Continue an interrupted run from its last completed node.
+        
+        Nodes that finished before the run stopped, including task workers
+        that completed alongside a failed one, are not run again. A run that
+        already finished returns its final state.
+        """
+        snapshot = self._resume_state(session_id, use_cache)
+        if not snapshot.next:
+            return snapshot.values
+        
+        self._save_checkpoint(session_id, snapshot.values, "resumed")
+        result = self._stream(None, session_id, use_cache, snapshot.values)
+        self._save_checkpoint(session_id, result, "completed")
+        tracer.end_trace(self.trace_id, result)
+        return result
+    
+    async def aresume(self, session_id: str, use_cache: bool = True) -> Dict[str, Any]:
+        """Continue an interrupted run asynchronously from its last completed node."""
+        snapshot = await asyncio.to_thread(self._resume_state, session_id, use_cache)
+        if not snapshot.next:
+            return snapshot.values
+        
+        await asyncio.to_thread(self._save_checkpoint, session_id, snapshot.values, "resumed")
+        result = await self._astream(None, session_id, use_cache, snapshot.values)
+        await asyncio.to_thread(self._save_checkpoint, session_id, result, "completed")
+        tracer.end_trace(self.trace_id, result)
+        return result
+    
     def submit_human_feedback(self, session_id: str, feedback: str) -> bool:
         """Submit human feedback for a review."""
         return self.human_review_interface.submit_feedback(session_id, feedback)
@@ -0,0 +1,278 @@
+from typing import Dict, Any, Optional, Tuple
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import threading
+import asyncio
+import time
+import uuid
+
+from src.utils.events import event_broker
+from src.config import settings
+
+
+class WorkflowQueueFullError(RuntimeError):
+    """Raised when the workflow queue has no room for another run."""
+
+
+# Seconds a finished process run waits for its relayed events to be published
+RELAY_DRAIN_TIMEOUT = 5.0
+
+# Per-process engine and event queue used when runs are dispatched to a process pool
+_process_engine = None
+_process_events = None
+
+
+def _init_worker_process(events=None) -> None:
+    """Build a workflow engine once per worker process and relay its events to the API process."""
+    global _process_engine, _process_events
+    from src.workflow.engine import WorkflowEngine
+    _process_engine = WorkflowEngine()
+    _process_events = events
+    if events is not None:
+        event_broker.relay_to(events.put)
+
+
+def _run_in_worker_process(input_message: str, session_id: str,
+                           use_cache: bool = True) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Run the workflow with the worker process engine.
+    
+    Returns the result and the session's human review, if one was requested.
+    """
+    if _process_engine is None:
+        _init_worker_process()
+    try:
+        result = _process_engine.run(input_message, session_id, use_cache)
+        reviews = _process_engine.human_review_interface
+        return result, reviews.get_completed_review(session_id) or reviews.get_pending_review(session_id)
+    finally:
+        # Pool workers exit without running atexit hooks, so write the run's checkpoints now
+        from src.workflow.checkpoint_writer import checkpoint_writer
+        checkpoint_writer.flush()
+        if _process_events is not None:
+            # Marks the end of the run's events
+            _process_events.put((session_id, None))
+
+
+class WorkflowExecutor:
+    """Dispatches workflow runs onto a bounded thread pool, process pool or the event loop.
+
+    In ``async`` mode runs are awaited on the caller's event loop through
+    ``WorkflowEngine.arun``, so in-flight sessions do not hold a thread each.
+    
+    In ``process`` mode a pool thread hands each run's graph to a worker
+    process. Identical runs are still coalesced here, the workers' events
+    are relayed to this process's event broker and their human reviews are
+    registered with the engine, so streaming and review work as with threads.
+    """
+
+    def __init__(self, workflow_engine=None, mode: Optional[str] = None,
+                 max_workers: Optional[int] = None, max_queue_size: Optional[int] = None):
+        self.workflow_engine = workflow_engine
+        self.mode = (mode or settings.WORKFLOW_EXECUTOR).lower()
+        if self.mode not in ("thread", "process", "async"):
+            raise ValueError(f"Unsupported workflow executor mode: {self.mode}")
+        if self.mode != "process" and workflow_engine is None:
+            raise ValueError(f"A workflow engine is required for the {self.mode} executor")
+
+        self.max_workers = max_workers or settings.WORKFLOW_MAX_WORKERS
+        self.max_queue_size = max_queue_size if max_queue_size is not None else settings.WORKFLOW_QUEUE_SIZE
+
+        self._pool: Optional[Executor] = None
+        self._processes: Optional[Executor] = None
+        self._events = None
+        self._relay_thread: Optional[threading.Thread] = None
+        self._relayed: Dict[str, threading.Event] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "peak_queue_depth": 0,
+            "total_execution_time": 0.0
+        }
+
+    def _get_pool(self) -> Executor:
+        """Create the worker pool on first use."""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="workflow"
+            )
+        return self._pool
+
+    def _get_processes(self) -> Executor:
+        """Create the worker process pool and its event relay on first use."""
+        with self._lock:
+            if self._processes is None:
+                context = multiprocessing.get_context("spawn")
+                self._events = context.Queue()
+                self._relay_thread = threading.Thread(
+                    target=self._relay_events, args=(self._events,), name="workflow-events", daemon=True
+                )
+                self._relay_thread.start()
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_worker_process,
+                    initargs=(self._events,)
+                )
+            return self._processes
+
+    def _relay_events(self, events) -> None:
+        """Publish the events of worker process runs on this process's broker."""
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            session_id, event = item
+            if event is not None:
+                event_broker.publish(session_id, event)
+                continue
+            with self._lock:
+                drained = self._relayed.get(session_id)
+            if drained:
+                drained.set()
+
+    def _run_in_process(self, input_message: str, session_id: Optional[str] = None,
+                        use_cache: bool = True) -> Dict[str, Any]:
+        """Run the workflow in a worker process, coalescing identical runs in this process."""
+        if self.workflow_engine is None:
+            return self._run_remote(input_message, session_id or str(uuid.uuid4()), use_cache)
+        return self.workflow_engine.run(input_message, session_id, use_cache, runner=self._run_remote)
+
+    def _run_remote(self, input_message: str, session_id: str, use_cache: bool) -> Dict[str, Any]:
+        """Execute one run's graph in a worker process and bring its events and review back."""
+        drained = threading.Event()
+        with self._lock:
+            self._relayed[session_id] = drained
+        try:
+            try:
+                result, review = self._get_processes().submit(
+                    _run_in_worker_process, input_message, session_id, use_cache
+                ).result()
+            finally:
+                # Publish the run's last events before its caller publishes the outcome
+                drained.wait(RELAY_DRAIN_TIMEOUT)
+        finally:
+            with self._lock:
+                self._relayed.pop(session_id, None)
+
+        if review and self.workflow_engine is not None:
+            reviews = self.workflow_engine.human_review_interface
+            reviews.request_review(session_id, review["state"])
+            if review["status"] == "completed":
+                reviews.submit_feedback(session_id, review["feedback"])
+        return result
+
+    def _queue_depth(self) -> int:
+        """Number of runs waiting for a free worker (lock must be held)."""
+        return max(0, self._outstanding - self.max_workers)
+
+    def has_capacity(self) -> bool:
+        """Check whether another run can be accepted."""
+        with self._lock:
+            return self._outstanding < self.max_workers + self.max_queue_size
+
+    def _admit(self) -> None:
+        """Reserve room for a new run or raise if the queue is full."""
+        with self._lock:
+            if self._outstanding >= self.max_workers + self.max_queue_size:
+                self._stats["rejected"] += 1
+                raise WorkflowQueueFullError(
+                    f"Workflow queue is full ({self.max_queue_size} runs waiting)"
+                )
+            self._outstanding += 1
+            self._stats["submitted"] += 1
+            self._stats["peak_queue_depth"] = max(self._stats["peak_queue_depth"], self._queue_depth())
+
+    def submit(self, *args, **kwargs) -> Future:
+        """Submit a workflow run to the pool and return a future for its result."""
+        if self.mode == "async":
+            raise RuntimeError("The async executor runs on the event loop, use run() instead")
+
+        self._admit()
+        submitted_at = time.time()
+        try:
+            if self.mode == "process":
+                future = self._get_pool().submit(self._run_in_process, *args, **kwargs)
+            else:
+                future = self._get_pool().submit(self.workflow_engine.run, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._outstanding -= 1
+            raise
+
+        future.add_done_callback(lambda f: self._on_done(f, submitted_at))
+        return future
+
+    async def run(self, *args, **kwargs) -> Dict[str, Any]:
+        """Run the workflow without blocking the event loop."""
+        if self.mode != "async":
+            return await asyncio.wrap_future(self.submit(*args, **kwargs))
+
+        self._admit()
+        submitted_at = time.time()
+        succeeded = False
+        try:
+            async with self._get_slots():
+                result = await self.workflow_engine.arun(*args, **kwargs)
+            succeeded = True
+            return result
+        finally:
+            self._record_done(submitted_at, succeeded)
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        """Get the semaphore bounding concurrent async runs on the running loop."""
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_workers)
+            self._slots_loop = loop
+        return self._slots
+
+    def _on_done(self, future: Future, submitted_at: float) -> None:
+        """Update counters when a pooled run finishes."""
+        self._record_done(submitted_at, not future.cancelled() and future.exception() is None)
+
+    def _record_done(self, submitted_at: float, succeeded: bool) -> None:
+        """Update counters when a run finishes."""
+        with self._lock:
+            self._outstanding -= 1
+            self._stats["total_execution_time"] += time.time() - submitted_at
+            if succeeded:
+                self._stats["completed"] += 1
+            else:
+                self._stats["failed"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get queue depth and throughput metrics."""
+        with self._lock:
+            finished = self._stats["completed"] + self._stats["failed"]
+            return {
+                "mode": self.mode,
+                "max_workers": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+                "running": min(self._outstanding, self.max_workers),
+                "queue_depth": self._queue_depth(),
+                "peak_queue_depth": self._stats["peak_queue_depth"],
+                "submitted": self._stats["submitted"],
+                "completed": self._stats["completed"],
+                "failed": self._stats["failed"],
+                "rejected": self._stats["rejected"],
+                "avg_turnaround_time": self._stats["total_execution_time"] / finished if finished else 0
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Shut down the worker pools."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=not wait)
+            self._pool = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait, cancel_futures=not wait)
+            self._processes = None
+            self._events.put(None)
+            self._relay_thread.join(timeout=RELAY_DRAIN_TIMEOUT)
+            self._relay_thread = None
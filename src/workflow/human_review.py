@@ -1,5 +1,6 @@
 from typing import Dict, Any, Optional
 from src.workflow.state import AgentState
+from src.utils.xml_summaries import BLOCKING_SEVERITIES, output_summaries
 
 
 class HumanReviewInterface:
@@ -16,6 +17,14 @@ class HumanReviewInterface:
             "feedback": None
         }
     
+    def share_review(self, source_session_id: str, session_id: str) -> bool:
+        """Register a copy of a session's review for a session that shared its run."""
+        review = self.pending_reviews.get(source_session_id)
+        if review is None:
+            return False
+        self.pending_reviews[session_id] = dict(review)
+        return True
+    
     def submit_feedback(self, session_id: str, feedback: str) -> bool:
         """Submit human feedback for a review request."""
         if session_id in self.pending_reviews:
@@ -42,6 +51,14 @@ class HumanReviewInterface:
     
     def should_request_review(self, state: AgentState) -> bool:
         """Determine if a human review should be requested based on the QA report."""
+        summary = output_summaries.from_state(state, "final_qa_report")
+        if summary is not None:
+            # Blocking issues or a QA score below 80 need a human
+            if any(summary["severities"].get(severity) for severity in BLOCKING_SEVERITIES):
+                return True
+            return summary["score"] is not None and summary["score"] < 80
+        
+        # The report could not be parsed, fall back to scanning its text
         qa_report = state.get("final_qa_report", "")
         
         # Simple heuristic: if the QA report contains "critical" or "major" issues,
@@ -0,0 +1,75 @@
+from typing import Dict, Any, Optional, Tuple
+import time
+
+from src.utils.events import event_broker
+from src.utils.debug_logger import log_workflow_step
+
+
+# Debug dashboard step for each graph node that does visible work
+NODE_STEPS = {
+    "reasoning": "Prompt Analysis",
+    "delegation": "Task Delegation",
+    "xml_validation": "XML Validation",
+    "task_worker": "Task Execution",
+    "qa": "Quality Assurance",
+    "human_review": "Human Review"
+}
+
+
+def output_size(result: Optional[Dict[str, Any]]) -> int:
+    """Characters a node wrote to the state, leaving out its log entry."""
+    if not result:
+        return 0
+    return sum(
+        len(value) if isinstance(value, str) else len(str(value))
+        for key, value in result.items() if key != "verbose_logs"
+    )
+
+
+class NodeProgressReporter:
+    """Reports graph node starts and ends as they happen.
+
+    Consumes the ``tasks`` events of a LangGraph stream: each node run
+    (including every parallel task worker) produces one event when it
+    starts and one when it finishes. Both are published to the session's
+    event channel and to the debug logger's workflow view, with the node's
+    duration and output size on completion.
+    """
+
+    def __init__(self, session_id: str, agents: Dict[str, str]):
+        self.session_id = session_id
+        self.agents = agents
+        self._running: Dict[str, Tuple[str, float]] = {}
+
+    def handle(self, event: Dict[str, Any]) -> None:
+        """Report one ``tasks`` stream event."""
+        node = event["name"]
+        if node not in NODE_STEPS:
+            return
+
+        if "input" in event:
+            step = NODE_STEPS[node]
+            task = (event["input"] or {}).get("task") if isinstance(event["input"], dict) else None
+            if task:
+                step = f"{step} {task.get('id')}"
+            self._running[event["id"]] = (step, time.perf_counter())
+            self._report(node, step, "active", {})
+            return
+
+        step, started = self._running.pop(event["id"], (NODE_STEPS[node], time.perf_counter()))
+        details = {"duration": time.perf_counter() - started, "output_size": output_size(event.get("result"))}
+        if event.get("error"):
+            details["error"] = str(event["error"])
+        self._report(node, step, "error" if event.get("error") else "completed", details)
+
+    def _report(self, node: str, step: str, status: str, details: Dict[str, Any]) -> None:
+        event_broker.publish(self.session_id, {
+            "type": "node",
+            "session_id": self.session_id,
+            "node": node,
+            "step": step,
+            "agent": self.agents.get(node),
+            "status": status,
+            **details
+        })
+        log_workflow_step(step, status, self.agents.get(node), details)
@@ -0,0 +1,271 @@
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from datetime import datetime
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+
+from src.workflow.tracing import CheckpointStorage, checkpoint_storage
+from src.utils.security import security_manager
+from src.utils.monitoring import performance_monitor
+from src.utils.debug_logger import debug_logger
+from src.config import settings
+
+
+# Checkpoint statuses of runs that may still be writing; the size budget never deletes these
+ACTIVE_STATUSES = ("started", "resumed")
+
+# Per-day log files, e.g. audit_2025-09-01.json or its compacted metrics_2025-09-01.json.gz
+LOG_FILE_PATTERN = re.compile(r"_(\d{4}-\d{2}-\d{2})\.json(\.gz)?$")
+
+
+class RetentionService:
+    """Garbage collection of checkpoints, audit logs and performance logs.
+
+    Each pass deletes checkpoints older than the maximum age, then those
+    beyond the newest N of each configured status, along with the graph
+    state and legacy JSON file of the same sessions. Past-day log files are
+    gzip-compacted and deleted once older than the maximum age. If
+    checkpoints, graph state, legacy files and logs together still exceed
+    the size budget, graph state of finished runs is pruned to its latest
+    checkpoint and then the oldest runs and files go first. Today's log
+    files and runs still in progress are never touched by the budget.
+
+    Deletes run in small transactions, so writers wait at most one batch.
+    Every pass returns a report of what it reclaimed.
+    """
+
+    def __init__(self, storage: Optional[CheckpointStorage] = None, checkpointer=None,
+                 log_dirs: Optional[List[str]] = None):
+        self.storage = storage or checkpoint_storage
+        self.checkpointer = checkpointer
+        self.log_dirs = log_dirs or [security_manager.audit_log_path, performance_monitor.log_path]
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_report: Optional[Dict[str, Any]] = None
+        self._totals: Dict[str, Any] = {"passes": 0, "errors": 0}
+
+    def collect(self) -> Dict[str, Any]:
+        """Run one collection pass and report what it reclaimed."""
+        started = time.time()
+        report = {
+            "checkpoints_deleted": 0,
+            "checkpoint_bytes": 0,
+            "graph_threads_deleted": 0,
+            "graph_bytes": 0,
+            "legacy_files_deleted": 0,
+            "legacy_bytes": 0,
+            "log_files_deleted": 0,
+            "log_bytes": 0,
+            "log_files_compacted": 0,
+            "log_bytes_compacted": 0,
+            "database_bytes": 0
+        }
+        with self._lock:
+            if settings.RETENTION_MAX_AGE_DAYS:
+                cutoff = started - settings.RETENTION_MAX_AGE_DAYS * 86400
+                self._expire_checkpoints(cutoff, report)
+                self._expire_logs(cutoff, report)
+            for status, keep in settings.RETENTION_KEEP_LAST_PER_STATUS.items():
+                self._keep_last(status, keep, report)
+            if settings.RETENTION_COMPACT_LOGS:
+                self._compact_logs(report)
+            if settings.RETENTION_MAX_BYTES:
+                self._enforce_budget(settings.RETENTION_MAX_BYTES, report)
+            for database in (self.storage, self.checkpointer):
+                if hasattr(database, "reclaim_space"):
+                    while True:
+                        released = database.reclaim_space()
+                        report["database_bytes"] += released
+                        if not released:
+                            break
+
+            report["reclaimed_bytes"] = sum(report[key] for key in (
+                "checkpoint_bytes", "graph_bytes", "legacy_bytes", "log_bytes", "log_bytes_compacted"
+            ))
+            report["duration"] = time.time() - started
+            report["timestamp"] = started
+            self._last_report = report
+            self._totals["passes"] += 1
+            for key, value in report.items():
+                if key not in ("duration", "timestamp"):
+                    self._totals[key] = self._totals.get(key, 0) + value
+        return report
+
+    def _delete_checkpoints(self, entries: List[Dict[str, Any]], report: Dict[str, Any]) -> None:
+        """Delete one batch of checkpoints and the graph state of their sessions."""
+        session_ids = [entry["session_id"] for entry in entries]
+        report["checkpoint_bytes"] += self.storage.delete_checkpoints(session_ids)
+        report["checkpoints_deleted"] += len(session_ids)
+        if self.checkpointer is not None:
+            for session_id in session_ids:
+                report["graph_bytes"] += self._graph_bytes(session_id)
+                self.checkpointer.delete_thread(session_id)
+            report["graph_threads_deleted"] += len(session_ids)
+        # Let writers in between batches
+        time.sleep(0)
+
+    def _expire_checkpoints(self, cutoff: float, report: Dict[str, Any]) -> None:
+        while True:
+            entries = self.storage.list_checkpoint_entries(end=cutoff, limit=settings.RETENTION_BATCH_SIZE)
+            if not entries:
+                return
+            self._delete_checkpoints(entries, report)
+
+    def _keep_last(self, status: str, keep: int, report: Dict[str, Any]) -> None:
+        excess = self.storage.count_checkpoints(status) - keep
+        while excess > 0:
+            entries = self.storage.list_checkpoint_entries(status=status, limit=min(excess, settings.RETENTION_BATCH_SIZE))
+            if not entries:
+                return
+            self._delete_checkpoints(entries, report)
+            excess -= len(entries)
+
+    def _log_files(self, include_today: bool = False) -> List[Tuple[float, str, int]]:
+        """Per-day log files as (day timestamp, path, size), oldest first; today's only if asked."""
+        today = datetime.now().strftime("%Y-%m-%d")
+        files = []
+        for log_dir in self.log_dirs:
+            if not os.path.isdir(log_dir):
+                continue
+            for filename in os.listdir(log_dir):
+                match = LOG_FILE_PATTERN.search(filename)
+                if not match or (match.group(1) >= today and not include_today):
+                    continue
+                path = os.path.join(log_dir, filename)
+                try:
+                    files.append((datetime.strptime(match.group(1), "%Y-%m-%d").timestamp(), path, os.path.getsize(path)))
+                except (OSError, ValueError):
+                    continue
+        return sorted(files)
+
+    def _remove_file(self, path: str, size: int, report: Dict[str, Any], kind: str = "log") -> None:
+        """Delete a log or legacy checkpoint file and count it under ``kind``."""
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        report[f"{kind}_files_deleted"] += 1
+        report[f"{kind}_bytes"] += size
+
+    def _expire_logs(self, cutoff: float, report: Dict[str, Any]) -> None:
+        # A day's file is kept until the whole day is older than the cutoff
+        for day, path, size in self._log_files():
+            if day + 86400 <= cutoff:
+                self._remove_file(path, size, report)
+
+    def _compact_logs(self, report: Dict[str, Any]) -> None:
+        """Gzip the JSON log files of past days; readers fall back to the compacted copy."""
+        for _, path, size in self._log_files():
+            if not path.endswith(".json"):
+                continue
+            compacted = path + ".gz"
+            try:
+                with open(path, "rb") as source, gzip.open(compacted + ".tmp", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(compacted + ".tmp", compacted)
+                os.remove(path)
+            except OSError as e:
+                debug_logger.log("WARNING", "RETENTION", f"Could not compact {path}", {"error": str(e)})
+                continue
+            report["log_files_compacted"] += 1
+            report["log_bytes_compacted"] += size - os.path.getsize(compacted)
+
+    def _deletable_checkpoints(self) -> Iterator[Dict[str, Any]]:
+        """Checkpoints of finished runs, oldest first."""
+        after = None
+        while True:
+            entries = self.storage.list_checkpoint_entries(after=after, limit=settings.RETENTION_BATCH_SIZE)
+            for entry in entries:
+                if entry["status"] not in ACTIVE_STATUSES:
+                    yield entry
+            if len(entries) < settings.RETENTION_BATCH_SIZE:
+                return
+            after = (entries[-1]["timestamp"], entries[-1]["session_id"])
+
+    def _graph_bytes(self, session_id: Optional[str] = None) -> int:
+        """Bytes the graph checkpointer stores for a session, or in total (0 when it keeps state in memory)."""
+        if not hasattr(self.checkpointer, "stored_bytes"):
+            return 0
+        return self.checkpointer.stored_bytes(session_id)
+
+    def _enforce_budget(self, max_bytes: int, report: Dict[str, Any]) -> None:
+        """Shrink checkpoints, graph state, leftover legacy files and past-day logs until they fit the budget.
+
+        Graph state of finished runs is first pruned to its latest
+        checkpoint, oldest runs first. If that is not enough, the oldest
+        finished runs and files are deleted.
+        """
+        # Today's files count against the budget but are still being appended to
+        stats = self.storage.get_stats()
+        total = (stats["bytes"] + stats["legacy_bytes"] + self._graph_bytes()
+                 + sum(size for _, _, size in self._log_files(include_today=True)))
+
+        if total > max_bytes and hasattr(self.checkpointer, "prune"):
+            for entry in self._deletable_checkpoints():
+                pruned = self.checkpointer.prune(entry["session_id"], keep=1)
+                report["graph_bytes"] += pruned
+                total -= pruned
+                if total <= max_bytes:
+                    return
+
+        # Files ordered by when they were last written: a log at the end of its day.
+        # Legacy files of sessions still stored go with their session, the others on their own
+        legacy_sizes, files = {}, [(day + 86400, path, size, "log") for day, path, size in self._log_files()]
+        for session_id, path, size in self.storage.legacy_files():
+            if self.storage.has_checkpoint(session_id):
+                legacy_sizes[session_id] = size
+            else:
+                files.append((os.path.getmtime(path), path, size, "legacy"))
+        files.sort()
+        checkpoints = self._deletable_checkpoints()
+        entry = next(checkpoints, None)
+        batch = []
+        while total > max_bytes and (entry is not None or files):
+            if entry is not None and (not files or entry["timestamp"] <= files[0][0]):
+                batch.append(entry)
+                total -= entry["size"] + legacy_sizes.get(entry["session_id"], 0) + self._graph_bytes(entry["session_id"])
+                if len(batch) >= settings.RETENTION_BATCH_SIZE:
+                    self._delete_checkpoints(batch, report)
+                    batch = []
+                entry = next(checkpoints, None)
+            else:
+                _, path, size, kind = files.pop(0)
+                self._remove_file(path, size, report, kind)
+                total -= size
+        if batch:
+            self._delete_checkpoints(batch, report)
+
+    def start(self, interval: Optional[float] = None) -> None:
+        """Run a collection pass now and then every interval on a background thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        interval = interval or settings.RETENTION_INTERVAL
+        self._stop.clear()
+
+        def run():
+            while True:
+                try:
+                    self.collect()
+                except Exception as e:
+                    self._totals["errors"] += 1
+                    debug_logger.log("ERROR", "RETENTION", "Retention pass failed", {"error": str(e)})
+                if self._stop.wait(interval):
+                    return
+
+        self._thread = threading.Thread(target=run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background passes."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get the last pass report and totals since startup."""
+        return {"last_pass": self._last_report, "totals": dict(self._totals)}
@@ -1,9 +1,20 @@
 from typing import Annotated, Sequence, Dict, Any, List
+import operator
 from typing_extensions import TypedDict
 from langchain_core.messages import BaseMessage
 from langgraph.graph import add_messages
 
 
+def merge_summaries(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Combine the output summaries written by different nodes."""
+    return {**(left or {}), **(right or {})}
+
+
+def merge_task_results(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Join the results of task workers that ran in parallel, keyed by task ID."""
+    return {**(left or {}), **(right or {})}
+
+
 class AgentState(TypedDict):
     """State object for the LangGraph workflow."""
     messages: Annotated[Sequence[BaseMessage], add_messages]
@@ -11,6 +22,10 @@ class AgentState(TypedDict):
     task_delegation: str   # XML string
     xml_validation: str    # XML string
     final_qa_report: str   # XML string
+    # Parsed fields of each XML output (QA score, issue severities, tasks), keyed like the outputs
+    summaries: Annotated[Dict[str, Any], merge_summaries]
+    # Results of the delegated tasks, joined from the parallel task workers
+    task_results: Annotated[Dict[str, Dict[str, Any]], merge_task_results]
     human_review_required: bool
     human_feedback: str
-    verbose_logs: List[Dict[str, Any]]  # Verbose logs for UI display
\ No newline at end of file
+    verbose_logs: Annotated[List[Dict[str, Any]], operator.add]  # Verbose logs for UI display, appended by each node
\ No newline at end of file
@@ -0,0 +1,33 @@
+from typing import Dict, Any, List
+
+from src.utils.xml_summaries import output_summaries
+from src.config import settings
+
+
+def delegated_tasks(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Tasks of the delegation plan with unique IDs and dependencies limited to tasks in the plan."""
+    summary = output_summaries.from_state(state, "task_delegation") or {}
+    tasks = []
+    seen = set()
+    for index, task in enumerate(summary.get("tasks", [])[:settings.TASK_FANOUT_MAX_TASKS], start=1):
+        task_id = task.get("id") or str(index)
+        if task_id in seen:
+            task_id = f"{task_id}-{index}"
+        seen.add(task_id)
+        tasks.append({**task, "id": task_id})
+
+    ids = {task["id"] for task in tasks}
+    for task in tasks:
+        task["dependencies"] = [dep for dep in task.get("dependencies", []) if dep in ids and dep != task["id"]]
+    return tasks
+
+
+def ready_tasks(tasks: List[Dict[str, Any]], results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Tasks that have not run and whose dependencies have all finished.
+
+    If tasks remain but none is ready, the plan has a dependency cycle and
+    every remaining task is released so the run still finishes.
+    """
+    pending = [task for task in tasks if task["id"] not in results]
+    ready = [task for task in pending if all(dep in results for dep in task["dependencies"])]
+    return ready or pending
@@ -1,7 +1,13 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
 import os
 from datetime import datetime
 import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
 
 
 class LangSmithTracer:
@@ -104,44 +110,260 @@ class LangSmithTracer:
             json.dump(self.traces, f, indent=2)
 
 
+# Subdirectory of the checkpoint storage that legacy JSON files are moved to once imported
+LEGACY_IMPORTED_DIR = "imported"
+
+
 class CheckpointStorage:
-    """Storage for workflow checkpoints."""
+    """Indexed storage for workflow checkpoints.
+    
+    Checkpoints live in a single SQLite file, one row per session, with the
+    payload serialized by LangGraph's typed serializer and zlib-compressed.
+    Status and timestamp are indexed, so listing by status or time range
+    reads only the matching index entries. Checkpoint JSON files left in the
+    storage directory by earlier versions are imported once on startup.
+    """
     
-    def __init__(self, storage_path: str = "./checkpoints"):
+    def __init__(self, storage_path: str = "./checkpoints", db_name: str = "sessions.sqlite",
+                 import_legacy: bool = True):
         self.storage_path = storage_path
         # Create storage directory if it doesn't exist
         os.makedirs(storage_path, exist_ok=True)
+        self.db_path = os.path.join(storage_path, db_name)
+        self.serde = JsonPlusSerializer()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # Freed pages can be returned to the file system a few at a time (new databases only)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "session_id TEXT PRIMARY KEY, status TEXT, timestamp REAL NOT NULL, "
+            "size INTEGER NOT NULL, type TEXT NOT NULL, payload BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_checkpoints_status ON checkpoints(status, timestamp, session_id)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_checkpoints_timestamp ON checkpoints(timestamp, session_id)")
+        # Legacy JSON files already imported, which are not imported again
+        self._conn.execute("CREATE TABLE IF NOT EXISTS imported_files (filename TEXT PRIMARY KEY)")
+        self._conn.commit()
+        if import_legacy:
+            self.import_legacy_files()
+    
+    def _encode(self, checkpoint_data: Dict[str, Any]) -> Tuple[str, bytes]:
+        type_, payload = self.serde.dumps_typed(checkpoint_data)
+        return type_, zlib.compress(payload)
+    
+    def _decode(self, type_: str, payload: bytes) -> Dict[str, Any]:
+        return self.serde.loads_typed((type_, zlib.decompress(payload)))
     
     def save_checkpoint(self, session_id: str, checkpoint_data: Dict[str, Any]) -> None:
-        """Save a checkpoint."""
-        filepath = os.path.join(self.storage_path, f"{session_id}.json")
-        with open(filepath, 'w') as f:
-            json.dump(checkpoint_data, f, indent=2, default=str)
+        """Save a checkpoint, replacing the session's previous one."""
+        self.save_checkpoints([(session_id, checkpoint_data)])
+    
+    def save_checkpoints(self, checkpoints: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Save several checkpoints in one transaction."""
+        rows = []
+        for session_id, checkpoint_data in checkpoints:
+            type_, payload = self._encode(checkpoint_data)
+            timestamp = checkpoint_data.get("timestamp")
+            rows.append((session_id, checkpoint_data.get("status"), time.time() if timestamp is None else timestamp,
+                         len(payload), type_, payload))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO checkpoints (session_id, status, timestamp, size, type, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
     
     def load_checkpoint(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Load a checkpoint."""
-        filepath = os.path.join(self.storage_path, f"{session_id}.json")
-        if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                return json.load(f)
-        return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT type, payload FROM checkpoints WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return self._decode(*row) if row else None
     
-    def list_checkpoints(self) -> list:
-        """List all available checkpoints."""
-        checkpoints = []
-        for filename in os.listdir(self.storage_path):
-            if filename.endswith('.json'):
-                session_id = filename[:-5]  # Remove .json extension
-                checkpoints.append(session_id)
-        return checkpoints
+    def _query(self, columns: str, status: Optional[str], start: Optional[float], end: Optional[float],
+               after: Optional[Union[str, Tuple[float, str]]], limit: Optional[int]) -> List[tuple]:
+        """Select index rows in (timestamp, session ID) order."""
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        if isinstance(after, tuple):
+            # Keyset pagination: continue after the last session of the previous page
+            clauses.append("(timestamp, session_id) > (?, ?)")
+            params.extend(after)
+        elif after is not None:
+            clauses.append("(timestamp, session_id) > (SELECT timestamp, session_id FROM checkpoints WHERE session_id = ?)")
+            params.append(after)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = f"SELECT {columns} FROM checkpoints{where} ORDER BY timestamp, session_id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+    
+    def list_checkpoints(self, status: Optional[str] = None, start: Optional[float] = None,
+                         end: Optional[float] = None, after: Optional[Union[str, Tuple[float, str]]] = None,
+                         limit: Optional[int] = None) -> list:
+        """List session IDs, oldest first.
+        
+        Filters by status and by a ``[start, end)`` timestamp range. Pass the
+        last session ID of a page as ``after`` to get the next page, or its
+        ``(timestamp, session ID)`` if that session may have been deleted since.
+        """
+        return [row[0] for row in self._query("session_id", status, start, end, after, limit)]
+    
+    def list_checkpoint_entries(self, status: Optional[str] = None, start: Optional[float] = None,
+                                end: Optional[float] = None, after: Optional[Union[str, Tuple[float, str]]] = None,
+                                limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """List session IDs with their status, timestamp and stored size, without loading payloads."""
+        return [
+            {"session_id": session_id, "status": status_, "timestamp": timestamp, "size": size}
+            for session_id, status_, timestamp, size
+            in self._query("session_id, status, timestamp, size", status, start, end, after, limit)
+        ]
+    
+    def iter_checkpoints(self, status: Optional[str] = None, page_size: int = 500) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ``(session ID, checkpoint)`` pairs page by page."""
+        after = None
+        while True:
+            rows = self._query("session_id, type, payload", status, None, None, after, page_size)
+            for session_id, type_, payload in rows:
+                yield session_id, self._decode(type_, payload)
+            if len(rows) < page_size:
+                return
+            after = rows[-1][0]
+    
+    def count_checkpoints(self, status: Optional[str] = None) -> int:
+        """Count stored checkpoints, optionally with one status."""
+        with self._lock:
+            if status is None:
+                return self._conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM checkpoints WHERE status = ?", (status,)).fetchone()[0]
     
     def delete_checkpoint(self, session_id: str) -> bool:
         """Delete a checkpoint."""
-        filepath = os.path.join(self.storage_path, f"{session_id}.json")
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            return True
-        return False
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM checkpoints WHERE session_id = ?", (session_id,)).rowcount
+            self._conn.commit()
+        return deleted > 0
+    
+    def has_checkpoint(self, session_id: str) -> bool:
+        """Whether a checkpoint is stored for a session."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM checkpoints WHERE session_id = ?", (session_id,)
+            ).fetchone() is not None
+    
+    def delete_checkpoints(self, session_ids: List[str]) -> int:
+        """Delete several checkpoints in one transaction, with their legacy JSON files; returns the bytes removed."""
+        keys = [(session_id,) for session_id in session_ids]
+        with self._lock:
+            removed = 0
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                removed += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM checkpoints WHERE session_id IN ({placeholders})",
+                    [key[0] for key in chunk]
+                ).fetchone()[0]
+            self._conn.executemany("DELETE FROM checkpoints WHERE session_id = ?", keys)
+            self._conn.commit()
+        # An imported JSON file would otherwise keep a copy of the deleted session on disk
+        for session_id in session_ids:
+            path = os.path.join(self.storage_path, f"{session_id}.json")
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            removed += size
+        return removed
+    
+    def legacy_files(self) -> List[Tuple[str, str, int]]:
+        """Checkpoint JSON files left in the storage directory, as (session ID, path, size)."""
+        files = []
+        for filename in os.listdir(self.storage_path):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.storage_path, filename)
+            try:
+                files.append((filename[:-5], path, os.path.getsize(path)))
+            except OSError:
+                continue
+        return files
+    
+    def import_legacy_files(self) -> int:
+        """Import checkpoint JSON files from the storage directory that have not been imported before.
+        
+        Imported file names are recorded, so a file is imported once even
+        though it stays in place, and sessions deleted from the store since
+        do not come back. A session already in the store is never
+        overwritten by its JSON file.
+        """
+        with self._lock:
+            seen = {row[0] for row in self._conn.execute("SELECT filename FROM imported_files")}
+        imported, handled = [], []
+        for filename in os.listdir(self.storage_path):
+            if not filename.endswith('.json') or filename in seen:
+                continue
+            session_id = filename[:-5]  # Remove .json extension
+            with self._lock:
+                exists = self._conn.execute(
+                    "SELECT 1 FROM checkpoints WHERE session_id = ?", (session_id,)
+                ).fetchone()
+            if not exists:
+                try:
+                    with open(os.path.join(self.storage_path, filename), 'r') as f:
+                        checkpoint_data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if not isinstance(checkpoint_data, dict):
+                    continue
+                imported.append((session_id, checkpoint_data))
+            handled.append((filename,))
+        if imported:
+            self.save_checkpoints(imported)
+        if handled:
+            with self._lock:
+                self._conn.executemany("INSERT OR IGNORE INTO imported_files (filename) VALUES (?)", handled)
+                self._conn.commit()
+        return len(imported)
+    
+    def reclaim_space(self, max_pages: int = 1000) -> int:
+        """Return up to ``max_pages`` free pages to the file system; returns the bytes released."""
+        with self._lock:
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            free_before = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            self._conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+            free_after = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (free_before - free_after) * page_size
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get checkpoint counts per status, stored bytes and the size of leftover legacy files."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*), COALESCE(SUM(size), 0) FROM checkpoints GROUP BY status"
+            ).fetchall()
+        return {
+            "checkpoints": sum(row[1] for row in rows),
+            "bytes": sum(row[2] for row in rows),
+            "legacy_bytes": sum(size for _, _, size in self.legacy_files()),
+            "by_status": {status: count for status, count, _ in rows}
+        }
 
 
 # Global instances
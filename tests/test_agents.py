@@ -1,5 +1,6 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
 import sys
 import os
 
@@ -11,6 +12,7 @@ from agents.reasoning_agent import SeniorReasoningAgent
 from agents.delegation_agent import TaskDelegationAgent
 from agents.xml_agent import XMLFormatterAgent
 from agents.qa_agent import QualityAssuranceAgent
+from utils.llm_cache import LLMCache, MemoryCacheTier
 
 
 class TestBaseAgent(unittest.TestCase):
@@ -37,13 +39,16 @@ class TestBaseAgent(unittest.TestCase):
 class TestSeniorReasoningAgent(unittest.TestCase):
     """Test cases for the SeniorReasoningAgent class."""
     
+    ANALYSIS = ("<reasoning><step id=\"1\"><description>Read</description></step></reasoning>"
+                "<conclusion><summary>Done</summary></conclusion>")
+    
     def setUp(self):
         """Set up test fixtures."""
         # Mock the Ollama client to avoid actual API calls
-        with patch('src.agents.base.ollama.Client') as mock_client:
-            mock_instance = MagicMock()
-            mock_client.return_value = mock_instance
-            self.agent = SeniorReasoningAgent("qwen3:latest")
+        with patch('src.utils.ollama_client.ollama_clients.get_client') as mock_client:
+            self.client = MagicMock()
+            mock_client.return_value = self.client
+            self.agent = SeniorReasoningAgent("qwen3:latest", base_url="http://ollama-test:11434")
     
     def test_initialization(self):
         """Test agent initialization."""
@@ -57,6 +62,158 @@ class TestSeniorReasoningAgent(unittest.TestCase):
         self.assertIn("<reasoning>", prompt)
         self.assertIn("<variables>", prompt)
         self.assertIn("<conclusion>", prompt)
+    
+    def test_process_sync_and_async(self):
+        """Test that process and aprocess produce the same state update."""
+        self.client.chat.return_value = {"message": {"content": "<reasoning/>"}}
+        async_client = MagicMock()
+        async_client.chat = AsyncMock(return_value={"message": {"content": "<reasoning/>"}})
+        state = {"messages": ["Explain recursion"], "verbose_logs": []}
+        
+        sync_result = self.agent.process(state, use_cache=False)
+        with patch('src.utils.ollama_client.ollama_clients.get_async_client', return_value=async_client):
+            async_result = asyncio.run(self.agent.aprocess(state, use_cache=False))
+        
+        self.assertEqual(sync_result["problem_analysis"], "<reasoning/>")
+        self.assertEqual(async_result["problem_analysis"], "<reasoning/>")
+        self.assertEqual(len(async_result["verbose_logs"]), 1)
+        messages = async_client.chat.call_args.kwargs["messages"]
+        self.assertIn("Explain recursion", messages[-1]["content"])
+    
+    def test_call_llm_streams_tokens(self):
+        """Test that streamed chunks are forwarded and joined."""
+        self.client.chat.return_value = iter([
+            {"message": {"content": "<reasoning>"}},
+            {"message": {"content": ""}},
+            {"message": {"content": "</reasoning>"}}
+        ])
+        tokens = []
+        
+        response = self.agent.call_llm("prompt", stream=True, on_token=tokens.append, use_cache=False)
+        
+        self.assertEqual(response, "<reasoning></reasoning>")
+        self.assertEqual(tokens, ["<reasoning>", "</reasoning>"])
+        self.assertTrue(self.client.chat.call_args.kwargs["stream"])
+    
+    def test_streaming_stops_at_closing_tag(self):
+        """Test that the output ends once its closing tag arrives, while the stream is read to the end."""
+        def chunks():
+            yield {"message": {"content": "<conclusion>done</concl"}}
+            yield {"message": {"content": "usion> and more"}}
+            yield {"message": {"content": " even more"}, "done": True, "done_reason": "length"}
+        
+        self.client.chat.return_value = chunks()
+        tokens = []
+        
+        response = self.agent.call_llm("prompt", stream=True, on_token=tokens.append, use_cache=False)
+        
+        self.assertEqual(response, "<conclusion>done</conclusion>")
+        self.assertEqual("".join(tokens), response)
+        options = self.client.chat.call_args.kwargs["options"]
+        # qwen3 thinks first, so the closing tag is matched here rather than by a stop sequence
+        self.assertNotIn("stop", options)
+        self.assertIn("num_predict", options)
+        with patch.object(self.agent, "model", "gemma3:latest"):
+            self.assertEqual(self.agent.generation_profile()["stop"], ["</conclusion>"])
+    
+    def test_closing_tag_quoted_while_thinking_is_ignored(self):
+        """Test that a closing tag inside the think block neither ends the stream nor clips the output."""
+        answer = "<reasoning><step/></reasoning><conclusion>done</conclusion>"
+        thinking = "<think>I should finish with </conclusion> tag.</think>"
+        self.assertEqual(self.agent._finish_output(thinking + answer, "stop"), thinking + answer)
+        self.assertEqual(self.agent._finish_output("<think>end with </conclusion>", "length"), "<think>end with </conclusion>")
+        
+        def chunks():
+            for token in ("<think>I should finish with </concl", "usion> tag.</th", "ink>", answer, " trailing"):
+                yield {"message": {"content": token}}
+            yield {"message": {"content": ""}, "done": True}
+        
+        self.client.chat.return_value = chunks()
+        response = self.agent.call_llm("prompt", stream=True, use_cache=False)
+        self.assertEqual(response, thinking + answer)
+    
+    def test_malformed_stream_is_cancelled_and_retried(self):
+        """Test that broken XML stops the stream early and the request is retried with a correction."""
+        consumed = []
+        
+        def malformed():
+            for token in ("<think>plan <step></think>", "<reasoning><step id=\"1\"><description>a<br>", "</description>", " more"):
+                consumed.append(token)
+                yield {"message": {"content": token}}
+        
+        def valid():
+            yield {"message": {"content": "<reasoning><step id=\"1\"><description>a</description></step></reasoning>"}}
+            yield {"message": {"content": "<conclusion><summary>ok</summary></conclusion>"}}
+        
+        self.client.chat.side_effect = [malformed(), valid()]
+        events = []
+        
+        response = self.agent.call_llm("prompt", stream=True, on_event=events.append, use_cache=False)
+        
+        self.assertTrue(response.endswith("</conclusion>"))
+        self.assertNotIn(" more", consumed)
+        self.assertEqual([event["type"] for event in events], ["retry", "element", "element"])
+        self.assertEqual(events[1]["tag"], "step")
+        retry_messages = self.client.chat.call_args.kwargs["messages"]
+        self.assertEqual(retry_messages[-2]["role"], "assistant")
+        self.assertIn("<reasoning>", retry_messages[-1]["content"])
+    
+    def test_stop_sequence_closing_tag_is_restored(self):
+        """Test that the closing tag removed by the stop sequence is appended again."""
+        self.client.chat.return_value = {"message": {"content": "<conclusion>done"}, "done_reason": "stop"}
+        self.assertEqual(self.agent.call_llm("prompt", use_cache=False), "<conclusion>done</conclusion>")
+        
+        self.client.chat.return_value = {"message": {"content": "<conclusion>cut"}, "done_reason": "length"}
+        self.assertEqual(self.agent.call_llm("prompt", use_cache=False), "<conclusion>cut")
+    
+    def test_call_llm_records_ollama_counters(self):
+        """Test that token counts and timings are recorded per agent, model and session."""
+        final = {"message": {"content": ""}, "done": True, "eval_count": 50, "eval_duration": 2_000_000_000,
+                 "prompt_eval_count": 20, "prompt_eval_duration": 100_000_000, "load_duration": 500_000_000}
+        # The second output reaches its closing tag before the final chunk arrives
+        for tokens in (["<reasoning/>"], ["<conclusion>done</conclusion>", " trailing"]):
+            with self.subTest(tokens=tokens):
+                self.client.chat.return_value = iter([{"message": {"content": token}, "done": False} for token in tokens] + [final])
+                
+                with patch('src.utils.monitoring.performance_monitor.record_llm_call') as record_llm_call:
+                    self.agent.call_llm("prompt", stream=True, use_cache=False, session_id="session-1")
+                
+                stats = record_llm_call.call_args.args[0]
+                self.assertEqual(stats["agent"], "Senior Reasoning Agent")
+                self.assertEqual(stats["model"], "qwen3:latest")
+                self.assertEqual(stats["session"], "session-1")
+                self.assertEqual((stats["prompt_tokens"], stats["completion_tokens"]), (20, 50))
+                self.assertEqual(stats["tokens_per_sec"], 25)
+                self.assertEqual(stats["load_time"], 0.5)
+                self.assertLess(stats["time_to_first_token"], stats["duration"] + 1e-9)
+    
+    def test_call_llm_uses_cache(self):
+        """Test that a repeated identical request is served from the cache."""
+        self.agent.cache = LLMCache([MemoryCacheTier(max_entries=8)])
+        self.client.chat.return_value = {"message": {"content": self.ANALYSIS}}
+        
+        first = self.agent.call_llm("prompt", "system")
+        second = self.agent.call_llm("prompt", "system")
+        bypassed = self.agent.call_llm("prompt", "system", use_cache=False)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(bypassed, first)
+        self.assertEqual(self.client.chat.call_count, 2)
+        self.assertEqual(self.agent.cache.get_metrics()["hits"], 1)
+    
+    def test_call_llm_caches_only_complete_valid_outputs(self):
+        """Test that truncated or invalid outputs are not replayed from the cache."""
+        self.agent.cache = LLMCache([MemoryCacheTier(max_entries=8)])
+        for response in ({"message": {"content": self.ANALYSIS}, "done_reason": "length"},
+                         {"message": {"content": "<reasoning><step>unfinished"}, "done_reason": "stop"}):
+            self.client.chat.reset_mock()
+            self.client.chat.return_value = response
+            
+            self.agent.call_llm("prompt", "system")
+            self.agent.call_llm("prompt", "system")
+            
+            self.assertEqual(self.client.chat.call_count, 2)
+        self.assertEqual(self.agent.cache.get_metrics()["hits"], 0)
 
 
 class TestTaskDelegationAgent(unittest.TestCase):
@@ -65,7 +222,7 @@ class TestTaskDelegationAgent(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures."""
         # Mock the Ollama client to avoid actual API calls
-        with patch('src.agents.base.ollama.Client') as mock_client:
+        with patch('src.utils.ollama_client.ollama_clients.get_client') as mock_client:
             mock_instance = MagicMock()
             mock_client.return_value = mock_instance
             self.agent = TaskDelegationAgent("gemma3:latest")
@@ -89,10 +246,10 @@ class TestXMLFormatterAgent(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures."""
         # Mock the Ollama client to avoid actual API calls
-        with patch('src.agents.base.ollama.Client') as mock_client:
-            mock_instance = MagicMock()
-            mock_client.return_value = mock_instance
-            self.agent = XMLFormatterAgent("gemma3:latest")
+        with patch('src.utils.ollama_client.ollama_clients.get_client') as mock_client:
+            self.client = MagicMock()
+            mock_client.return_value = self.client
+            self.agent = XMLFormatterAgent("gemma3:latest", base_url="http://ollama-test:11434")
     
     def test_initialization(self):
         """Test agent initialization."""
@@ -105,6 +262,54 @@ class TestXMLFormatterAgent(unittest.TestCase):
         self.assertIn("XML Formatter & Validator", prompt)
         self.assertIn("<validation>", prompt)
         self.assertIn("<schema_validation>", prompt)
+    
+    def test_valid_plan_skips_the_model(self):
+        """Test that a well-formed, schema-valid plan is validated locally."""
+        plan = """Here is the plan:
+<delegation>
+  <task id="1" priority="high" dependencies="">
+    <description>Collect requirements</description>
+    <title>Requirements</title>
+    <agent role="analyst" model="qwen3" capability="analysis" />
+  </task>
+</delegation>"""
+        
+        result = self.agent.process({"task_delegation": plan, "verbose_logs": []}, use_cache=False)
+        
+        self.client.chat.assert_not_called()
+        report = result["xml_validation"]
+        self.assertTrue(report.startswith('<validation source="local">'))
+        self.assertIn("<status>valid</status>", report)
+        self.assertIn("<title>Requirements</title>", report)
+        self.assertEqual(self.agent.get_fast_path_metrics()["hits"], 1)
+    
+    def test_invalid_plan_falls_back_to_the_model(self):
+        """Test that malformed or off-schema plans are sent to the model for repair."""
+        self.client.chat.return_value = {"message": {"content": "<validation/>"}}
+        
+        for plan in ("<delegation><task id='1'><title>x</title>", "<delegation><task><title>x</title></task></delegation>"):
+            result = self.agent.process({"task_delegation": plan, "verbose_logs": []}, use_cache=False)
+            self.assertEqual(result["xml_validation"], "<validation/>")
+        
+        self.assertEqual(self.client.chat.call_count, 2)
+        self.assertEqual(self.agent.get_fast_path_metrics(), {"hits": 0, "misses": 2, "repaired": 0, "hit_rate": 0})
+    
+    def test_repairable_plan_skips_the_model(self):
+        """Test that mechanical defects are repaired locally instead of by the model."""
+        plan = """```xml
+<delegation>
+  <task id=1 priority="high">
+    <title>R&D</title>
+    <description>Line one<br>line two</description>
+</delegation>
+```"""
+        
+        result = self.agent.process({"task_delegation": plan, "verbose_logs": []}, use_cache=False)
+        
+        self.client.chat.assert_not_called()
+        self.assertIn("<title>R&amp;D</title>", result["xml_validation"])
+        self.assertIn("<issues_resolved>", result["xml_validation"])
+        self.assertEqual(self.agent.get_fast_path_metrics()["repaired"], 1)
 
 
 class TestQualityAssuranceAgent(unittest.TestCase):
@@ -113,7 +318,7 @@ class TestQualityAssuranceAgent(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures."""
         # Mock the Ollama client to avoid actual API calls
-        with patch('src.agents.base.ollama.Client') as mock_client:
+        with patch('src.utils.ollama_client.ollama_clients.get_client') as mock_client:
             mock_instance = MagicMock()
             mock_client.return_value = mock_instance
             self.agent = QualityAssuranceAgent("qwen3:latest")
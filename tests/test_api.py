@@ -8,6 +8,9 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from api.main import app
 from fastapi.testclient import TestClient
+from src.workflow.tracing import CheckpointStorage
+import api.main
+import tempfile
 
 
 class TestAPI(unittest.TestCase):
@@ -55,6 +58,34 @@ class TestAPI(unittest.TestCase):
             self.assertIn("models", data)
             # We expect at least 2 models, but there might be more
             self.assertGreaterEqual(len(data["models"]), 2)
+    
+    def test_checkpoint_pages_survive_deleted_cursor_row(self):
+        """Test that listing continues when the last session of a page is deleted before the next request."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage = CheckpointStorage(tmp_dir)
+            storage.save_checkpoints([(f"s{i}", {"status": "completed", "timestamp": 100.0 + i}) for i in range(5)])
+            with patch.object(api.main, "checkpoint_storage", storage):
+                first = self.client.get("/checkpoints", params={"limit": 2}).json()
+                storage.delete_checkpoint(first["checkpoints"][-1]["session_id"])
+                second = self.client.get("/checkpoints", params={"limit": 2, "after": first["next"]}).json()
+            storage._conn.close()
+        
+        self.assertEqual([entry["session_id"] for entry in first["checkpoints"]], ["s0", "s1"])
+        self.assertEqual([entry["session_id"] for entry in second["checkpoints"]], ["s2", "s3"])
+    
+    def test_retention_requires_admin(self):
+        """Test that a retention pass needs a session with the admin permission."""
+        user = api.main.security_manager.create_session("user", ["export_data"])
+        admin = api.main.security_manager.create_session("admin", ["admin"])
+        with patch.object(api.main, "retention_service") as retention_service:
+            retention_service.collect.return_value = {"checkpoints_deleted": 0}
+            self.assertEqual(self.client.post("/maintenance/retention").status_code, 401)
+            self.assertEqual(self.client.post("/maintenance/retention", headers={"authorization": user}).status_code, 403)
+            retention_service.collect.assert_not_called()
+            
+            response = self.client.post("/maintenance/retention", headers={"authorization": admin})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"checkpoints_deleted": 0})
 
 
 if __name__ == '__main__':
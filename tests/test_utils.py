@@ -0,0 +1,836 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lxml import etree
+import ollama
+import asyncio
+import glob
+import json
+import tempfile
+import threading
+import time
+import sys
+import os
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.events import SessionEventBroker, TokenBatcher, END_OF_STREAM, SUBSCRIBER_LAGGED, ReplayGap
+from utils.llm_cache import LLMCache, MemoryCacheTier, SQLiteCacheTier
+from utils.singleflight import SingleFlight
+from utils.ollama_client import CircuitBreaker, OllamaClient, OllamaClientRegistry
+from utils.ollama_router import OllamaHost, OllamaRouter, NoHealthyHostError
+from utils.model_scheduler import ModelAffinityScheduler
+from agents.base import BaseAgent
+from utils.warmup import ModelWarmupManager
+from utils.monitoring import PerformanceMonitor
+from utils.xml_stream import IncrementalXMLValidator, MalformedStreamError
+from utils.xml_repair import repair_xml
+from utils.xml_summaries import OutputSummaryCache
+from utils.xml_schemas import OUTPUT_SCHEMAS, create_schema_registry, load_checkpoint_outputs, schema_registry
+from src.config.settings import settings
+
+
+class TestSessionEventBroker(unittest.TestCase):
+    """Test cases for the SessionEventBroker class."""
+    
+    def test_fan_out_to_many_subscribers(self):
+        """Test that every subscriber receives each event in order."""
+        async def scenario():
+            broker = SessionEventBroker(replay_size=10, subscriber_queue_size=10)
+            broker.open("s1")
+            first = broker.subscribe("s1")
+            second = broker.subscribe("s1")
+            broker.publish("s1", {"type": "token", "content": "a"})
+            broker.close("s1")
+            await asyncio.sleep(0)
+            return [[await sub.queue.get() for _ in range(2)] for sub in (first, second)]
+        
+        for received in asyncio.run(scenario()):
+            self.assertEqual(received[0][0], 1)
+            self.assertEqual(received[0][1]["content"], "a")
+            self.assertIs(received[1], END_OF_STREAM)
+    
+    def test_resume_from_last_event_id(self):
+        """Test that a reconnecting subscriber only replays newer events."""
+        async def scenario():
+            broker = SessionEventBroker(replay_size=10, subscriber_queue_size=10)
+            broker.open("s1")
+            for i in range(3):
+                broker.publish("s1", {"n": i})
+            subscription = broker.subscribe("s1", last_event_id=2)
+            return subscription.queue.get_nowait()
+        
+        event_id, event = asyncio.run(scenario())
+        self.assertEqual(event_id, 3)
+        self.assertEqual(event["n"], 2)
+    
+    def test_resume_past_replay_buffer_reports_gap(self):
+        """Test that resuming from an event no longer buffered starts with a gap marker."""
+        async def scenario():
+            broker = SessionEventBroker(replay_size=2, subscriber_queue_size=10)
+            broker.open("s1")
+            for i in range(5):
+                broker.publish("s1", {"n": i})
+            stale = broker.subscribe("s1", last_event_id=1)
+            current = broker.subscribe("s1", last_event_id=3)
+            return [stale.queue.get_nowait() for _ in range(3)], current.queue.get_nowait()
+        
+        (gap, first, second), resumed = asyncio.run(scenario())
+        self.assertIsInstance(gap, ReplayGap)
+        self.assertEqual((gap.first_missed, gap.first_available), (2, 4))
+        self.assertEqual((first[0], second[0]), (4, 5))
+        self.assertEqual(resumed[0], 4)
+    
+    def test_tokens_are_published_in_chunks(self):
+        """Test that tokens are batched until the chunk is full or flushed."""
+        broker = SessionEventBroker(replay_size=10)
+        broker.open("s1")
+        tokens = TokenBatcher(broker, "s1", {"node": "qa"}, max_chars=6, max_delay=60)
+        for token in ("<qa", "_re", "port", ">", ""):
+            tokens.add(token)
+        tokens.flush()
+        tokens.flush()
+        
+        events = [event for _, event in broker._channels["s1"].replay]
+        self.assertEqual([(event["content"], event["tokens"]) for event in events], [("<qa_re", 2), ("port>", 2)])
+        self.assertTrue(all(event["type"] == "token" and event["node"] == "qa" for event in events))
+    
+    def test_slow_subscriber_is_cut_off(self):
+        """Test that a full subscriber queue marks the subscriber as lagged."""
+        async def scenario():
+            broker = SessionEventBroker(replay_size=10, subscriber_queue_size=2)
+            broker.open("s1")
+            subscription = broker.subscribe("s1")
+            for i in range(5):
+                broker.publish("s1", {"n": i})
+            await asyncio.sleep(0)
+            return subscription, broker.get_metrics()
+        
+        subscription, metrics = asyncio.run(scenario())
+        self.assertTrue(subscription.lagged)
+        self.assertIs(subscription.queue.get_nowait(), SUBSCRIBER_LAGGED)
+        self.assertEqual(metrics["lagged_subscribers"], 1)
+    
+    def test_forward_replays_and_relays_events(self):
+        """Test that a forwarded session gets the buffered and later events of its source."""
+        broker = SessionEventBroker(replay_size=10, subscriber_queue_size=10)
+        broker.open("leader")
+        broker.open("follower")
+        broker.publish("leader", {"type": "token", "session_id": "leader", "content": "a"})
+        broker.forward("leader", "follower")
+        broker.publish("leader", {"type": "token", "session_id": "leader", "content": "b"})
+        broker.close("leader")
+        broker.publish("leader", {"type": "token", "session_id": "leader", "content": "c"})
+        
+        events = list(broker._channels["follower"].replay)
+        self.assertEqual([(event_id, event["content"]) for event_id, event in events], [(1, "a"), (2, "b")])
+        self.assertTrue(all(event["session_id"] == "follower" for _, event in events))
+    
+    def test_reopened_session_starts_a_fresh_channel(self):
+        """Test that a closed session can be reopened for another run with continuing event IDs."""
+        async def scenario():
+            broker = SessionEventBroker(replay_size=10, subscriber_queue_size=10)
+            broker.open("s1")
+            broker.publish("s1", {"run": 1})
+            broker.close("s1")
+            broker.open("s1")
+            event_id = broker.publish("s1", {"run": 2})
+            subscription = broker.subscribe("s1")
+            return event_id, subscription.queue.get_nowait(), subscription.queue.empty()
+        
+        event_id, (replayed_id, event), drained = asyncio.run(scenario())
+        self.assertEqual((event_id, replayed_id, event["run"]), (2, 2, 2))
+        self.assertTrue(drained)
+    
+    def test_unknown_session_is_ignored(self):
+        """Test that events for sessions without a channel are dropped."""
+        broker = SessionEventBroker()
+        self.assertEqual(broker.publish("missing", {"type": "token"}), 0)
+
+
+
+class TestLLMCache(unittest.TestCase):
+    """Test cases for the LLMCache class and its tiers."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "cache.sqlite")
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_key_depends_on_model_options_and_messages(self):
+        """Test that the content address changes with any request input."""
+        messages = [{"role": "user", "content": "hi"}]
+        key = LLMCache.make_key("qwen3", messages)
+        self.assertEqual(key, LLMCache.make_key("qwen3", [dict(messages[0])]))
+        self.assertNotEqual(key, LLMCache.make_key("gemma3", messages))
+        self.assertNotEqual(key, LLMCache.make_key("qwen3", messages, {"temperature": 0}))
+    
+    def test_memory_tier_evicts_least_recently_used(self):
+        """Test that the memory tier keeps at most max_entries entries."""
+        tier = MemoryCacheTier(max_entries=2)
+        tier.set("a", "1")
+        tier.set("b", "2")
+        tier.get("a")
+        tier.set("c", "3")
+        self.assertEqual(tier.get("a")[0], "1")
+        self.assertIsNone(tier.get("b"))
+    
+    def test_disk_hit_is_promoted_to_memory(self):
+        """Test that entries survive a restart and are promoted on hit."""
+        LLMCache([SQLiteCacheTier(self.db_path)]).set("key", "value")
+        
+        cache = LLMCache([MemoryCacheTier(max_entries=4), SQLiteCacheTier(self.db_path)])
+        self.assertEqual(cache.get("key"), "value")
+        self.assertEqual(cache.get("key"), "value")
+        self.assertIsNone(cache.get("other"))
+        
+        metrics = cache.get_metrics()
+        self.assertEqual(metrics["tier_hits"], {"memory": 1, "disk": 1})
+        self.assertEqual(metrics["misses"], 1)
+    
+    def test_disk_tier_enforces_ttl_and_byte_budget(self):
+        """Test TTL expiry and least recently used eviction on the disk tier."""
+        tier = SQLiteCacheTier(self.db_path, ttl=60, max_bytes=10)
+        tier.set("old", "x" * 4, created_at=time.time() - 120)
+        self.assertIsNone(tier.get("old"))
+        
+        tier.set("a", "x" * 4)
+        tier.set("b", "x" * 4)
+        tier.set("c", "x" * 4)
+        self.assertIsNone(tier.get("a"))
+        self.assertEqual(tier.get("c")[0], "x" * 4)
+        self.assertLessEqual(tier.get_stats()["bytes"], 10)
+    
+    def test_promotion_keeps_creation_time(self):
+        """Test that an entry promoted from disk expires from memory when it was first stored."""
+        created_at = time.time() - 50
+        SQLiteCacheTier(self.db_path).set("key", "value", created_at=created_at)
+        memory = MemoryCacheTier(max_entries=4, ttl=60)
+        cache = LLMCache([memory, SQLiteCacheTier(self.db_path)])
+        
+        self.assertEqual(cache.get("key"), "value")
+        self.assertEqual(memory.get("key"), ("value", created_at))
+    
+    def test_disk_hits_write_access_times_in_batches(self):
+        """Test that reads only record access times, which are written once enough keys have piled up."""
+        tier = SQLiteCacheTier(self.db_path)
+        keys = [f"key{i}" for i in range(tier.access_flush_size)]
+        for key in keys:
+            tier.set(key, "value")
+        written = lambda: dict(tier._conn.execute("SELECT key, accessed_at FROM llm_cache").fetchall())
+        stored = written()
+        
+        for key in keys[:-1]:
+            tier.get(key)
+        self.assertEqual(written(), stored)
+        tier.get(keys[-1])
+        self.assertTrue(all(accessed_at > stored[key] for key, accessed_at in written().items()))
+
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for the SingleFlight class."""
+    
+    def test_concurrent_callers_share_one_execution(self):
+        """Test that callers arriving while a call is in flight share its result."""
+        flight = SingleFlight("test")
+        release = threading.Event()
+        calls = []
+        
+        def slow_call(value):
+            calls.append(value)
+            release.wait(5)
+            return value * 2
+        
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(flight.do, "key", slow_call, 21) for _ in range(4)]
+            while flight.get_metrics()["coalesced"] < 3:
+                time.sleep(0.01)
+            release.set()
+            results = [future.result() for future in futures]
+        
+        self.assertEqual(calls, [21])
+        self.assertEqual(sorted(joined for _, joined in results), [False, True, True, True])
+        self.assertTrue(all(result == 42 for result, _ in results))
+        self.assertEqual(flight.get_metrics()["in_flight"], 0)
+    
+    def test_followers_see_leader_context(self):
+        """Test that a joining caller gets the leader's context before it waits."""
+        flight = SingleFlight("test")
+        release = threading.Event()
+        joins = []
+        
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, "key", lambda: release.wait(5), context="leader", on_join=joins.append)
+            while flight.get_metrics()["in_flight"] < 1:
+                time.sleep(0.01)
+            follower = pool.submit(flight.do, "key", lambda: None, context="follower", on_join=joins.append)
+            while not joins:
+                time.sleep(0.01)
+            release.set()
+            self.assertEqual((leader.result(), follower.result()), ((True, False), (True, True)))
+        
+        self.assertEqual(joins, ["leader"])
+    
+    def test_async_followers_share_errors(self):
+        """Test that async followers see the leader's exception and the key is released."""
+        flight = SingleFlight("test")
+        
+        async def failing_call():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+        
+        async def scenario():
+            return await asyncio.gather(
+                flight.ado("key", failing_call),
+                flight.ado("key", failing_call),
+                return_exceptions=True
+            )
+        
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(flight.get_metrics(), {"in_flight": 0, "executions": 1, "coalesced": 1})
+
+
+
+class TestOllamaClientRegistry(unittest.TestCase):
+    """Test cases for the OllamaClientRegistry class."""
+    
+    def test_clients_are_shared_per_base_url(self):
+        """Test that one pooled client is reused for each base URL."""
+        registry = OllamaClientRegistry()
+        client = registry.get_client("http://localhost:11434")
+        self.assertIs(registry.get_client("http://localhost:11434/"), client)
+        self.assertIsNot(registry.get_client("http://other:11434"), client)
+        self.assertEqual(registry.get_metrics()["clients"], 2)
+        registry.close()
+    
+    def test_async_clients_are_shared_per_event_loop(self):
+        """Test that async clients are reused within a loop but not across loops."""
+        registry = OllamaClientRegistry()
+        
+        async def scenario():
+            first = registry.get_async_client("http://localhost:11434")
+            self.assertIs(registry.get_async_client("http://localhost:11434"), first)
+            await registry.aclose()
+            return first
+        
+        self.assertIsNot(asyncio.run(scenario()), asyncio.run(scenario()))
+        self.assertEqual(registry.get_metrics()["async_clients"], 0)
+
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test cases for the CircuitBreaker class and its use in OllamaClient."""
+    
+    def test_opens_after_threshold_and_half_opens_after_timeout(self):
+        """Test the closed, open and half-open transitions."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.record_failure())
+        self.assertFalse(breaker.allow_request())
+        
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_calls_skip_the_health_round_trip(self):
+        """Test that chat goes straight to the server and trips the circuit on failures."""
+        client = OllamaClient("http://localhost:11434")
+        client.client = MagicMock()
+        client.client.chat.return_value = {"message": {"content": "hi"}}
+        
+        self.assertEqual(client.chat("qwen3", [{"role": "user", "content": "hi"}]), {"message": {"content": "hi"}})
+        client.client.list.assert_not_called()
+        
+        client.client.chat.side_effect = ConnectionError("refused")
+        for _ in range(client.breaker.failure_threshold + 1):
+            self.assertEqual(client.chat("qwen3", []), {})
+        self.assertFalse(client.is_connected())
+        self.assertEqual(client.client.chat.call_count, client.breaker.failure_threshold + 1)
+
+
+
+class FakeOllamaServer:
+    """Minimal Ollama server that generates one response at a time."""
+    
+    def __init__(self, models, generation_time):
+        lock = threading.Lock()
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._reply({"models": [{"model": model, "name": model} for model in models]})
+            
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with lock:
+                    time.sleep(generation_time)
+                self._reply({"model": body["model"], "done": True,
+                             "message": {"role": "assistant", "content": "ok"}})
+            
+            def _reply(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestOllamaRouter(unittest.TestCase):
+    """Test cases for the OllamaRouter class."""
+    
+    def _chat(self, router, model="qwen3:latest"):
+        return router.call(model, lambda host: host.client.chat(model=model, messages=[])["message"]["content"])
+    
+    def test_routes_to_least_loaded_host_with_model(self):
+        """Test host selection by inventory and in-flight requests."""
+        hosts = [OllamaHost(f"http://host{i}:11434", client=MagicMock()) for i in range(3)]
+        hosts[0].models = {"gemma3:latest"}
+        router = OllamaRouter(hosts)
+        
+        first = router.acquire("qwen3")
+        second = router.acquire("qwen3")
+        self.assertEqual({first, second}, {hosts[1], hosts[2]})
+        self.assertIs(router.acquire("gemma3:latest"), hosts[0])
+    
+    def test_fails_over_and_ejects_unreachable_hosts(self):
+        """Test that connection errors move the call to another host and eject the failing one."""
+        down, up = OllamaHost("http://down:11434", client=MagicMock()), OllamaHost("http://up:11434", client=MagicMock())
+        down.client.chat.side_effect = ConnectionError("refused")
+        up.client.chat.return_value = {"message": {"content": "ok"}}
+        router = OllamaRouter([down, up])
+        
+        for _ in range(down.breaker.failure_threshold + 2):
+            self.assertEqual(self._chat(router), "ok")
+        self.assertEqual(down.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(down.client.chat.call_count, down.breaker.failure_threshold)
+        
+        up.client.chat.side_effect = ConnectionError("refused")
+        for _ in range(up.breaker.failure_threshold):
+            with self.assertRaises(ConnectionError):
+                self._chat(router)
+        with self.assertRaises(NoHealthyHostError):
+            self._chat(router)
+    
+    def test_server_errors_trip_the_breaker_but_rejections_do_not(self):
+        """Test that 5xx response errors count against a host while 4xx ones pass through."""
+        host = OllamaHost("http://oom:11434", client=MagicMock())
+        router = OllamaRouter([host])
+        
+        host.client.chat.side_effect = ollama.ResponseError("model not found", 404)
+        for _ in range(host.breaker.failure_threshold):
+            with self.assertRaises(ollama.ResponseError):
+                self._chat(router)
+        self.assertEqual(host.breaker.state, CircuitBreaker.CLOSED)
+        
+        host.client.chat.side_effect = ollama.ResponseError("model requires more system memory", 500)
+        for _ in range(host.breaker.failure_threshold):
+            with self.assertRaises(ollama.ResponseError):
+                self._chat(router)
+        self.assertEqual(host.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(router.get_metrics()[host.base_url]["failures"], host.breaker.failure_threshold)
+    
+    def test_throughput_scales_with_hosts(self):
+        """Test that requests spread over several fake Ollama servers finish proportionally faster."""
+        servers = [FakeOllamaServer(["qwen3:latest"], generation_time=0.05) for _ in range(4)]
+        try:
+            def run(hosts, requests=16):
+                router = OllamaRouter.from_urls([server.url for server in hosts])
+                router.refresh_inventory()
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=requests) as pool:
+                    results = list(pool.map(lambda _: self._chat(router), range(requests)))
+                self.assertEqual(results, ["ok"] * requests)
+                return time.perf_counter() - started, router
+            
+            single, _ = run(servers[:1])
+            multi, router = run(servers)
+            
+            self.assertLess(multi, single / 2.5)
+            served = [host["served"] for host in router.get_metrics().values()]
+            self.assertEqual(sum(served), 16)
+            self.assertTrue(all(count >= 2 for count in served))
+        finally:
+            for server in servers:
+                server.stop()
+
+
+
+class TestModelAffinityScheduler(unittest.TestCase):
+    """Test cases for the ModelAffinityScheduler class."""
+    
+    def _run_queued(self, scheduler, models):
+        """Queue one call per model behind a held qwen3 call and return the admission order."""
+        order = []
+        
+        def call(model):
+            with scheduler.slot(model):
+                order.append(model)
+        
+        holder = scheduler.slot("qwen3")
+        holder.__enter__()
+        threads = []
+        for model in models:
+            threads.append(threading.Thread(target=call, args=(model,)))
+            threads[-1].start()
+            while sum(scheduler.get_metrics()["queued"].values()) < len(threads):
+                time.sleep(0.005)
+        time.sleep(0.06)
+        holder.__exit__(None, None, None)
+        for thread in threads:
+            thread.join(5)
+        return order
+    
+    def test_batches_calls_by_loaded_model(self):
+        """Test that queued calls for the loaded model run before switching."""
+        scheduler = ModelAffinityScheduler(max_concurrent=1, max_wait=60)
+        order = self._run_queued(scheduler, ["gemma3", "qwen3", "gemma3", "qwen3"])
+        
+        self.assertEqual(order, ["qwen3", "qwen3", "gemma3", "gemma3"])
+        self.assertEqual(scheduler.get_metrics()["switches"], 1)
+    
+    def test_max_wait_forces_a_switch(self):
+        """Test that a call waiting past max_wait is served before newer calls for the loaded model."""
+        scheduler = ModelAffinityScheduler(max_concurrent=1, max_wait=0.05)
+        order = self._run_queued(scheduler, ["gemma3", "qwen3"])
+        
+        self.assertEqual(order, ["gemma3", "qwen3"])
+        metrics = scheduler.get_metrics()
+        self.assertEqual(metrics["switches"], 2)
+        self.assertGreaterEqual(metrics["forced_switches"], 1)
+    
+    def test_async_callers_share_the_queue(self):
+        """Test that async slots are admitted and released."""
+        scheduler = ModelAffinityScheduler(max_concurrent=2, max_wait=60)
+        
+        async def call(model):
+            async with scheduler.aslot(model):
+                await asyncio.sleep(0.01)
+                return model
+        
+        async def scenario():
+            return await asyncio.gather(*(call(model) for model in ["qwen3", "gemma3", "qwen3"]))
+        
+        self.assertEqual(asyncio.run(scenario()), ["qwen3", "gemma3", "qwen3"])
+        metrics = scheduler.get_metrics()
+        self.assertEqual(metrics["running"], 0)
+        self.assertEqual(metrics["models"]["qwen3"]["admitted"], 2)
+    
+    def test_hosts_run_different_models_at_once(self):
+        """Test that agent calls routed to two hosts are scheduled per host rather than one model at a time."""
+        class Agent(BaseAgent):
+            def get_system_prompt(self):
+                return ""
+        
+        servers = [FakeOllamaServer(["qwen3:latest"], generation_time=0.1), FakeOllamaServer(["gemma3:latest"], generation_time=0.1)]
+        try:
+            router = OllamaRouter.from_urls([server.url for server in servers])
+            router.refresh_inventory()
+            scheduler = ModelAffinityScheduler(max_concurrent=4, max_wait=60)
+            agents = []
+            for model in ("qwen3:latest", "gemma3:latest"):
+                agent = Agent("Test Agent", model)
+                agent.router, agent.scheduler, agent.warmup = router, scheduler, None
+                agents.append(agent)
+            
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda agent: agent._chat([{"role": "user", "content": "hi"}], False, None)[0], agents * 4))
+            elapsed = time.perf_counter() - started
+            
+            self.assertEqual(results, ["ok"] * 8)
+            # Each server generates one response at a time: 4 x 0.1s per host side by side, 0.8s if the models took turns
+            self.assertLess(elapsed, 0.65)
+            metrics = scheduler.get_metrics()
+            self.assertEqual(
+                {host: stats["active_model"] for host, stats in metrics["hosts"].items()},
+                {servers[0].url: "qwen3:latest", servers[1].url: "gemma3:latest"}
+            )
+            self.assertEqual(metrics["switches"], 0)
+        finally:
+            for server in servers:
+                server.stop()
+
+
+
+class TestModelWarmupManager(unittest.TestCase):
+    """Test cases for the ModelWarmupManager class."""
+    
+    def setUp(self):
+        self.host = OllamaHost("http://ollama-test:11434", client=MagicMock())
+        self.manager = ModelWarmupManager(OllamaRouter([self.host]), models=["qwen3:latest", "gemma3:latest"])
+    
+    def test_warm_all_loads_every_model(self):
+        """Test that warm-up sends an empty generate per model and reports them loaded."""
+        self.manager.warm_all()
+        
+        prompts = [call.kwargs["prompt"] for call in self.host.client.generate.call_args_list]
+        self.assertEqual(prompts, ["", ""])
+        self.assertEqual({m: s["status"] for m, s in self.manager.get_status().items()},
+                         {"qwen3:latest": "loaded", "gemma3:latest": "loaded"})
+    
+    def test_restart_is_rewarmed_but_eviction_is_not(self):
+        """Test that a host that was down is re-warmed while evicted or expired models are only marked cold."""
+        self.manager.warm_all()
+        self.host.client.ps.return_value = {"models": [{"model": "gemma3:latest"}]}
+        self.manager.check_hosts()
+        self.assertEqual(self.manager.get_status()["qwen3:latest"]["status"], "cold")
+        self.assertEqual(self.host.client.generate.call_count, 2)
+        
+        # Both models unloaded after their keep-alive expired
+        self.host.client.ps.return_value = {"models": []}
+        for _ in range(3):
+            self.manager.check_hosts()
+        self.assertEqual(self.host.client.generate.call_count, 2)
+        self.assertEqual(self.manager.get_status()["gemma3:latest"]["status"], "cold")
+        self.assertEqual(self.manager.get_metrics()["restarts_detected"], 0)
+        
+        self.host.client.ps.side_effect = ConnectionError("refused")
+        self.manager.check_hosts()
+        self.host.client.ps.side_effect = None
+        self.manager.check_hosts()
+        self.manager.check_hosts()
+        self.assertEqual(self.host.client.generate.call_count, 4)
+        self.assertEqual(self.manager.get_metrics()["restarts_detected"], 1)
+    
+    def test_host_with_failing_calls_is_rewarmed_once_it_recovers(self):
+        """Test that a host whose circuit breaker opened is warmed again after it closes."""
+        self.manager.warm_all()
+        self.host.client.ps.return_value = {"models": []}
+        for _ in range(self.host.breaker.failure_threshold):
+            self.host.breaker.record_failure()
+        self.manager.check_hosts()
+        self.assertEqual(self.host.client.generate.call_count, 2)
+        
+        self.host.breaker.record_success()
+        self.manager.check_hosts()
+        self.assertEqual(self.host.client.generate.call_count, 4)
+        self.assertEqual(self.manager.get_metrics()["restarts_detected"], 1)
+    
+    def test_keep_alive_follows_traffic(self):
+        """Test that recently used models are kept loaded for longer."""
+        idle = self.manager.keep_alive_for("qwen3:latest")
+        self.manager.record_use("qwen3:latest")
+        self.assertNotEqual(self.manager.keep_alive_for("qwen3:latest"), idle)
+    
+    def test_agent_call_after_idle_period_gets_idle_keep_alive(self):
+        """Test that an agent's keep_alive reflects the traffic before its call, not the call itself."""
+        class Agent(BaseAgent):
+            def get_system_prompt(self):
+                return ""
+        
+        agent = Agent("Test Agent", "qwen3:latest")
+        agent.warmup = self.manager
+        with patch.object(settings, "WARMUP_KEEP_ALIVE_IDLE", "5m"), \
+             patch.object(settings, "WARMUP_KEEP_ALIVE_ACTIVE", "30m"):
+            self.assertEqual(agent._chat_options()["keep_alive"], "5m")
+            self.assertEqual(agent._chat_options()["keep_alive"], "30m")
+
+
+
+class TestPerformanceMonitorLLMMetrics(unittest.TestCase):
+    """Test cases for the LLM call metrics of PerformanceMonitor."""
+    
+    def test_aggregates_by_agent_model_and_session(self):
+        """Test per-group totals and distributions of recorded calls."""
+        with tempfile.TemporaryDirectory() as log_path:
+            monitor = PerformanceMonitor(log_path)
+        for session, tokens in (("s1", 10), ("s1", 30), ("s2", 20)):
+            monitor.record_llm_call({
+                "agent": "QA", "model": "qwen3", "session": session, "prompt_tokens": 5,
+                "completion_tokens": tokens, "prompt_eval_time": 0.5, "eval_time": 1.0, "load_time": 0.0,
+                "duration": 1.5, "tokens_per_sec": tokens, "time_to_first_token": 0.5
+            })
+        
+        metrics = monitor.get_llm_metrics()
+        self.assertEqual(metrics["calls"], 3)
+        self.assertEqual(metrics["by_model"]["qwen3"]["tokens_per_sec"], 20)
+        self.assertEqual(metrics["distributions"]["tokens_per_sec"]["max"], 30)
+        self.assertEqual(monitor.get_session_llm_metrics("s1")["completion_tokens"], 40)
+        self.assertIsNone(monitor.get_session_llm_metrics("unknown"))
+
+
+class TestSchemaRegistry(unittest.TestCase):
+    """Test cases for the SchemaRegistry class."""
+    
+    REASONING = """<think>I will write <reasoning> next</think>
+<reasoning>
+  <step id="1" type="analysis"><description>Read the prompt</description></step>
+</reasoning>
+<variables><var name="content" type="string"/></variables>
+<conclusion><summary>Done</summary></conclusion>"""
+    QA_REPORT = """<qa_report>
+  <accuracy><score>92</score></accuracy>
+  <recommendation><action>approve</action></recommendation>
+</qa_report>"""
+    
+    def setUp(self):
+        self.registry = create_schema_registry()
+    
+    def test_validates_each_output_type(self):
+        """Test valid outputs, schema violations and malformed XML."""
+        self.assertTrue(self.registry.validate("reasoning", self.REASONING)["valid"])
+        self.assertTrue(self.registry.validate("qa_report", self.QA_REPORT)["valid"])
+        
+        wrong_action = self.registry.validate("qa_report", self.QA_REPORT.replace("approve", "ship it"))
+        self.assertFalse(wrong_action["valid"])
+        self.assertTrue(wrong_action["well_formed"])
+        
+        malformed = self.registry.validate("delegation", "<delegation><task><br></task></delegation>")
+        self.assertFalse(malformed["well_formed"])
+    
+    def test_batch_validation_across_threads(self):
+        """Test that parallel batches match sequential validation."""
+        items = [("qa_report", self.QA_REPORT), ("qa_report", "no xml"), ("reasoning", self.REASONING)] * 200
+        results = self.registry.validate_batch(items, max_workers=8)
+        self.assertEqual([r["valid"] for r in results], [True, False, True] * 200)
+    
+    def test_checkpoint_conformance_by_model(self):
+        """Test conformance rates for outputs stored in checkpoints."""
+        checkpoints = [
+            {"state": {"problem_analysis": self.REASONING, "final_qa_report": qa_report}}
+            for qa_report in (self.QA_REPORT, "not xml")
+        ]
+        report = self.registry.validate_checkpoints(iter(checkpoints))
+        
+        self.assertEqual(report["checkpoints"], 2)
+        self.assertEqual(report["by_schema"]["reasoning"]["conformance_rate"], 1.0)
+        self.assertEqual(report["by_schema"]["qa_report"]["conformance_rate"], 0.5)
+        self.assertEqual(sum(entry["validated"] for entry in report["by_model"].values()), 4)
+
+
+class TestIncrementalXMLValidator(unittest.TestCase):
+    """Test cases for the IncrementalXMLValidator class."""
+    
+    def feed_all(self, validator, tokens):
+        for token in tokens:
+            validator.feed(token)
+    
+    def test_reports_completed_elements_while_streaming(self):
+        """Test that elements under a root are reported as they close, after skipping prose and thinking."""
+        elements = []
+        validator = IncrementalXMLValidator(["delegation"], on_element=lambda e: elements.append(e.get("id")))
+        self.feed_all(validator, ["<think>draft <delegation>?</think>\n```xml\n<?xml version=\"1.0\"?>\n<dele",
+                                  "gation><task id=\"1\"><title>A</title></task>", "<task id=\"2\">"])
+        self.assertEqual(elements, ["1"])
+        validator.feed("</task></delegation>")
+        self.assertEqual(elements, ["1", "2"])
+        self.assertIsNone(validator.error)
+    
+    def test_detects_broken_structure_early(self):
+        """Test wrong roots, mismatched close tags and missing XML."""
+        with self.assertRaises(MalformedStreamError):
+            IncrementalXMLValidator(["delegation"]).feed("Here it is: <plan><task>")
+        
+        validator = IncrementalXMLValidator(["delegation"])
+        validator.feed("<delegation><task><title>x<br>")
+        with self.assertRaises(MalformedStreamError):
+            validator.feed("</title>")
+        
+        with self.assertRaises(MalformedStreamError):
+            IncrementalXMLValidator(["delegation"], max_preamble=10).feed("Sure, let me explain at length")
+    
+    def test_non_strict_records_the_error(self):
+        """Test that a non-strict validator stops parsing without raising."""
+        validator = IncrementalXMLValidator(["qa_report"], strict=False)
+        self.feed_all(validator, ["<qa_report>", "</metadata>", "<more/>"])
+        self.assertIn("XML Parse Error", validator.error)
+
+
+class TestXMLRepair(unittest.TestCase):
+    """Test cases for the deterministic XML repair engine."""
+    
+    # Defect classes seen in recorded outputs, with the expected repair
+    CORPUS = [
+        ("Sure!\n```xml\n<?xml version=\"1.0\"?>\n<delegation><task id=\"1\"/></delegation>\n```\nHope this helps.",
+         '<delegation><task id="1"/></delegation>'),
+        ("<qa_report><accuracy><score>90</score></qa_report>",
+         "<qa_report><accuracy><score>90</score></accuracy></qa_report>"),
+        ("<validation><input>R&D &amp; QA, 1 < 2</input></validation>",
+         "<validation><input>R&amp;D &amp; QA, 1 &lt; 2</input></validation>"),
+        ("<delegation><task id=1 priority='high' done></task></delegation>",
+         '<delegation><task id="1" priority="high" done="done"></task></delegation>'),
+        ("<reasoning><step>a<br>b</description></step></reasoning>",
+         "<reasoning><step>a\nb</step></reasoning>"),
+        ("<think>draft <reasoning></think><reasoning><step>x",
+         "<reasoning><step>x</step></reasoning>"),
+    ]
+    
+    def test_repairs_each_defect_class(self):
+        """Test the corpus of defect classes."""
+        for text, expected in self.CORPUS:
+            with self.subTest(text=text):
+                self.assertEqual(repair_xml(text)["xml"], expected)
+    
+    def test_recorded_outputs_become_well_formed(self):
+        """Test that every recorded agent output with a root element parses after repair."""
+        checkpoints = os.path.join(os.path.dirname(__file__), "..", "checkpoints", "*.json")
+        repaired = 0
+        for path in glob.glob(checkpoints):
+            for output_key, text in load_checkpoint_outputs(path).items():
+                roots = schema_registry.roots(OUTPUT_SCHEMAS[output_key])
+                result = repair_xml(text, roots)
+                if result["xml"] is not None:
+                    etree.fromstring(f"<outputs>{result['xml']}</outputs>".encode("utf-8"))
+                    repaired += 1
+        self.assertGreater(repaired, 0)
+    
+    def test_valid_xml_is_unchanged(self):
+        """Test that well-formed XML passes through without repairs."""
+        xml = '<delegation><task id="1"><title>A &amp; B</title><!-- note --></task></delegation>'
+        self.assertEqual(repair_xml(xml), {"xml": xml, "repairs": [], "changed": False})
+
+
+class TestOutputSummaryCache(unittest.TestCase):
+    """Test cases for the OutputSummaryCache class."""
+    
+    def test_summarizes_each_output_once(self):
+        """Test typed fields extracted from outputs and reuse of cached summaries."""
+        cache = OutputSummaryCache(max_entries=8)
+        plan = """```xml
+<delegation>
+  <task id="1" priority="high" dependencies=""><title>Plan</title><agent role="analyst"/></task>
+  <task id="2" dependencies="1, 3"><title>Build & test</title></task>
+</delegation>```"""
+        
+        tasks = cache.summarize("task_delegation", plan)["tasks"]
+        self.assertEqual([task["dependencies"] for task in tasks], [[], ["1", "3"]])
+        self.assertEqual(tasks[0]["agent_role"], "analyst")
+        self.assertEqual(tasks[1]["title"], "Build & test")
+        
+        analysis = "<reasoning><step id=\"1\" type=\"analysis\"><description>Read</description></step></reasoning>" \
+                   "<conclusion><summary>Done</summary></conclusion>"
+        summary = cache.summarize("problem_analysis", analysis)
+        self.assertEqual((summary["steps"][0]["type"], summary["conclusion"]), ("analysis", "Done"))
+        
+        self.assertIs(cache.summarize("task_delegation", plan), cache.summarize("task_delegation", plan))
+        self.assertIsNone(cache.summarize("final_qa_report", "no report"))
+        self.assertEqual(cache.get_metrics()["hits"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 from unittest.mock import patch, MagicMock
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import os
 
@@ -8,6 +9,24 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from workflow.state import AgentState
 from workflow.engine import WorkflowEngine
+from workflow.executor import WorkflowExecutor, WorkflowQueueFullError
+from workflow.human_review import HumanReviewInterface
+from src.workflow.checkpointer import SQLiteCheckpointSaver
+from src.workflow.tracing import CheckpointStorage
+from src.workflow.checkpoint_writer import CheckpointWriter
+from src.workflow.retention import RetentionService
+from src.utils.helpers import load_json_log
+from src.utils.events import event_broker
+from src.utils.singleflight import workflow_singleflight
+from src.config.settings import settings
+from utils.ollama_router import OllamaHost, OllamaRouter
+import time
+import threading
+import asyncio
+import tempfile
+import json
+import queue
+import workflow.executor
 
 
 class TestAgentState(unittest.TestCase):
@@ -24,6 +43,7 @@ class TestAgentState(unittest.TestCase):
             "task_delegation", 
             "xml_validation", 
             "final_qa_report",
+            "summaries",
             "human_review_required",
             "human_feedback",
             "verbose_logs"
@@ -39,7 +59,7 @@ class TestWorkflowEngine(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures."""
         # Mock the Ollama client to avoid actual API calls
-        with patch('src.agents.base.ollama.Client') as mock_client:
+        with patch('src.utils.ollama_client.ollama_clients.get_client') as mock_client:
             mock_instance = MagicMock()
             mock_client.return_value = mock_instance
             self.workflow_engine = WorkflowEngine()
@@ -73,5 +93,601 @@ class TestWorkflowEngine(unittest.TestCase):
         self.assertTrue(callable(self.workflow_engine.run))
 
 
+class TestHumanReviewInterface(unittest.TestCase):
+    """Test cases for the review routing decision."""
+    
+    def report(self, score, severity):
+        return f"""<qa_report>
+  <accuracy><score>{score}</score><issues><issue severity="{severity}"><description>x</description></issue></issues></accuracy>
+  <recommendation><action>approve</action></recommendation>
+</qa_report>"""
+    
+    def test_routes_on_parsed_score_and_severities(self):
+        """Test that review follows the parsed QA score and issue severities."""
+        interface = HumanReviewInterface()
+        self.assertFalse(interface.should_request_review({"final_qa_report": self.report(92, "minor")}))
+        self.assertTrue(interface.should_request_review({"final_qa_report": self.report(92, "Major")}))
+        self.assertTrue(interface.should_request_review({"final_qa_report": self.report(61, "minor")}))
+        # A mention of "critical" outside an issue severity no longer forces a review
+        report = self.report(95, "minor").replace("<action>", "<details>No critical issues</details><action>")
+        self.assertFalse(interface.should_request_review({"final_qa_report": report}))
+    
+    def test_uses_summary_carried_in_state(self):
+        """Test that a summary already in the state is used without parsing the report."""
+        state = {"final_qa_report": "", "summaries": {"final_qa_report": {"score": 50.0, "severities": {}}}}
+        self.assertTrue(HumanReviewInterface().should_request_review(state))
+
+
+class TestTaskFanOut(unittest.TestCase):
+    """Test cases for the parallel execution of delegated tasks."""
+    
+    PLAN = """<delegation>
+  <task id="1"><title>Schema</title><description>Design</description></task>
+  <task id="2" dependencies="1"><title>API</title><description>Build</description></task>
+  <task id="3"><title>Docs</title><description>Write</description></task>
+  <task id="4"><title>Tests</title><description>Write</description></task>
+</delegation>"""
+    TASK_DELAY = 0.3
+    QA_SCORE = 95
+    
+    def fake_chat(self, model, messages, stream=False, **kwargs):
+        """Answer each agent by its system prompt; task workers take TASK_DELAY seconds."""
+        system = messages[0]["content"]
+        if "Task Worker" in system:
+            time.sleep(self.TASK_DELAY)
+            task_id = messages[-1]["content"].split("Task ", 1)[1].split(":", 1)[0]
+            self.worker_prompts[task_id] = messages[-1]["content"]
+            content = f'<task_result id="{task_id}"><status>completed</status><output>done {task_id}</output></task_result>'
+        elif "Task Delegation" in system:
+            content = self.PLAN
+        elif "Quality Assurance" in system:
+            self.qa_prompt = messages[-1]["content"]
+            content = f"<qa_report><accuracy><score>{self.QA_SCORE}</score></accuracy><recommendation><action>approve</action></recommendation></qa_report>"
+        else:
+            content = "<reasoning><step id=\"1\"><description>x</description></step></reasoning><conclusion><summary>y</summary></conclusion>"
+        response = {"message": {"content": content}, "done": True, "done_reason": "stop"}
+        return (chunk for chunk in [response]) if stream else response
+    
+    def setUp(self):
+        self.worker_prompts = {}
+        self.qa_prompt = ""
+        client = MagicMock()
+        client.chat.side_effect = self.fake_chat
+        self.engine = WorkflowEngine()
+        router = OllamaRouter([OllamaHost("http://ollama-test:11434", client=client)])
+        for agent in (self.engine.reasoning_agent, self.engine.delegation_agent, self.engine.xml_agent,
+                      self.engine.qa_agent, self.engine.task_worker):
+            agent.router = router
+    
+    def test_tasks_run_in_dependency_waves(self):
+        """Test that independent tasks run concurrently and dependent ones see their inputs."""
+        with patch.object(WorkflowEngine, "_save_checkpoint"):
+            started = time.perf_counter()
+            result = self.engine.run("Build a service", use_cache=False)
+            elapsed = time.perf_counter() - started
+        
+        self.assertEqual(sorted(result["task_results"]), ["1", "2", "3", "4"])
+        self.assertTrue(all(task["valid"] for task in result["task_results"].values()))
+        # Two waves ([1, 3, 4] then [2]) rather than four sequential tasks
+        self.assertLess(elapsed, 4 * self.TASK_DELAY)
+        self.assertIn("done 1", self.worker_prompts["2"])
+        self.assertNotIn("done 1", self.worker_prompts["3"])
+        self.assertIn('<task_result id="4" status="completed"', self.qa_prompt)
+        self.assertEqual(len([log for log in result["verbose_logs"] if log["agent"] == "Task Worker"]), 4)
+    
+    def test_reports_node_progress_as_it_happens(self):
+        """Test that every node run reports its start, then its end with duration and output size."""
+        steps = []
+        with patch.object(WorkflowEngine, "_save_checkpoint"), \
+             patch('src.workflow.progress.log_workflow_step', side_effect=lambda *args: steps.append(args)):
+            self.engine.run("Build a service", use_cache=False)
+        
+        names = [(step, status) for step, status, _, _ in steps]
+        self.assertEqual(names[:2], [("Prompt Analysis", "active"), ("Prompt Analysis", "completed")])
+        self.assertIn(("Task Execution 2", "completed"), names)
+        self.assertLess(names.index(("Task Execution 1", "completed")), names.index(("Task Execution 2", "active")))
+        self.assertEqual(names[-1], ("Quality Assurance", "completed"))
+        details = steps[1][3]
+        self.assertGreater(details["output_size"], 0)
+        self.assertGreaterEqual(details["duration"], 0)
+    
+    def test_joined_run_gets_leader_events_and_review(self):
+        """Test that a run sharing an identical run in flight streams its events and gets its review."""
+        self.QA_SCORE = 60
+        results = {}
+        
+        def run_session(session_id):
+            # Publishes the session's own status and outcome like the API does
+            event_broker.open(session_id)
+            event_broker.publish(session_id, {"type": "status", "status": f"processing {session_id}"})
+            results[session_id] = self.engine.run("Build a service", session_id, False)
+            event_broker.publish(session_id, {"type": "final", "status": f"completed {session_id}", "final": True})
+            event_broker.close(session_id)
+        
+        self.addCleanup(lambda: [event_broker.discard(session_id) for session_id in ("leader", "follower")])
+        coalesced = workflow_singleflight.get_metrics()["coalesced"]
+        with patch.object(WorkflowEngine, "_save_checkpoint"):
+            leader = threading.Thread(target=run_session, args=("leader",))
+            leader.start()
+            while not self.worker_prompts:
+                time.sleep(0.01)
+            run_session("follower")
+            leader.join()
+        
+        self.assertEqual(workflow_singleflight.get_metrics()["coalesced"], coalesced + 1)
+        events = {session_id: [event for _, event in event_broker._channels[session_id].replay]
+                  for session_id in ("leader", "follower")}
+        self.assertEqual([event["type"] for event in events["follower"]], [event["type"] for event in events["leader"]])
+        self.assertIn("token", {event["type"] for event in events["follower"]})
+        for session_id, session_events in events.items():
+            outcomes = [event["status"] for event in session_events if event["type"] in ("status", "final")]
+            self.assertEqual(outcomes, [f"processing {session_id}", f"completed {session_id}"])
+            self.assertTrue(all(event["session_id"] == session_id for event in session_events if "session_id" in event))
+        self.assertTrue(results["follower"]["human_review_required"])
+        self.assertEqual(self.engine.human_review_interface.get_completed_review("follower")["feedback"],
+                         results["follower"]["human_feedback"])
+    
+    def test_long_dependency_chain_fits_recursion_limit(self):
+        """Test that a plan chaining the maximum number of tasks runs one wave per task to the end."""
+        self.TASK_DELAY = 0
+        self.PLAN = "<delegation>" + "".join(
+            f'<task id="{i}" dependencies="{i - 1}"><title>Step {i}</title><description>Do</description></task>'
+            for i in range(1, 13)
+        ) + "</delegation>"
+        with patch.object(WorkflowEngine, "_save_checkpoint"), patch.object(settings, "TASK_FANOUT_MAX_TASKS", 12):
+            result = self.engine.run("Build a service", use_cache=False)
+        
+        self.assertEqual(len(result["task_results"]), 12)
+        self.assertIn("done 11", self.worker_prompts["12"])
+
+
+class TestResume(unittest.TestCase):
+    """Test cases for resuming interrupted runs from the durable graph checkpoints."""
+    
+    PLAN = TestTaskFanOut.PLAN
+    TASK_DELAY = 0
+    QA_SCORE = TestTaskFanOut.QA_SCORE
+    
+    def fake_chat(self, model, messages, stream=False, **kwargs):
+        """Answer like TestTaskFanOut, counting calls per agent and failing QA while qa_fails is set."""
+        agent = messages[0]["content"].split(".", 1)[0]
+        self.calls[agent] = self.calls.get(agent, 0) + 1
+        if "Quality Assurance" in agent and self.qa_fails:
+            raise RuntimeError("model host went away")
+        return TestTaskFanOut.fake_chat(self, model, messages, stream, **kwargs)
+    
+    def engine(self):
+        """Engine using the test database, as after a process restart."""
+        client = MagicMock()
+        client.chat.side_effect = self.fake_chat
+        with patch.object(settings, "GRAPH_CHECKPOINT_PATH", self.db_path):
+            engine = WorkflowEngine()
+        router = OllamaRouter([OllamaHost("http://ollama-test:11434", client=client)])
+        for agent in (engine.reasoning_agent, engine.delegation_agent, engine.xml_agent,
+                      engine.qa_agent, engine.task_worker):
+            agent.router = router
+        return engine
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "graph.sqlite")
+        self.calls = {}
+        self.worker_prompts = {}
+        self.qa_prompt = ""
+        self.qa_fails = True
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def test_resume_skips_completed_nodes(self):
+        """Test that a run failing at QA resumes there after a restart without rerunning earlier agents."""
+        with patch.object(WorkflowEngine, "_save_checkpoint"):
+            with self.assertRaises(RuntimeError):
+                self.engine().run("Build a service", session_id="crashed", use_cache=False)
+            before_resume = dict(self.calls)
+            self.qa_fails = False
+            engine = self.engine()
+            result = engine.resume("crashed", use_cache=False)
+        
+        self.assertIn("<score>95</score>", result["final_qa_report"])
+        self.assertEqual(sorted(result["task_results"]), ["1", "2", "3", "4"])
+        rerun = {agent: count - before_resume.get(agent, 0) for agent, count in self.calls.items()}
+        self.assertEqual({agent: count for agent, count in rerun.items() if count}, {"You are a Quality Assurance Specialist": 1})
+        # Resuming a finished run returns its final state without calling any agent
+        self.assertEqual(engine.resume("crashed")["final_qa_report"], result["final_qa_report"])
+        self.assertEqual(sum(self.calls.values()), sum(before_resume.values()) + 1)
+        with self.assertRaises(ValueError):
+            engine.resume("unknown")
+    
+    def test_keeps_newest_checkpoints_per_thread(self):
+        """Test that only the newest checkpoints of a session are kept on disk."""
+        self.qa_fails = False
+        with patch.object(WorkflowEngine, "_save_checkpoint"), \
+             patch.object(settings, "GRAPH_CHECKPOINT_KEEP_PER_THREAD", 2):
+            engine = self.engine()
+            engine.run("Build a service", session_id="kept", use_cache=False)
+        
+        self.assertIsInstance(engine.checkpointer, SQLiteCheckpointSaver)
+        history = list(engine.checkpointer.list({"configurable": {"thread_id": "kept"}}))
+        self.assertEqual(len(history), 2)
+        self.assertGreater(history[0].metadata["step"], history[1].metadata["step"])
+        self.assertEqual(engine.checkpointer.get_stats()["threads"], 1)
+        # Values shared with pruned checkpoints, including delta bases, are still readable
+        values = engine.app.get_state({"configurable": {"thread_id": "kept"}}).values
+        self.assertEqual(len(values["verbose_logs"]), 8)
+        self.assertEqual(sorted(values["task_results"]), ["1", "2", "3", "4"])
+    
+    def test_stores_deltas_and_rebuilds_every_checkpoint(self):
+        """Test that appended logs and added keys are stored as deltas and every step reads back intact."""
+        self.qa_fails = False
+        with patch.object(settings, "GRAPH_CHECKPOINT_KEEP_PER_THREAD", 0):
+            engine = self.engine()
+        config = engine._run_config("deltas", False)
+        streamed = [chunk for chunk in engine.app.stream(engine._initial_state("Build a service"), config, stream_mode="values")]
+        
+        # The values stream skips steps that changed nothing, like the dispatch join
+        history = [snapshot.values for snapshot in engine.app.get_state_history(config)][::-1]
+        changed = [values for i, values in enumerate(history) if i == 0 or values != history[i - 1]]
+        self.assertEqual(changed[1:], streamed)
+        stats = engine.checkpointer.get_stats()
+        self.assertGreater(stats["delta_values"], 0)
+        
+        with patch.object(settings, "GRAPH_CHECKPOINT_MAX_DELTA_CHAIN", 0), \
+             patch.object(settings, "GRAPH_CHECKPOINT_KEEP_PER_THREAD", 0):
+            full = self.engine()
+        list(full.app.stream(full._initial_state("Build a service"), full._run_config("full", False)))
+        self.assertLess(stats["value_bytes"], full.checkpointer.get_stats()["value_bytes"])
+
+
+class TestCheckpointStorage(unittest.TestCase):
+    """Test cases for the indexed checkpoint store."""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.storage = CheckpointStorage(self.tmp_dir.name)
+    
+    def tearDown(self):
+        self.storage._conn.close()
+        self.tmp_dir.cleanup()
+    
+    def test_round_trips_typed_state(self):
+        """Test that messages come back as message objects rather than their repr."""
+        from langchain_core.messages import HumanMessage
+        state = {"messages": [HumanMessage(content="hello")], "problem_analysis": "<reasoning/>" * 500}
+        self.storage.save_checkpoint("s1", {"state": state, "timestamp": 10.0, "status": "completed"})
+        
+        loaded = self.storage.load_checkpoint("s1")
+        self.assertIsInstance(loaded["state"]["messages"][0], HumanMessage)
+        self.assertEqual(loaded["state"]["problem_analysis"], state["problem_analysis"])
+        self.assertLess(self.storage.list_checkpoint_entries()[0]["size"], 1000)
+        self.assertTrue(self.storage.delete_checkpoint("s1"))
+        self.assertIsNone(self.storage.load_checkpoint("s1"))
+        self.assertFalse(self.storage.delete_checkpoint("s1"))
+    
+    def test_lists_by_status_and_time_range_in_pages(self):
+        """Test status and range filters and keyset pagination."""
+        self.storage.save_checkpoints([
+            (f"s{i:02d}", {"state": {}, "timestamp": float(i // 2), "status": "completed" if i % 3 else "failed"})
+            for i in range(20)
+        ])
+        self.assertEqual(self.storage.list_checkpoints(status="failed"), ["s00", "s03", "s06", "s09", "s12", "s15", "s18"])
+        self.assertEqual(self.storage.list_checkpoints(start=2.0, end=4.0), ["s04", "s05", "s06", "s07"])
+        
+        pages, after = [], None
+        while True:
+            page = self.storage.list_checkpoints(after=after, limit=6)
+            if not page:
+                break
+            pages.append(page)
+            after = page[-1]
+        self.assertEqual([len(page) for page in pages], [6, 6, 6, 2])
+        self.assertEqual(sum(pages, []), [f"s{i:02d}" for i in range(20)])
+        self.assertEqual(self.storage.count_checkpoints("failed"), 7)
+        self.assertEqual([session_id for session_id, _ in self.storage.iter_checkpoints(page_size=3)][-1], "s19")
+    
+    def test_imports_legacy_json_files(self):
+        """Test that JSON checkpoint files are imported once and never overwrite newer entries."""
+        with open(os.path.join(self.tmp_dir.name, "legacy.json"), "w") as f:
+            json.dump({"state": {"final_qa_report": "old"}, "timestamp": 1.0, "status": "completed"}, f)
+        self.assertEqual(self.storage.import_legacy_files(), 1)
+        self.assertEqual(self.storage.load_checkpoint("legacy")["state"]["final_qa_report"], "old")
+        
+        # A deleted session does not come back on the next startup
+        self.storage.delete_checkpoint("legacy")
+        self.storage._conn.close()
+        self.storage = CheckpointStorage(self.tmp_dir.name)
+        self.assertIsNone(self.storage.load_checkpoint("legacy"))
+        
+        with open(os.path.join(self.tmp_dir.name, "newer.json"), "w") as f:
+            json.dump({"state": {"final_qa_report": "old"}, "timestamp": 1.0, "status": "completed"}, f)
+        self.storage.save_checkpoint("newer", {"state": {"final_qa_report": "new"}, "timestamp": 2.0, "status": "completed"})
+        self.assertEqual(self.storage.import_legacy_files(), 0)
+        self.assertEqual(self.storage.load_checkpoint("newer")["state"]["final_qa_report"], "new")
+
+
+class TestCheckpointWriter(unittest.TestCase):
+    """Test cases for write-behind checkpoint persistence."""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.storage = CheckpointStorage(self.tmp_dir.name)
+        self.batches = []
+        self.gate = threading.Event()
+        save_checkpoints = self.storage.save_checkpoints
+        
+        def record_batch(checkpoints):
+            self.gate.wait(5)
+            self.batches.append([session_id for session_id, _ in checkpoints])
+            save_checkpoints(checkpoints)
+        
+        self.storage.save_checkpoints = record_batch
+        self.writer = CheckpointWriter(self.storage, max_queue_size=3, batch_size=10, flush_interval=0)
+    
+    def tearDown(self):
+        self.gate.set()
+        self.writer.stop(timeout=5)
+        self.storage._conn.close()
+        self.tmp_dir.cleanup()
+    
+    def test_coalesces_snapshots_and_drops_when_full(self):
+        """Test that queued snapshots of a session collapse and new sessions beyond the bound are dropped."""
+        # Hold the writer inside its first batch so the rest queue up behind it
+        self.writer.save("first", {"status": "started", "timestamp": 1.0})
+        while self.writer.get_metrics()["pending"]:
+            time.sleep(0.01)
+        for status in ("started", "running", "completed"):
+            self.assertTrue(self.writer.save("a", {"status": status, "timestamp": 2.0}))
+        self.assertTrue(self.writer.save("b", {"status": "started", "timestamp": 3.0}))
+        self.assertTrue(self.writer.save("c", {"status": "started", "timestamp": 4.0}))
+        self.assertFalse(self.writer.save("d", {"status": "started", "timestamp": 5.0}))
+        self.assertEqual(self.writer.load_checkpoint("a")["status"], "completed")
+        
+        metrics = self.writer.get_metrics()
+        self.assertEqual((metrics["pending"], metrics["coalesced"], metrics["dropped"]), (3, 2, 1))
+        self.assertGreaterEqual(metrics["lag"], 0)
+        
+        self.gate.set()
+        self.assertTrue(self.writer.flush(timeout=5))
+        self.assertEqual(self.batches, [["first"], ["a", "b", "c"]])
+        self.assertEqual(self.storage.load_checkpoint("a")["status"], "completed")
+        self.assertIsNone(self.storage.load_checkpoint("d"))
+        self.assertEqual(self.writer.get_metrics()["written"], 4)
+    
+    def test_stop_writes_everything_queued(self):
+        """Test that a graceful stop flushes the queue before returning."""
+        self.writer.save("x", {"status": "completed", "timestamp": 1.0})
+        self.gate.set()
+        self.writer.stop(timeout=5)
+        self.assertEqual(self.storage.list_checkpoints(), ["x"])
+        self.assertEqual(self.writer.get_metrics()["pending"], 0)
+
+
+class TestRetentionService(unittest.TestCase):
+    """Test cases for checkpoint and log garbage collection."""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.storage = CheckpointStorage(os.path.join(self.tmp_dir.name, "checkpoints"))
+        self.log_dir = os.path.join(self.tmp_dir.name, "logs")
+        os.makedirs(self.log_dir)
+        self.checkpointer = MagicMock(spec=["delete_thread"])
+        self.service = RetentionService(self.storage, self.checkpointer, [self.log_dir])
+        self.now = time.time()
+    
+    def tearDown(self):
+        self.storage._conn.close()
+        self.tmp_dir.cleanup()
+    
+    def write_log(self, days_ago, entries):
+        day = time.strftime("%Y-%m-%d", time.localtime(self.now - days_ago * 86400))
+        path = os.path.join(self.log_dir, f"audit_{day}.json")
+        with open(path, "w") as f:
+            json.dump(entries, f)
+        return path
+    
+    def collect(self, **overrides):
+        options = {
+            "RETENTION_MAX_AGE_DAYS": 0,
+            "RETENTION_MAX_BYTES": 0,
+            "RETENTION_KEEP_LAST_PER_STATUS": {},
+            "RETENTION_BATCH_SIZE": 2,
+            "RETENTION_COMPACT_LOGS": False
+        }
+        options.update(overrides)
+        patches = [patch.object(settings, name, value) for name, value in options.items()]
+        for p in patches:
+            p.start()
+        try:
+            return self.service.collect()
+        finally:
+            for p in patches:
+                p.stop()
+    
+    def test_expires_by_age_and_keeps_last_per_status(self):
+        """Test that old checkpoints and logs expire and only the newest N of a status are kept."""
+        self.storage.save_checkpoints(
+            [(f"old{i}", {"status": "completed", "timestamp": self.now - 40 * 86400 + i}) for i in range(3)] +
+            [(f"failed{i}", {"status": "failed", "timestamp": self.now - 100 + i}) for i in range(5)] +
+            [("done", {"status": "completed", "timestamp": self.now})]
+        )
+        old_log = self.write_log(40, [{"event": "old"}])
+        recent_log = self.write_log(1, [{"event": "recent"}])
+        
+        report = self.collect(RETENTION_MAX_AGE_DAYS=30, RETENTION_KEEP_LAST_PER_STATUS={"failed": 2})
+        self.assertEqual(self.storage.list_checkpoints(), ["failed3", "failed4", "done"])
+        self.assertEqual((report["checkpoints_deleted"], report["graph_threads_deleted"]), (6, 6))
+        self.assertGreater(report["checkpoint_bytes"], 0)
+        self.assertEqual(self.checkpointer.delete_thread.call_count, 6)
+        self.assertFalse(os.path.exists(old_log))
+        self.assertTrue(os.path.exists(recent_log))
+        self.assertEqual(report["log_files_deleted"], 1)
+        self.assertEqual(self.service.get_metrics()["totals"]["checkpoints_deleted"], 6)
+    
+    def test_byte_budget_deletes_oldest_finished_runs(self):
+        """Test that the size budget removes the oldest finished checkpoints and logs but not active runs."""
+        payload = "x" * 2000
+        self.storage.save_checkpoints([
+            ("running", {"status": "started", "timestamp": self.now - 500, "state": {"data": os.urandom(1000).hex()}}),
+            *[(f"run{i}", {"status": "completed", "timestamp": self.now - 400 + i, "state": {"data": os.urandom(1000).hex()}})
+              for i in range(4)]
+        ])
+        old_log = self.write_log(3, [{"event": payload}])
+        today_log = self.write_log(0, [{"event": payload}])
+        sizes = {entry["session_id"]: entry["size"] for entry in self.storage.list_checkpoint_entries()}
+        budget = self.storage.get_stats()["bytes"] - sizes["run0"] - sizes["run1"] + os.path.getsize(today_log)
+        
+        report = self.collect(RETENTION_MAX_BYTES=budget)
+        self.assertFalse(os.path.exists(old_log))
+        self.assertTrue(os.path.exists(today_log))
+        remaining = self.storage.list_checkpoints()
+        self.assertIn("running", remaining)
+        self.assertEqual(remaining, ["running", "run2", "run3"])
+        self.assertEqual(report["checkpoints_deleted"], 2)
+        self.assertEqual(report["log_files_deleted"], 1)
+    
+    def test_byte_budget_covers_graph_state_and_legacy_files(self):
+        """Test that the budget counts the graph checkpointer and legacy files, pruning graph state before deleting runs."""
+        from langgraph.graph import StateGraph, END
+        
+        saver = SQLiteCheckpointSaver(os.path.join(self.tmp_dir.name, "graph.sqlite"), keep_per_thread=4)
+        graph = StateGraph(AgentState)
+        for node in ("first", "second", "third"):
+            graph.add_node(node, lambda _, node=node: {"verbose_logs": [{"agent": node, "message": "x" * 500}]})
+        graph.add_edge("first", "second")
+        graph.add_edge("second", "third")
+        graph.add_edge("third", END)
+        graph.set_entry_point("first")
+        app = graph.compile(checkpointer=saver)
+        for i, status in enumerate(("completed", "completed", "started")):
+            self.storage.save_checkpoint(f"s{i}", {"status": status, "timestamp": self.now - 300 + i})
+            app.invoke({"verbose_logs": []}, {"configurable": {"thread_id": f"s{i}"}})
+        for session_id in ("s0", "gone"):
+            with open(os.path.join(self.storage.storage_path, f"{session_id}.json"), "w") as f:
+                json.dump({"status": "completed", "timestamp": 1.0}, f)
+        self.service.checkpointer = saver
+        
+        def checkpoints(thread_id):
+            return len(list(saver.list({"configurable": {"thread_id": thread_id}})))
+        
+        stats = self.storage.get_stats()
+        total = stats["bytes"] + stats["legacy_bytes"] + saver.stored_bytes()
+        report = self.collect(RETENTION_MAX_BYTES=total - 1)
+        self.assertEqual([checkpoints(f"s{i}") for i in range(3)], [1, 4, 4])
+        self.assertGreater(report["graph_bytes"], 0)
+        self.assertEqual(report["checkpoints_deleted"], 0)
+        
+        report = self.collect(RETENTION_MAX_BYTES=1)
+        self.assertEqual(self.storage.list_checkpoints(), ["s2"])
+        self.assertEqual([checkpoints(f"s{i}") for i in range(3)], [0, 0, 4])
+        self.assertEqual(self.storage.legacy_files(), [])
+        self.assertEqual(report["legacy_files_deleted"], 1)
+        self.assertEqual(saver.stored_bytes(), saver.stored_bytes("s2"))
+        saver.close()
+    
+    def test_compacts_past_logs(self):
+        """Test that past-day logs are gzipped and still readable while today's stay as they are."""
+        entries = [{"event": "login", "user": f"user{i}"} for i in range(200)]
+        past_log = self.write_log(2, entries)
+        today_log = self.write_log(0, entries)
+        
+        report = self.collect(RETENTION_COMPACT_LOGS=True)
+        self.assertFalse(os.path.exists(past_log))
+        self.assertTrue(os.path.exists(past_log + ".gz"))
+        self.assertTrue(os.path.exists(today_log))
+        self.assertEqual(load_json_log(past_log), entries)
+        self.assertEqual(report["log_files_compacted"], 1)
+        self.assertGreater(report["log_bytes_compacted"], 0)
+
+
+class TestWorkflowExecutor(unittest.TestCase):
+    """Test cases for the WorkflowExecutor class."""
+    
+    def setUp(self):
+        """Set up a fake engine whose runs block until released."""
+        self.release = threading.Event()
+        self.engine = MagicMock()
+        self.engine.run.side_effect = lambda prompt: self.release.wait(5) and {"prompt": prompt}
+        self.executor = WorkflowExecutor(self.engine, mode="thread", max_workers=1, max_queue_size=1)
+    
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+    
+    def test_rejects_when_queue_is_full(self):
+        """Test that submissions beyond workers plus queue size are rejected."""
+        running = self.executor.submit("first")
+        queued = self.executor.submit("second")
+        
+        self.assertFalse(self.executor.has_capacity())
+        with self.assertRaises(WorkflowQueueFullError):
+            self.executor.submit("third")
+        
+        metrics = self.executor.get_metrics()
+        self.assertEqual(metrics["running"], 1)
+        self.assertEqual(metrics["queue_depth"], 1)
+        self.assertEqual(metrics["rejected"], 1)
+        
+        self.release.set()
+        self.assertEqual(running.result(5), {"prompt": "first"})
+        self.assertEqual(queued.result(5), {"prompt": "second"})
+        self.executor.shutdown()
+        self.assertEqual(self.executor.get_metrics()["completed"], 2)
+
+    
+    def test_process_mode_relays_events_and_reviews(self):
+        """Test that process runs are coalesced here and bring their events and reviews back."""
+        engine = WorkflowEngine()
+        executor = WorkflowExecutor(engine, mode="process", max_workers=2, max_queue_size=0)
+        # Worker processes replaced by threads sharing the relay queue
+        executor._processes, executor._events = ThreadPoolExecutor(max_workers=2), queue.Queue()
+        executor._relay_thread = threading.Thread(target=executor._relay_events, args=(executor._events,))
+        executor._relay_thread.start()
+        self.addCleanup(executor.shutdown)
+        
+        def run_in_worker(prompt, session_id, use_cache):
+            self.release.wait(5)
+            executor._events.put((session_id, {"type": "token", "session_id": session_id, "content": prompt}))
+            executor._events.put((session_id, None))
+            review = {"state": {}, "status": "completed", "feedback": "approved"}
+            return {"prompt": prompt, "human_review_required": True}, review
+        
+        for session_id in ("p1", "p2"):
+            event_broker.open(session_id)
+            self.addCleanup(event_broker.discard, session_id)
+        coalesced = workflow_singleflight.get_metrics()["coalesced"]
+        with patch.object(workflow.executor, "_run_in_worker_process", run_in_worker), \
+             patch.object(WorkflowEngine, "_save_checkpoint"):
+            leader = executor.submit("plan", session_id="p1")
+            while workflow_singleflight.get_metrics()["in_flight"] < 1:
+                time.sleep(0.01)
+            follower = executor.submit("plan", session_id="p2")
+            while workflow_singleflight.get_metrics()["coalesced"] == coalesced:
+                time.sleep(0.01)
+            self.release.set()
+            self.assertEqual((leader.result(5), follower.result(5)), ({"prompt": "plan", "human_review_required": True},) * 2)
+        
+        for session_id in ("p1", "p2"):
+            events = [event for _, event in event_broker._channels[session_id].replay]
+            self.assertEqual([(event["session_id"], event["content"]) for event in events], [(session_id, "plan")])
+            self.assertEqual(engine.human_review_interface.get_completed_review(session_id)["feedback"], "approved")
+    
+    def test_async_mode_awaits_arun(self):
+        """Test that the async executor awaits the engine's async run."""
+        async def arun(prompt):
+            await asyncio.sleep(0)
+            return {"prompt": prompt}
+        
+        self.engine.arun = arun
+        executor = WorkflowExecutor(self.engine, mode="async", max_workers=2, max_queue_size=0)
+        
+        async def run_all():
+            return await asyncio.gather(executor.run("a"), executor.run("b"))
+        
+        results = asyncio.run(run_all())
+        self.assertEqual(results, [{"prompt": "a"}, {"prompt": "b"}])
+        self.assertEqual(executor.get_metrics()["completed"], 2)
+        self.engine.run.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file